@@ -0,0 +1,10 @@
+"""Headless batch runner (no PyQt) - see services/batch_runner.py.
+
+    python batch_runner.py project.json [more.json ...] [--tokens T1,T2] [--parallel 3]
+"""
+import sys
+
+from services.batch_runner import main
+
+if __name__ == "__main__":
+    sys.exit(main())
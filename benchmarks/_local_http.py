@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""Tiny keep-alive HTTP server helpers shared by the benchmarks (stdlib only)."""
+import json
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class JsonHandler(BaseHTTPRequestHandler):
+    """HTTP/1.1 handler: every POST is answered with ``{"operations": []}``."""
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+    def log_message(self, *args):  # keep benchmark output clean
+        pass
+
+    def _send_json(self, code: int, obj, headers=None):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        n = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(n) if n else b""
+        try:
+            return json.loads(raw or b"{}")
+        except Exception:
+            return {}
+
+    def do_POST(self):
+        self._read_json()
+        self._send_json(200, {"operations": []})
+
+
+@contextmanager
+def serve(handler_cls=JsonHandler, host: str = "127.0.0.1"):
+    """Run ``handler_cls`` on an ephemeral port; yields the base URL."""
+    srv = ThreadingHTTPServer((host, 0), handler_cls)
+    srv.daemon_threads = True
+    th = threading.Thread(target=srv.serve_forever, daemon=True)
+    th.start()
+    try:
+        yield f"http://{host}:{srv.server_address[1]}"
+    finally:
+        srv.shutdown()
+        srv.server_close()
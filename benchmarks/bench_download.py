@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Video download time: the old single-stream loop (one connection, 8 KB chunks, restart from
+zero on a dropped connection) vs services.ranged_download.fetch (parallel byte ranges,
+1 MB reads, resume from the last good offset).
+
+The local server caps every connection at ``--per-conn-mbps`` (storage CDNs throttle per
+flow, which is what parallel ranges get around) and, with ``--drop-every``, cuts each
+connection after that many MB to show what resuming saves.
+
+Run from the repo root:
+    python -m benchmarks.bench_download [--size-mb 32] [--per-conn-mbps 40] [--drop-every 0]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks._local_http import JsonHandler, serve
+from services import http_pool, ranged_download
+
+
+def _handler(payload: bytes, per_conn_bps: float, drop_every: int, sent: list):
+    class Handler(JsonHandler):
+        def do_GET(self):
+            size = len(payload)
+            start, end = 0, size - 1
+            rng = self.headers.get("Range")
+            if rng and rng.startswith("bytes="):
+                a, _, b = rng[6:].partition("-")
+                start, end = int(a or 0), min(size - 1, int(b) if b else size - 1)
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            else:
+                self.send_response(200)
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Content-Type", "video/mp4")
+            self.send_header("ETag", '"bench"')
+            self.send_header("Content-Length", str(end - start + 1))
+            self.end_headers()
+            pos, t0, n = start, time.perf_counter(), 0
+            while pos <= end:
+                if drop_every and n >= drop_every:
+                    self.close_connection = True
+                    return  # connection cut mid-body
+                chunk = payload[pos:min(end + 1, pos + 65536)]
+                self.wfile.write(chunk)
+                pos += len(chunk)
+                n += len(chunk)
+                sent[0] += len(chunk)
+                ahead = n / per_conn_bps - (time.perf_counter() - t0)
+                if ahead > 0:
+                    time.sleep(ahead)
+    return Handler
+
+
+def _legacy(url: str, dest: str, retries: int = 20) -> None:
+    """VideoDownloader.download before ranged_download (plus a plain restart-on-error loop)."""
+    for _ in range(retries):
+        try:
+            with http_pool.session('media').get(url, stream=True, timeout=300,
+                                                allow_redirects=True) as r:
+                r.raise_for_status()
+                total = int(r.headers.get('content-length', 0))
+                got = 0
+                with open(dest, 'wb') as f:
+                    for chunk in r.iter_content(8192):
+                        if chunk:
+                            f.write(chunk)
+                            got += len(chunk)
+            if got == total:
+                return
+        except Exception:
+            pass
+        if os.path.exists(dest):
+            os.remove(dest)
+    raise IOError("legacy download gave up")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--size-mb", type=float, default=32)
+    ap.add_argument("--per-conn-mbps", type=float, default=40, help="MB/s per connection")
+    ap.add_argument("--drop-every", type=float, default=0,
+                    help="cut connections after N MB (0 = never)")
+    ap.add_argument("--parts", type=int, default=4)
+    args = ap.parse_args()
+
+    payload = os.urandom(int(args.size_mb * 1e6))
+    sent = [0]
+    tmp = tempfile.mkdtemp(prefix="dl_bench_")
+    handler = _handler(payload, args.per_conn_mbps * 1e6, int(args.drop_every * 1e6), sent)
+    try:
+        with serve(handler) as base:
+            url = base + "/media/video/bench.mp4"
+            drop = f", connections cut every {args.drop_every:g} MB" if args.drop_every else ""
+            print(f"{args.size_mb:g} MB, {args.per_conn_mbps:g} MB/s per connection{drop}")
+            print(f"{'method':<22}{'seconds':>9}{'MB/s':>8}{'MB sent':>10}")
+            for name, fn in (("single stream 8 KB", lambda d: _legacy(url, d)),
+                             (f"ranged x{args.parts}, 1 MB", lambda d: ranged_download.fetch(
+                                 url, d, parts=args.parts, min_part_mb=1, retries=50))):
+                dest = os.path.join(tmp, name.replace(" ", "_") + ".mp4")
+                sent[0] = 0
+                t0 = time.perf_counter()
+                try:
+                    fn(dest)
+                except IOError:
+                    print(f"{name:<22}{'gave up':>9}{'-':>8}{sent[0] / 1e6:>10.1f}")
+                    continue
+                dt = time.perf_counter() - t0
+                with open(dest, "rb") as f:
+                    assert f.read() == payload, name
+                print(f"{name:<22}{dt:>9.2f}{len(payload) / 1e6 / dt:>8.1f}{sent[0] / 1e6:>10.1f}")
+    finally:
+        http_pool.close_all()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Peak memory of one video download vs file size: the old ``requests.get(url).content`` write
+(DownloadWorker fallback, sales_pipeline) against services.ranged_download.fetch_file, both as
+a single stream through services.stream_writer and as parallel byte ranges.
+
+Every download runs in a fresh child process; the table shows how far its peak RSS rose
+above the RSS it had before the download started. The streaming paths should stay flat
+(a buffer per connection) while ``.content`` grows with the file.
+
+Run from the repo root:
+    python -m benchmarks.bench_download_memory [--sizes 16,64,256]
+"""
+import argparse
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from benchmarks._local_http import JsonHandler, serve
+
+_BLOCK = bytes(range(256)) * 4096  # 1 MiB pattern, so the server holds no big payload
+
+
+class _Handler(JsonHandler):
+    """GET /<bytes>[/ranges] streams a file of that size; Range is honoured only with /ranges."""
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        size = int(parts[0])
+        start, end = 0, size - 1
+        rng = self.headers.get("Range")
+        if len(parts) > 1 and rng and rng.startswith("bytes="):
+            a, _, b = rng[6:].partition("-")
+            start, end = int(a or 0), min(size - 1, int(b) if b else size - 1)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        pos = start
+        try:
+            while pos <= end:
+                off = pos % len(_BLOCK)
+                n = min(end + 1 - pos, len(_BLOCK) - off)
+                self.wfile.write(_BLOCK[off:off + n])
+                pos += n
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # the one-byte probe hangs up after the headers
+
+
+def _peak_kb() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KiB on Linux
+
+
+def _child(method: str, url: str, dest: str):
+    import requests
+
+    from services import ranged_download
+    before = _peak_kb()
+    if method == "content":
+        r = requests.get(url, timeout=600)
+        r.raise_for_status()
+        with open(dest, "wb") as f:
+            f.write(r.content)
+    else:
+        ranged_download.fetch_file(url, dest)
+    print(_peak_kb() - before)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default="16,64,256", help="file sizes in MB")
+    ap.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.child:
+        _child(*args.child)
+        return
+
+    tmp = tempfile.mkdtemp(prefix="dl_mem_")
+    env = dict(os.environ, HOME=tmp)  # default knobs, no user config
+    methods = [("requests .content", "content", ""),
+               ("stream_writer", "fetch", ""),
+               ("ranged x4", "fetch", "/ranges")]
+    try:
+        with serve(_Handler) as base:
+            print(f"{'MB':>6}" + "".join(f"{name + ' MB':>22}" for name, _, _ in methods))
+            for mb in [int(x) for x in args.sizes.split(",") if x.strip()]:
+                row = f"{mb:>6}"
+                for _, method, suffix in methods:
+                    dest = os.path.join(tmp, f"{method}_{mb}.mp4")
+                    url = f"{base}/{mb * 1000000}{suffix}"
+                    out = subprocess.run([sys.executable, "-m", "benchmarks.bench_download_memory",
+                                          "--child", method, url, dest],
+                                         env=env, capture_output=True, text=True, check=True)
+                    if os.path.getsize(dest) != mb * 1000000:
+                        raise SystemExit(f"{method}: wrong size for {mb} MB")
+                    os.remove(dest)
+                    row += f"{int(out.stdout.strip()) / 1024:>22.1f}"
+                print(row, flush=True)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Calls-per-second of Labs-style JSON POSTs: bare ``requests.post`` (new connection per call,
+the old LabsFlowClient._post behaviour) vs the shared keep-alive pool in services.http_pool.
+
+Run from the repo root:
+    python -m benchmarks.bench_http_pool [--calls 400] [--threads 1,8]
+
+Against a local mock endpoint only TCP setup is saved; against aisandbox-pa.googleapis.com
+every bare call also pays a TLS handshake, so the real-world gap is larger.
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks._local_http import serve
+from services import http_pool
+from services.google.labs_flow_client import LabsFlowClient
+
+PAYLOAD = {"operations": [{"operation": {"name": f"op-{i}"}} for i in range(20)]}
+
+
+def _bare(url):
+    requests.post(url, json=PAYLOAD, timeout=(5, 30)).raise_for_status()
+
+
+def _pooled(url):
+    http_pool.session('labs').post(url, json=PAYLOAD, timeout=(5, 30)).raise_for_status()
+
+
+def _run(fn, url, calls, threads):
+    t0 = time.perf_counter()
+    if threads <= 1:
+        for _ in range(calls):
+            fn(url)
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as ex:
+            list(ex.map(lambda _: fn(url), range(calls)))
+    return calls / (time.perf_counter() - t0)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--calls", type=int, default=400)
+    ap.add_argument("--threads", default="1,8")
+    args = ap.parse_args()
+
+    with serve() as base:
+        url = f"{base}/v1/video:batchCheckAsyncVideoGenerationStatus"
+        client = LabsFlowClient(["bench-token"])
+        cases = [("bare requests.post", _bare),
+                 ("http_pool session", _pooled),
+                 ("LabsFlowClient._post", lambda u: client._post(u, PAYLOAD))]
+        print(f"{'case':<24}{'threads':>8}{'calls/s':>12}")
+        for threads in [int(x) for x in args.threads.split(",") if x.strip()]:
+            for name, fn in cases:
+                _run(fn, url, min(20, args.calls), threads)  # warm-up
+                cps = _run(fn, url, args.calls, threads)
+                print(f"{name:<24}{threads:>8}{cps:>12.1f}")
+    http_pool.close_all()
+
+
+if __name__ == "__main__":
+    main()
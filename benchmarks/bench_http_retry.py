@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+services.http_retry.request_json against a failing upstream, old retry loop vs current:
+
+- down: every request gets 503 - the old loop retried each call ``max_attempts`` times with
+  jittered sleeps; the per-host circuit breaker opens after a few failures and the remaining
+  calls fail at once;
+- throttled: 429 with ``Retry-After: 1`` until one second has passed - the old loop retried
+  blind (early retries hit 429 again, and it could give up); now the server's delay is slept.
+
+Columns: requests that reached the server, calls that succeeded, wall time, and seconds
+worker threads spent inside request_json in total.
+
+Run from the repo root:
+    python -m benchmarks.bench_http_retry [--threads 16] [--calls 2]
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+import requests
+
+from benchmarks._local_http import JsonHandler, serve
+
+
+def _handler(mode: str, hits: list, lock: threading.Lock):
+    t0 = []
+
+    class Handler(JsonHandler):
+        def do_GET(self):
+            with lock:
+                hits[0] += 1
+                if not t0:
+                    t0.append(time.monotonic())
+                ready = time.monotonic() - t0[0] >= 1.0
+            time.sleep(0.02)
+            if mode == "down":
+                self._send_json(503, {"error": "unavailable"})
+            elif not ready:
+                self._send_json(429, {"error": "slow down"}, headers={"Retry-After": "1"})
+            else:
+                self._send_json(200, {"ok": True})
+    return Handler
+
+
+def _legacy(method, url, max_attempts=5):
+    # the request_json loop before Retry-After support and circuit breakers
+    sess = requests.Session()
+    for attempt in range(1, max_attempts + 1):
+        try:
+            r = sess.request(method, url, timeout=(15, 60))
+            if 200 <= r.status_code < 300:
+                return True
+            if r.status_code in (429, 500, 502, 503, 504):
+                time.sleep(random.random() * min(1.2 ** attempt, 30.0))
+                continue
+            return False
+        except requests.RequestException:
+            time.sleep(random.random() * min(1.2 ** attempt, 30.0))
+    return False
+
+
+def _run(threads: int, calls: int, fn):
+    ok, busy, lock = [0], [0.0], threading.Lock()
+
+    def worker():
+        for _ in range(calls):
+            t = time.perf_counter()
+            res = fn()
+            with lock:
+                ok[0] += bool(res)
+                busy[0] += time.perf_counter() - t
+    ths = [threading.Thread(target=worker) for _ in range(threads)]
+    t0 = time.perf_counter()
+    for th in ths:
+        th.start()
+    for th in ths:
+        th.join()
+    return ok[0], time.perf_counter() - t0, busy[0]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--threads", type=int, default=16)
+    ap.add_argument("--calls", type=int, default=2, help="calls per thread")
+    args = ap.parse_args()
+
+    home = tempfile.mkdtemp(prefix="http_retry_bench_")
+    os.environ["HOME"] = home  # default knobs
+    try:
+        from services.http_retry import breakers, request_json
+        print(f"{args.threads} threads x {args.calls} calls")
+        print(f"{'':<22}{'requests':>10}{'ok':>5}{'wall s':>9}{'thread s':>10}")
+        for mode in ("down", "throttled"):
+            for label in ("old loop", "request_json"):
+                hits, lock = [0], threading.Lock()
+                with serve(_handler(mode, hits, lock)) as base:  # fresh host -> fresh breaker
+                    url = f"{base}/{mode}"
+                    if label == "old loop":
+                        def fn():
+                            return _legacy("GET", url)
+                    else:
+                        def fn():
+                            return request_json("GET", url)[0]
+                    ok, wall, busy = _run(args.threads, args.calls, fn)
+                print(f"{mode + ', ' + label:<22}{hits[0]:>10}{ok:>5}{wall:>9.2f}{busy:>10.1f}")
+        print("breakers:", ", ".join(f"{b['state']} ({b['trips']} trips)" for b in breakers()))
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Upload payload size and latency with and without services.image_prep.
+
+Synthesises ``--images`` phone-sized photos (4000x3000, noisy so JPEG cannot cheat), then
+reports for the raw file vs. the normalised one: bytes on the wire (base64 JSON body), the
+POST time against a local endpoint, and the estimated upload time on a ``--mbps`` uplink.
+Also times ``prepare_batch`` cold (thread pool) and warm (cache hits). Runs with a scratch
+HOME whose config turns labs.image_prep (off by default) on, with cropping.
+
+Run from the repo root:
+    python -m benchmarks.bench_image_prep [--images 6] [--mbps 20]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from benchmarks._local_http import serve
+
+ASPECT = "IMAGE_ASPECT_RATIO_LANDSCAPE"
+
+
+def _make_photo(path, seed):
+    from PIL import Image
+    rnd = random.Random(seed)
+    small = Image.new("RGB", (400, 300))
+    small.putdata([(rnd.randrange(256), rnd.randrange(256), rnd.randrange(256))
+                   for _ in range(400 * 300)])
+    big = small.resize((4000, 3000), Image.BICUBIC)
+    noise = Image.effect_noise((4000, 3000), 40).convert("RGB")
+    Image.blend(big, noise, 0.25).save(path, "JPEG", quality=95)
+
+
+def _upload(url, path):
+    from services import http_pool
+    from services.google.labs_flow_client import _encode_image_file
+    b64, mime = _encode_image_file(path)
+    payload = {"imageInput": {"rawImageBytes": b64, "mimeType": mime, "isUserUploaded": True,
+                              "aspectRatio": ASPECT}}
+    t0 = time.perf_counter()
+    http_pool.session('labs').post(url, json=payload, timeout=(5, 120)).raise_for_status()
+    return len(b64), time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--images", type=int, default=6)
+    ap.add_argument("--mbps", type=float, default=20.0, help="uplink used for the estimate")
+    args = ap.parse_args()
+
+    work = tempfile.mkdtemp(prefix="bench_prep_")
+    os.environ["HOME"] = work
+    with open(os.path.join(work, ".veo_image2video_cfg.json"), "w", encoding="utf-8") as f:
+        json.dump({"labs": {"image_prep": {"enabled": True, "crop": True}}}, f)
+    from services import http_pool, image_prep
+    image_prep.CACHE_DIR = os.path.join(work, "cache")
+    try:
+        srcs = []
+        for i in range(args.images):
+            p = os.path.join(work, f"photo_{i}.jpg")
+            _make_photo(p, i)
+            srcs.append(p)
+
+        t0 = time.perf_counter()
+        prepped = image_prep.prepare_batch(srcs, ASPECT)
+        cold = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        image_prep.prepare_batch(srcs, ASPECT)
+        warm = time.perf_counter() - t0
+        print(f"prepare_batch: cold {cold:.2f}s ({args.images} images), warm {warm * 1000:.1f} ms")
+
+        with serve() as base:
+            url = f"{base}/v1:uploadUserImage"
+            rows = {"raw": [_upload(url, p) for p in srcs],
+                    "prepared": [_upload(url, prepped[p]["path"]) for p in srcs]}
+        est = f"est. s @{int(args.mbps)}Mbps"
+        print(f"{'case':<10}{'MB/body':>10}{'local ms':>10}{est:>18}")
+        for name, rs in rows.items():
+            mb = sum(b for b, _ in rs) / len(rs) / 1e6
+            ms = sum(t for _, t in rs) / len(rs) * 1000
+            print(f"{name:<10}{mb:>10.2f}{ms:>10.1f}{mb * 8 / args.mbps:>18.2f}")
+        raw_b = sum(b for b, _ in rows["raw"])
+        prep_b = sum(b for b, _ in rows["prepared"])
+        print(f"bytes saved: {(raw_b - prep_b) / 1e6:.1f} MB ({100 * (1 - prep_b / raw_b):.0f}%)")
+    finally:
+        http_pool.close_all()
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
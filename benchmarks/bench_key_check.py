@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Checking a settings page full of keys: one blocking check after another (the old
+"Kiểm tra tất cả") vs services.key_check_service.KeyChecker (per-provider concurrency cap,
+cached results). A local server stands in for the provider's key endpoint with ``--latency-ms``
+per request; the checks go through the same pooled session as ``check``.
+
+Rows: sequential; bulk check_many (cold cache); the settings page opened again within the
+TTL (answered from the cache, no requests); and a forced re-check.
+
+Run from the repo root:
+    python -m benchmarks.bench_key_check [--keys 40] [--latency-ms 400] [--concurrency 6]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from benchmarks._local_http import JsonHandler, serve
+
+
+def _handler(latency: float, hits: list, lock: threading.Lock):
+    class Handler(JsonHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            with lock:
+                hits[0] += 1
+            self._send_json(200 if "bad" not in self.path else 401, {"models": []})
+    return Handler
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--keys", type=int, default=40)
+    ap.add_argument("--latency-ms", type=float, default=400.0)
+    ap.add_argument("--concurrency", type=int, default=6)
+    args = ap.parse_args()
+
+    home = tempfile.mkdtemp(prefix="keycheck_bench_")
+    os.environ["HOME"] = home  # default knobs, empty result cache
+    hits, lock = [0], threading.Lock()
+    try:
+        from services import http_pool
+        from services.key_check_service import KeyChecker
+        with serve(_handler(args.latency_ms / 1000.0, hits, lock)) as base:
+            def check_fn(kind, key):
+                r = http_pool.session('keycheck').get(f"{base}/v1/models/{key}", timeout=(10, 20))
+                return r.status_code == 200, f"HTTP {r.status_code}"
+
+            keys = [f"AIza-bench-{'bad' if i % 7 == 0 else 'ok'}-{i:02d}" for i in range(args.keys)]
+            print(f"{args.keys} keys, {args.latency_ms:g} ms per check, "
+                  f"concurrency {args.concurrency}")
+            print(f"{'':<26}{'wall s':>8}{'requests':>10}{'valid':>7}")
+
+            def row(label, fn):
+                before = hits[0]
+                t0 = time.perf_counter()
+                res = fn()
+                wall = time.perf_counter() - t0
+                n_ok = sum(ok for ok, _ in res.values())
+                print(f"{label:<26}{wall:>8.2f}{hits[0] - before:>10}{n_ok:>7}")
+
+            row("sequential check()", lambda: {k: check_fn("google", k) for k in keys})
+            path = os.path.join(home, "checks.json")
+            checker = KeyChecker(path=path, concurrency=args.concurrency, check_fn=check_fn)
+            row("check_many, cold", lambda: checker.check_many("google", keys))
+            # a new session loads the saved results
+            reopened = KeyChecker(path=path, concurrency=args.concurrency, check_fn=check_fn)
+            row("reopened within TTL", lambda: reopened.check_many("google", keys))
+            row("check_many, forced", lambda: reopened.check_many("google", keys, force=True))
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
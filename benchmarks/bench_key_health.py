@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+What a restart costs when some Google keys already spent their daily quota: 429s re-learned
+and time lost before the first useful call, without and with services.key_health.
+
+A first "run" makes calls until every exhausted key has returned its per-day 429; then the app
+"restarts" (a fresh services.key_scheduler.KeyScheduler - without a store, or loading the
+store the first run wrote) and a batch of calls is made from parallel workers. Calls are
+simulated in-process (``--call-ms`` each, ``--rtt-ms`` extra for a 429 round trip).
+
+Run from the repo root:
+    python -m benchmarks.bench_key_health [--keys 6] [--exhausted 4] [--calls 24]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import requests
+
+_DAILY_429 = (b'{"error": {"code": 429, "status": "RESOURCE_EXHAUSTED", "details": [{"violations": '
+              b'[{"quotaId": "GenerateRequestsPerDayPerProjectPerModel-FreeTier"}]}]}}')
+
+
+def _api(exhausted, call_sec: float, rtt_sec: float, counts: Counter, lock: threading.Lock):
+    def call(key: str):
+        if key in exhausted:
+            time.sleep(rtt_sec)
+            with lock:
+                counts["429"] += 1
+            r = requests.Response()
+            r.status_code = 429
+            r._content = _DAILY_429
+            raise requests.HTTPError("429 Client Error: Too Many Requests", response=r)
+        time.sleep(call_sec)
+        with lock:
+            counts["ok"] += 1
+        return key
+    return call
+
+
+def _batch(keys, sched, api, threads: int, calls: int):
+    from services.core.api_key_rotator import APIKeyRotator
+    per = max(1, calls // threads)
+    ths = [threading.Thread(target=lambda: [APIKeyRotator(keys, scheduler=sched).execute(api)
+                                            for _ in range(per)]) for _ in range(threads)]
+    t0 = time.perf_counter()
+    for th in ths:
+        th.start()
+    for th in ths:
+        th.join()
+    return time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--keys", type=int, default=6)
+    ap.add_argument("--exhausted", type=int, default=4, help="keys whose daily quota is spent")
+    ap.add_argument("--calls", type=int, default=24)
+    ap.add_argument("--threads", type=int, default=4)
+    ap.add_argument("--call-ms", type=float, default=50.0)
+    ap.add_argument("--rtt-ms", type=float, default=150.0)
+    args = ap.parse_args()
+
+    home = tempfile.mkdtemp(prefix="keyhealth_bench_")
+    os.environ["HOME"] = home  # default knobs, no user config
+    try:
+        from services.key_health import KeyHealthStore
+        from services.key_scheduler import KeyScheduler
+        keys = [f"AIza-bench-key-{i:02d}" for i in range(args.keys)]
+        exhausted = set(keys[:args.exhausted])
+        path = os.path.join(home, "key_health.json")
+        cs, rtt = args.call_ms / 1000.0, args.rtt_ms / 1000.0
+
+        first = KeyScheduler("bench", rpm=1000, health=KeyHealthStore(path))
+        counts, lock = Counter(), threading.Lock()
+        _batch(keys, first, _api(exhausted, cs, rtt, counts, lock), 1, args.keys)
+        first.health.flush()
+        print(f"first run: {counts['429']} daily-quota 429s learned on {len(exhausted)} "
+              f"of {args.keys} keys")
+        print(f"after restart, {args.calls} calls on {args.threads} threads")
+        print(f"{'':<22}{'429s':>6}{'ok':>6}{'wall s':>9}")
+        for label, health in (("no key health", None), ("key health loaded", KeyHealthStore(path))):
+            sched = KeyScheduler("bench", rpm=1000, health=health)
+            counts = Counter()
+            api = _api(exhausted, cs, rtt, counts, lock)
+            wall = _batch(keys, sched, api, args.threads, args.calls)
+            print(f"{label:<22}{counts['429']:>6}{counts['ok']:>6}{wall:>9.2f}")
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
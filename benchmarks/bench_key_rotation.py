@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+How evenly services.core.key_manager spreads load across keys under parallel callers.
+
+- legacy: every call rebuilt the pools (``refresh()`` -> ``set_keys`` resets the cursor), as
+  before pools were refreshed only on config changes - nearly every call got the first key;
+- current: ``get_key`` from N threads against an unchanged config, then again while the
+  config file is rewritten mid-run with one more key (the cursor and counters must survive).
+
+For each run: calls per key, keys used, max/min calls over the original keys, and
+microseconds per call. The current runs are also checked - every call got a key, the spread
+over the original keys is within ``--tolerance``, the pool's per-key counters match the keys
+actually handed out and the added key was picked up - and the script exits 1 if any check
+fails.
+
+Run from the repo root:
+    python -m benchmarks.bench_key_rotation [--keys 5] [--threads 16] [--calls 2000]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+
+def _write_cfg(path: str, keys):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"google_api_keys": list(keys)}, f)
+    os.replace(tmp, path)
+
+
+def _run(threads: int, calls: int, fn, during=None):
+    counts = Counter()
+    lock = threading.Lock()
+    start = threading.Barrier(threads + 1)
+
+    def worker():
+        local = Counter()
+        start.wait()
+        for _ in range(calls):
+            local[fn()] += 1
+        with lock:
+            counts.update(local)
+    ths = [threading.Thread(target=worker) for _ in range(threads)]
+    for th in ths:
+        th.start()
+    start.wait()
+    t0 = time.perf_counter()
+    if during:
+        during()
+    for th in ths:
+        th.join()
+    return counts, (time.perf_counter() - t0) / (threads * calls) * 1e6
+
+
+def _report(label: str, counts: Counter, us: float, cols, even_over) -> float:
+    per = [counts.get(k, 0) for k in cols]
+    base = [counts.get(k, 0) for k in even_over]
+    ratio = max(base) / min(base) if min(base) else float("inf")
+    used = sum(1 for n in per if n)
+    print(f"{label:<24}" + "".join(f"{n:>8}" for n in per) + f"{used:>6}{ratio:>10.2f}{us:>9.2f}")
+    return ratio
+
+
+def _check(failures: list, label: str, counts: Counter, ratio: float, total: int,
+           tolerance: float, served: dict):
+    """Record what is wrong with a current run: missing keys, uneven spread, counters that
+    do not match the keys handed out (``served``: pool counter increase per key)."""
+    got = sum(counts.values()) - counts.get("", 0)
+    if got != total:
+        failures.append(f"{label}: {got} of {total} calls got a key")
+    if ratio > tolerance:
+        failures.append(f"{label}: max/min {ratio:.3f} over the original keys > {tolerance}")
+    lost = {k: (n, served.get(k, 0)) for k, n in counts.items() if k and served.get(k, 0) != n}
+    if lost:
+        failures.append(f"{label}: pool counters (handed out, counted) differ: {lost}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--keys", type=int, default=5)
+    ap.add_argument("--threads", type=int, default=16)
+    ap.add_argument("--calls", type=int, default=2000, help="calls per thread")
+    ap.add_argument("--tolerance", type=float, default=1.01,
+                    help="largest max/min over the original keys that passes")
+    args = ap.parse_args()
+    failures = []
+    total = args.threads * args.calls
+
+    home = tempfile.mkdtemp(prefix="keyrot_bench_")
+    os.environ["HOME"] = home  # CFG_PATH is resolved at import
+    try:
+        from services.core import config as core_cfg
+        from services.core import key_manager as km
+        keys = [f"AIza-bench-key-{i:02d}" for i in range(args.keys)]
+        grown = keys + [f"AIza-bench-key-{args.keys:02d}"]
+        _write_cfg(str(core_cfg.CFG_PATH), keys)
+
+        print(f"{args.threads} threads x {args.calls} calls, {args.keys} keys")
+        print(f"{'':<24}" + "".join(f"{'key' + str(i):>8}" for i in range(args.keys + 1))
+              + f"{'used':>6}{'max/min':>10}{'us/call':>9}")
+
+        def legacy():
+            km.refresh(force=True)
+            km._POOLS['google'].set_keys(km.get_all_keys('google'))  # what every old refresh did
+            return km._POOLS['google'].get_next()
+        counts, us = _run(args.threads, args.calls, legacy)
+        _report("legacy (reset per call)", counts, us, grown, keys)
+
+        def get_key():
+            return km.get_key('google')
+
+        km._POOLS['google'].set_keys([])
+        km.refresh(force=True)
+        counts, us = _run(args.threads, args.calls, get_key)
+        label = "change-aware"
+        ratio = _report(label, counts, us, grown, keys)
+        _check(failures, label, counts, ratio, total, args.tolerance, km.key_stats('google'))
+
+        def add_key():
+            time.sleep(0.01)
+            _write_cfg(str(core_cfg.CFG_PATH), grown)
+        before = km.key_stats('google')
+        counts, us = _run(args.threads, args.calls, get_key, during=add_key)
+        label = "config edited mid-run"
+        ratio = _report(label, counts, us, grown, keys)
+        after = km.key_stats('google')
+        served = {k: n - before.get(k, 0) for k, n in after.items()}
+        _check(failures, label, counts, ratio, total, args.tolerance, served)
+        if not counts.get(grown[-1]):
+            failures.append(f"{label}: the added key was never handed out")
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+    for f in failures:
+        print("FAIL", f)
+    if failures:
+        sys.exit(1)
+    print("OK: even spread, every call served, counters kept across the refresh")
+
+
+if __name__ == "__main__":
+    main()
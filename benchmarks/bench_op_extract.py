@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Per-poll cost of turning a batchCheckAsyncVideoGenerationStatus response into results:
+the old recursive ``_collect_urls_any`` pass (regex on every string, set + sort per op)
+vs. services.op_extract (known paths first, bounded scan only for finished operations).
+
+Responses are built from the recorded items in fixtures/batch_check_ops.json (one
+rendering, one finished, one failed operation), cloned to 1, 50 and 500 operations with a
+typical mid-render mix: 70% rendering, 25% finished, 5% failed.
+
+Run from the repo root:
+    python -m benchmarks.bench_op_extract [--sizes 1,50,500] [--repeat 200]
+"""
+import argparse
+import copy
+import json
+import os
+import time
+import timeit
+
+from services import op_extract
+from services.google.labs_flow_client import _collect_urls_any, _normalize_status
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "batch_check_ops.json")
+
+
+def _response(n, templates):
+    rendering, finished, failed = templates
+    ops = []
+    for i in range(n):
+        r = i % 20
+        src = finished if r < 5 else failed if r == 5 else rendering
+        item = copy.deepcopy(src)
+        item["operation"]["name"] = f"{src['operation']['name'][:24]}{i:08d}"
+        video = ((item["operation"].get("metadata") or {}).get("video") or {})
+        for k in ("fifeUrl", "servingBaseUri"):
+            if k in video:
+                video[k] = video[k].replace("3c9e7b1d", f"{i:08x}")
+        ops.append(item)
+    return {"operations": ops}
+
+
+def _legacy(data):
+    """LabsFlowClient.batch_check_operations before op_extract."""
+    out = {}
+
+    def _dedup(xs):
+        seen = set()
+        r = []
+        for x in xs:
+            if x not in seen:
+                seen.add(x)
+                r.append(x)
+        return r
+    for item in data.get("operations", []):
+        key = (item.get("operation") or {}).get("name") or item.get("name") or ""
+        st = _normalize_status(item)
+        urls = _collect_urls_any(item.get("response", {})) or _collect_urls_any(item)
+        vurls = [u for u in urls if "/video/" in u]
+        iurls = [u for u in urls if "/image/" in u]
+        if st == "DONE":
+            st = "COMPLETED" if vurls else "DONE_NO_URL"
+        out[key or "unknown"] = {"status": st, "video_urls": _dedup(vurls),
+                                 "image_urls": _dedup(iurls), "raw": item}
+    return out
+
+
+def _current(data):
+    return {op_extract.op_name(it) or "unknown": op_extract.summarize(it)
+            for it in data.get("operations", [])}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default="1,50,500")
+    ap.add_argument("--repeat", type=int, default=200)
+    args = ap.parse_args()
+
+    with open(FIXTURE, "r", encoding="utf-8") as f:
+        templates = json.load(f)["operations"]
+
+    print(f"{'ops':>6}{'legacy us/poll':>16}{'op_extract us/poll':>20}{'speed-up':>10}")
+    for n in [int(x) for x in args.sizes.split(",") if x.strip()]:
+        data = _response(n, templates)
+        a, b = _legacy(data), _current(data)
+        for k in a:  # same answer for every operation
+            assert a[k]["status"] == b[k]["status"] and a[k]["video_urls"] == b[k]["video_urls"], k
+        reps = max(3, args.repeat * 50 // max(50, n))
+        t_old = min(timeit.repeat(lambda: _legacy(data), number=reps, repeat=3,
+                                  timer=time.perf_counter)) / reps
+        t_new = min(timeit.repeat(lambda: _current(data), number=reps, repeat=3,
+                                  timer=time.perf_counter)) / reps
+        print(f"{n:>6}{t_old * 1e6:>16.1f}{t_new * 1e6:>20.1f}{t_old / t_new:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
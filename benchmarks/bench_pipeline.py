@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+End-to-end throughput of the generation pipeline against the local mock Labs server
+(benchmarks/mock_labs.py): submit -> poll -> download through services.batch_runner, i.e.
+the same SubmissionEngine / OperationPoller / VideoDownloader / journal the UI uses.
+
+For each project size it reports:
+- submissions/s      scenes accepted per second of submission;
+- first video        seconds from start until the first MP4 is on disk;
+- all downloaded     seconds until every video of the project is on disk;
+- start calls        batchAsyncGenerateVideo* requests (scenes share them, see submit_batcher);
+- check calls        batchCheck requests sent (polling cost), and injected faults seen.
+
+Everything runs in a throw-away HOME (config, caches, poll statistics) with fast poll knobs,
+so no real quota or local state is touched. Rate limits, submission and download workers are
+the shipped defaults unless --rpm / --workers-per-token / --download-workers override them.
+
+Run from the repo root:
+    python -m benchmarks.bench_pipeline [--sizes 10,100,1000] [--render 3] [--tokens 4]
+        [--rpm 30 --burst 3] [--p429 0.02] [--p5xx 0.01] [--p400 0] [--p-fail 0] [--i2v]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.mock_labs import MockLabs, point_at, running
+
+
+def _config(home: str, args) -> dict:
+    cfg = {
+        "tokens": [f"bench-token-{i}" for i in range(args.tokens)],
+        "default_project_id": "bench-project",
+        "download_root": os.path.join(home, "VeoProjects"),
+        "labs": {
+            "submit": {},
+            "poll": {"interval_sec": 0.5, "min_interval_sec": 0.25, "max_interval_sec": 2.0,
+                     "min_deadline_sec": 120, "chunk_size": 50},
+            "batch": {},
+            "tokens": {"cooldown_sec": 1, "fail_cooldown_sec": 0.5},
+        },
+    }
+    if args.download_workers:
+        cfg["labs"]["batch"]["download_workers"] = args.download_workers
+    if args.workers_per_token:
+        cfg["labs"]["submit"]["workers_per_token"] = args.workers_per_token
+    if args.rpm is not None:  # otherwise the shipped labs.rate defaults apply
+        cfg["labs"]["rate"] = {"rpm": args.rpm, "burst": args.burst}
+    with open(os.path.join(home, ".veo_image2video_cfg.json"), "w", encoding="utf-8") as f:
+        json.dump(cfg, f)
+    return cfg
+
+
+def _images(home: str, n: int):
+    from PIL import Image
+    d = os.path.join(home, "refs")
+    os.makedirs(d, exist_ok=True)
+    src = os.path.join(d, "ref.png")
+    Image.new("RGB", (720, 1280), (40, 90, 160)).save(src)
+    out = []
+    for i in range(n):
+        p = os.path.join(d, f"ref_{i:04d}.png")
+        shutil.copyfile(src, p)
+        out.append(p)
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default="10,100,1000")
+    ap.add_argument("--render", type=float, default=3.0, help="mock render seconds")
+    ap.add_argument("--latency-ms", type=float, default=30.0, help="mock latency per POST")
+    ap.add_argument("--tokens", type=int, default=4)
+    ap.add_argument("--rpm", type=float, default=None,
+                    help="labs.rate.rpm per token (default: the shipped config)")
+    ap.add_argument("--burst", type=float, default=3.0, help="labs.rate.burst, with --rpm")
+    ap.add_argument("--workers-per-token", type=int, default=None)
+    ap.add_argument("--download-workers", type=int, default=None)
+    ap.add_argument("--video-mb", type=float, default=1.0)
+    ap.add_argument("--p400", type=float, default=0.0)
+    ap.add_argument("--p429", type=float, default=0.0)
+    ap.add_argument("--p5xx", type=float, default=0.0)
+    ap.add_argument("--p-fail", type=float, default=0.0)
+    ap.add_argument("--i2v", action="store_true",
+                    help="image-to-video (uploads a reference per scene)")
+    ap.add_argument("--keep", action="store_true", help="keep the temporary HOME")
+    args = ap.parse_args()
+
+    home = tempfile.mkdtemp(prefix="veo_bench_")
+    labs = MockLabs(render_sec=args.render, latency_ms=args.latency_ms, p400=args.p400,
+                    p429=args.p429, p5xx=args.p5xx, p_fail=args.p_fail,
+                    video_bytes=int(args.video_mb * 1e6))
+    try:
+        with running(labs) as base:
+            # must be in place before any service module is imported (paths are read at import)
+            os.environ["HOME"] = home
+            cfg = _config(home, args)
+            point_at(base)
+            from services.batch_runner import BatchRunner
+            from services.op_poller import get_poller
+
+            class TimedRunner(BatchRunner):
+                first_video = 0.0
+                submitted_at = 0.0
+
+                def _download(self, idx, copy_idx, url):
+                    super()._download(idx, copy_idx, url)
+                    done = self.jobs[idx].get("downloaded_idx") or ()
+                    if not self.first_video and copy_idx in done:
+                        self.first_video = time.time()
+
+                def _submit(self, engine, jobs):
+                    super()._submit(engine, jobs)
+                    self.submitted_at = time.time()
+
+            model = "veo_3_1_i2v_s_fast_portrait_ultra" if args.i2v else "veo_3_1_t2v_fast_ultra"
+            rpm = "shipped" if args.rpm is None else f"{args.rpm:g}"
+            print(f"mock={base} render={args.render}s tokens={args.tokens} rpm/token={rpm} "
+                  f"model={model}")
+            print(f"{'scenes':>7}{'subs/s':>9}{'first video s':>15}{'all downloaded s':>18}"
+                  f"{'videos':>8}{'start calls':>13}{'check calls':>13}"
+                  f"{'429':>6}{'5xx':>6}{'400':>6}")
+            poller = get_poller()
+            for n in [int(x) for x in args.sizes.split(",") if x.strip()]:
+                manifest = {"name": f"bench_{n}", "model": model,
+                            "aspect": "VIDEO_ASPECT_RATIO_PORTRAIT", "copies": 1,
+                            "prompts": [f"Scene {i + 1}: a calm lake at dawn" for i in range(n)]}
+                if args.i2v:
+                    manifest["images"] = _images(home, n)
+                before, checks0 = labs.stats(), poller.requests_sent
+                r = TimedRunner(manifest, cfg["tokens"], resume=False)
+                t0 = time.time()
+                res = r.run()
+                t_all = time.time() - t0
+                after = labs.stats()
+                sub_sec = max(1e-6, (r.submitted_at or time.time()) - t0)
+
+                def d(k):
+                    return after.get(k, 0) - before.get(k, 0)
+                first = f"{r.first_video - t0:.1f}" if r.first_video else "-"
+                print(f"{n:>7}{res['submitted'] / sub_sec:>9.1f}{first:>15}{t_all:>18.1f}"
+                      f"{res['downloaded']:>8}{d('start'):>13}{poller.requests_sent - checks0:>13}"
+                      f"{d('inject_429'):>6}{d('inject_5xx'):>6}{d('inject_400'):>6}", flush=True)
+            poller.stop()
+    finally:
+        if args.keep:
+            print(f"HOME kept at {home}", file=sys.stderr)
+        else:
+            shutil.rmtree(home, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Time to fill the thumbnails of a project table: the old ThumbWorker pattern (one new thread
+per icon, unpooled connection, full-size decode, nothing remembered) vs services.thumbnails
+(pooled fetches, reduced-scale JPEG decode to 64x64, per-URL memo). Both get a second pass
+where every icon is requested again, as ``_refresh_row`` does on each status check.
+
+With ffmpeg on PATH it also times first-frame extraction: one ffmpeg per video vs the
+service's batched runs.
+
+Run from the repo root:
+    python -m benchmarks.bench_thumbnails [--clips 300] [--latency-ms 40]
+"""
+import argparse
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+from benchmarks._local_http import JsonHandler, serve
+
+
+def _handler(jpg: bytes, latency: float):
+    class Handler(JsonHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(jpg)))
+            self.end_headers()
+            self.wfile.write(jpg)
+    return Handler
+
+
+def _old_icon(url: str):
+    import requests
+    from PIL import Image
+    data = requests.get(url, timeout=15).content
+    with Image.open(io.BytesIO(data)) as im:
+        im = im.convert("RGB")
+        im.thumbnail((64, 64))
+        return im
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--clips", type=int, default=300)
+    ap.add_argument("--latency-ms", type=float, default=40.0, help="server latency per image")
+    args = ap.parse_args()
+
+    from PIL import Image
+    buf = io.BytesIO()
+    Image.new("RGB", (1280, 720), (30, 120, 200)).save(buf, "JPEG", quality=90)
+    tmp = tempfile.mkdtemp(prefix="thumb_bench_")
+    os.environ["HOME"] = tmp  # empty icon/frame caches, default knobs
+    from services.thumbnails import ThumbnailService
+
+    try:
+        with serve(_handler(buf.getvalue(), args.latency_ms / 1000.0)) as base:
+            urls = [f"{base}/thumb/{i}.jpg?sig=x" for i in range(args.clips)]
+            old = []
+            for _ in range(2):
+                t0 = time.perf_counter()
+                ths = [threading.Thread(target=_old_icon, args=(u,)) for u in urls]
+                for th in ths:
+                    th.start()
+                for th in ths:
+                    th.join()
+                old.append(time.perf_counter() - t0)
+
+            svc = ThumbnailService(cache_dir=os.path.join(tmp, "cache"))
+            new = []
+            for _ in range(2):
+                left = [len(urls)]
+                lock = threading.Lock()
+                done = threading.Event()
+
+                def cb(_data):
+                    with lock:
+                        left[0] -= 1
+                        if left[0] == 0:
+                            done.set()
+                t0 = time.perf_counter()
+                for u in urls:
+                    svc.submit_image(u, cb)
+                done.wait(600)
+                new.append(time.perf_counter() - t0)
+            print(f"{args.clips} icons, {args.latency_ms:g} ms latency")
+            print(f"{'':<28}{'first':>8}{'refresh':>10}")
+            print(f"{'thread per icon':<28}{old[0]:>8.2f}{old[1]:>10.2f} s")
+            print(f"{'thumbnail service':<28}{new[0]:>8.2f}{new[1]:>10.2f} s")
+
+        ffmpeg = shutil.which("ffmpeg")
+        if not ffmpeg:
+            print("ffmpeg not on PATH - first-frame extraction skipped")
+            return
+        n = min(args.clips, 40)
+        src = os.path.join(tmp, "src.mp4")
+        subprocess.run([ffmpeg, "-loglevel", "error", "-f", "lavfi",
+                        "-i", "testsrc=size=720x1280:rate=24",
+                        "-t", "2", "-pix_fmt", "yuv420p", src], check=True)
+        vids = []
+        for i in range(n):
+            p = os.path.join(tmp, f"v{i}.mp4")
+            with open(src, "rb") as f, open(p, "wb") as g:
+                g.write(f.read() + i.to_bytes(4, "big"))  # distinct digests
+            vids.append(p)
+        t0 = time.perf_counter()
+        for p in vids:
+            subprocess.run([ffmpeg, "-y", "-loglevel", "error", "-ss", "00:00:00", "-i", p,
+                            "-frames:v", "1", "-q:v", "3", p + ".old.jpg"], check=True)
+        old = time.perf_counter() - t0
+        svc = ThumbnailService(cache_dir=os.path.join(tmp, "vcache"))
+        t0 = time.perf_counter()
+        ths = [threading.Thread(target=svc.video_thumb, args=(p,)) for p in vids]
+        for th in ths:
+            th.start()
+        for th in ths:
+            th.join()
+        new = time.perf_counter() - t0
+        print(f"{'ffmpeg per video':<28}{old:>8.2f} s   ({n} videos)")
+        print(f"{'service, batched':<28}{new:>8.2f} s   ({svc.stats()['ffmpeg_runs']} ffmpeg runs)")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for the Labs/Veo endpoints in services/endpoints.py (stdlib only).
+
+Implements the contracts the client relies on:
+
+- ``POST /v1:uploadUserImage``                          -> ``mediaGenerationId``
+- ``POST /v1/video:batchAsyncGenerateVideoStartImage``  -> one operation per request item
+- ``POST /v1/video:batchAsyncGenerateVideoText``        -> one operation per request item
+  (``metadata.sceneId`` of the item is echoed as the operation's ``sceneId``)
+- ``POST /v1/video:batchCheckAsyncVideoGenerationStatus`` -> ACTIVE until the render time has
+  passed, then SUCCESSFUL with ``operation.metadata.video.fifeUrl`` / ``servingBaseUri`` (or
+  FAILED with PUBLIC_ERROR_UNSAFE_GENERATION)
+- ``GET /media/video/<op>.mp4`` and ``GET /media/image/<op>.jpg`` -> fake payloads
+  (byte ranges supported, like the storage URLs)
+
+Render time, request latency and fault injection (400 on start, 429 with Retry-After, 5xx on
+any POST, failed renders) are configurable; ``stats()`` counts what was served.
+
+The production base URL is a constant; benchmarks redirect the client in-process with
+``point_at(base)``, which rebinds the URL names in services.endpoints and in the modules that
+imported them. Standalone (for poking at it with curl):
+    python -m benchmarks.mock_labs --port 8765 --render 20
+"""
+import argparse
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer
+from typing import Dict
+
+from benchmarks._local_http import JsonHandler
+
+_MP4_HEAD = b"\x00\x00\x00\x18ftypmp42\x00\x00\x00\x00mp42isom"
+_JPEG = (b"\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00"
+         b"\xff\xdb\x00C\x00" + bytes(range(1, 65)) + b"\xff\xd9")
+
+
+class MockLabs:
+    """Shared state of one mock server (thread-safe)."""
+
+    def __init__(self, render_sec: float = 5.0, jitter: float = 0.3, latency_ms: float = 0.0,
+                 p400: float = 0.0, p429: float = 0.0, p5xx: float = 0.0, p_fail: float = 0.0,
+                 retry_after: float = 1.0, video_bytes: int = 2_000_000, seed: int = 0):
+        self.render_sec = render_sec
+        self.jitter = jitter
+        self.latency = latency_ms / 1000.0
+        self.p400, self.p429, self.p5xx, self.p_fail = p400, p429, p5xx, p_fail
+        self.retry_after = retry_after
+        self.video_bytes = max(len(_MP4_HEAD), int(video_bytes))
+        self.base = ""
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+        self._ops: Dict[str, Dict] = {}
+        self._counts: Dict[str, int] = {}
+        self.first_start = 0.0
+        self.last_start = 0.0
+
+    def _count(self, key: str, n: int = 1):
+        self._counts[key] = self._counts.get(key, 0) + n
+
+    def _roll(self, p: float) -> bool:
+        return p > 0 and self._rnd.random() < p
+
+    def stats(self) -> Dict:
+        with self._lock:
+            out = dict(self._counts)
+            out["operations"] = len(self._ops)
+            out["first_start"], out["last_start"] = self.first_start, self.last_start
+            return out
+
+    # ----- endpoint logic (called with the handler's parsed body) ----------------------
+    def fault(self, start: bool):
+        """(code, body, headers) for an injected error, or None."""
+        with self._lock:
+            if self._roll(self.p5xx):
+                self._count("inject_5xx")
+                return 503, {"error": {"code": 503, "message": "backend unavailable"}}, {}
+            if self._roll(self.p429):
+                self._count("inject_429")
+                return 429, {"error": {"code": 429, "message": "RESOURCE_EXHAUSTED"}}, \
+                    {"Retry-After": f"{self.retry_after:g}"}
+            if start and self._roll(self.p400):
+                self._count("inject_400")
+                err = {"code": 400, "message": "Request contains an invalid argument."}
+                return 400, {"error": err}, {}
+        return None
+
+    def upload(self, body: Dict) -> Dict:
+        with self._lock:
+            self._count("upload")
+        return {"mediaGenerationId": {"mediaGenerationId": "CAMa" + uuid.uuid4().hex}}
+
+    def start(self, body: Dict) -> Dict:
+        now = time.time()
+        ops = []
+        with self._lock:
+            self._count("start")
+            self.first_start = self.first_start or now
+            self.last_start = now
+            for item in body.get("requests") or []:
+                name = uuid.uuid4().hex
+                dur = max(0.0, self.render_sec * (1 + self._rnd.uniform(-self.jitter, self.jitter)))
+                self._ops[name] = {"done_at": now + dur, "fail": self._roll(self.p_fail),
+                                   "model": item.get("videoModelKey"),
+                                   "aspect": item.get("aspectRatio"),
+                                   "seed": item.get("seed", 0)}
+                self._count("operations_started")
+                sid = (item.get("metadata") or {}).get("sceneId") or str(uuid.uuid4())
+                ops.append({"operation": {"name": name}, "sceneId": sid,
+                            "status": "MEDIA_GENERATION_STATUS_PENDING"})
+        return {"operations": ops, "remainingCredits": 1000}
+
+    def check(self, body: Dict) -> Dict:
+        now = time.time()
+        out = []
+        with self._lock:
+            self._count("check")
+            for it in body.get("operations") or []:
+                name = (it.get("operation") or {}).get("name") or ""
+                op = self._ops.get(name)
+                self._count("checked_ops")
+                if op is None:
+                    err = {"code": 5, "message": "NOT_FOUND"}
+                    out.append({"operation": {"name": name, "error": err},
+                                "status": "MEDIA_GENERATION_STATUS_FAILED"})
+                elif now < op["done_at"]:
+                    out.append({"operation": {"name": name},
+                                "status": "MEDIA_GENERATION_STATUS_ACTIVE"})
+                elif op["fail"]:
+                    err = {"code": 3, "message": "PUBLIC_ERROR_UNSAFE_GENERATION"}
+                    out.append({"operation": {"name": name, "error": err},
+                                "status": "MEDIA_GENERATION_STATUS_FAILED"})
+                else:
+                    out.append({"operation": {"name": name, "metadata": {"video": {
+                        "seed": op["seed"], "model": op["model"], "aspectRatio": op["aspect"],
+                        "fifeUrl": f"{self.base}/media/video/{name}.mp4",
+                        "servingBaseUri": f"{self.base}/media/image/{name}.jpg"}}},
+                        "status": "MEDIA_GENERATION_STATUS_SUCCESSFUL"})
+        return {"operations": out}
+
+    def handler(self):
+        labs = self
+
+        class Handler(JsonHandler):
+            def do_POST(self):
+                body = self._read_json()
+                if labs.latency:
+                    time.sleep(labs.latency)
+                path = self.path.split("?", 1)[0]
+                routes = {"/v1:uploadUserImage": (labs.upload, False),
+                          "/v1/video:batchAsyncGenerateVideoStartImage": (labs.start, True),
+                          "/v1/video:batchAsyncGenerateVideoText": (labs.start, True),
+                          "/v1/video:batchCheckAsyncVideoGenerationStatus": (labs.check, False)}
+                if path not in routes:
+                    self._send_json(404, {"error": {"code": 404, "message": "not found"}})
+                    return
+                fn, is_start = routes[path]
+                err = labs.fault(is_start)
+                if err:
+                    self._send_json(*err)
+                    return
+                self._send_json(200, fn(body))
+
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                if path.startswith("/media/video/"):
+                    data, ctype = _MP4_HEAD, "video/mp4"
+                    size = labs.video_bytes
+                elif path.startswith("/media/image/"):
+                    data, ctype = _JPEG, "image/jpeg"
+                    size = len(_JPEG)
+                else:
+                    self._send_json(404, {"error": {"code": 404, "message": "not found"}})
+                    return
+                with labs._lock:
+                    labs._count("get_video" if ctype == "video/mp4" else "get_image")
+                first, last = 0, size - 1
+                rng = self.headers.get("Range")
+                if rng and rng.startswith("bytes="):
+                    a, _, b = rng[6:].partition("-")
+                    first, last = int(a or 0), min(size - 1, int(b) if b else size - 1)
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {first}-{last}/{size}")
+                else:
+                    self.send_response(200)
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(last - first + 1))
+                self.end_headers()
+                # payload: ``data`` followed by zeros up to ``size``
+                zeros = b"\x00" * 65536
+                pos = first
+                while pos <= last:
+                    if pos < len(data):
+                        out = data[pos:last + 1]
+                    else:
+                        out = zeros[:last + 1 - pos]
+                    self.wfile.write(out)
+                    pos += len(out)
+
+        return Handler
+
+
+_URL_NAMES = {
+    "UPLOAD_IMAGE_URL": "/v1:uploadUserImage",
+    "T2V_URL": "/v1/video:batchAsyncGenerateVideoText",
+    "I2V_URL": "/v1/video:batchAsyncGenerateVideoStartImage",
+    "BATCH_CHECK_URL": "/v1/video:batchCheckAsyncVideoGenerationStatus",
+}
+
+
+def point_at(base: str):
+    """Rebind the Labs URLs of this process to ``base`` (benchmarks only, never the app)."""
+    from services import endpoints
+    from services.google import labs_flow_client
+    endpoints.LABS_BASE = base
+    for mod in (endpoints, labs_flow_client):
+        for name, path in _URL_NAMES.items():
+            setattr(mod, name, base + path)
+
+
+@contextmanager
+def running(labs: MockLabs, host: str = "127.0.0.1", port: int = 0):
+    """Serve ``labs`` on ``host:port`` (ephemeral by default); yields the base URL."""
+    srv = ThreadingHTTPServer((host, port), labs.handler())
+    srv.daemon_threads = True
+    labs.base = f"http://{host}:{srv.server_address[1]}"
+    th = threading.Thread(target=srv.serve_forever, daemon=True)
+    th.start()
+    try:
+        yield labs.base
+    finally:
+        srv.shutdown()
+        srv.server_close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--render", type=float, default=20.0, help="seconds per render")
+    ap.add_argument("--jitter", type=float, default=0.3, help="+- fraction of the render time")
+    ap.add_argument("--latency-ms", type=float, default=50.0, help="added to every POST")
+    ap.add_argument("--p400", type=float, default=0.0)
+    ap.add_argument("--p429", type=float, default=0.0)
+    ap.add_argument("--p5xx", type=float, default=0.0)
+    ap.add_argument("--p-fail", type=float, default=0.0, help="share of renders that fail")
+    ap.add_argument("--video-mb", type=float, default=2.0)
+    args = ap.parse_args()
+    labs = MockLabs(render_sec=args.render, jitter=args.jitter, latency_ms=args.latency_ms,
+                    p400=args.p400, p429=args.p429, p5xx=args.p5xx, p_fail=args.p_fail,
+                    video_bytes=int(args.video_mb * 1e6))
+    with running(labs, port=args.port) as base:
+        print(f"Mock Labs on {base}")
+        try:
+            while True:
+                time.sleep(10)
+                print(labs.stats(), flush=True)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 import sys, os
 from PyQt5.QtWidgets import QApplication, QWidget, QHBoxLayout, QVBoxLayout, QPushButton, QLineEdit, QListWidget, QSplitter, QLabel, QTabWidget
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtGui import QFont
 try:
     from ui.project_panel import ProjectPanel
@@ -12,6 +12,12 @@ try:
     from utils.config import load as load_cfg
 except Exception:
     from config import load as load_cfg
+try:
+    from services.project_scheduler import FairSlotPool, max_parallel_projects
+    from services.submission_engine import pool_size
+except Exception:
+    from project_scheduler import FairSlotPool, max_parallel_projects
+    from submission_engine import pool_size
 
 class ProjectsPane(QWidget):
     def __init__(self):
@@ -19,6 +25,9 @@ class ProjectsPane(QWidget):
         self._build_ui()
         self._projects = {}
         self._queue_running = False
+        self._pending = []; self._active = set(); self._pool = None
+        self._tput_timer = QTimer(self); self._tput_timer.setInterval(5000)
+        self._tput_timer.timeout.connect(self._update_throughput)
         # Always ensure at least one project exists so the right pane is visible immediately
         self._ensure_default_project()
 
@@ -53,11 +62,15 @@ class ProjectsPane(QWidget):
         lv.addWidget(self.list)
         
         # Run all button at bottom
-        self.btn_run_all=QPushButton("CHẠY TẤT CẢ\n(THEO THỨ TỰ)")
+        self.btn_run_all=QPushButton("CHẠY TẤT CẢ\n(SONG SONG)")
         self.btn_run_all.setMinimumHeight(50)
         self.btn_run_all.setStyleSheet("QPushButton{background:#43a047;color:white;font-weight:700;font-size:13px;border-radius:8px;padding:10px;} QPushButton:hover{background:#2e7d32;}")
         self.btn_run_all.clicked.connect(self._run_all_queue)
         lv.addWidget(self.btn_run_all)
+        self.lbl_tput=QLabel("")
+        self.lbl_tput.setWordWrap(True)
+        self.lbl_tput.setStyleSheet("color:#555;font-size:11px;")
+        lv.addWidget(self.lbl_tput)
         lv.addStretch(1)
         split.addWidget(left)
 
@@ -105,35 +118,75 @@ class ProjectsPane(QWidget):
             self._ensure_default_project()
 
     def _run_all_queue(self):
-        # Start from the first project in list
+        # Run the projects in list order, up to max_parallel_projects() at a time, sharing
+        # one FairSlotPool so every running project gets its share of the Labs tokens
         if not self._projects or self._queue_running:
             return
+        self._start_queue([self.list.item(i).text() for i in range(self.list.count())])
+
+    def _start_queue(self, names):
+        cfg = load_cfg()
+        toks = [t.strip() for t in cfg.get("tokens", []) if t.strip()]
+        if self._pool is None:
+            self._pool = FairSlotPool(pool_size(len(toks)))
+        else:
+            self._pool.slots = pool_size(len(toks))
+        self._pool.reset_stats()
         self._queue_running = True
+        self._pending = [n for n in names if n in self._projects]
+        self._active = set()
         self.btn_run_all.setEnabled(False)
-        first = self.list.item(0).text() if self.list.count() else None
-        if first:
-            self.list.setCurrentRow(0)
-            panel = self._projects.get(first)
-            if panel: panel._run_seq()
+        self._tput_timer.start()
+        self._fill_queue()
+
+    def _fill_queue(self):
+        limit = max_parallel_projects()
+        while self._pending and len(self._active) < limit:
+            name = self._pending.pop(0)
+            panel = self._projects.get(name)
+            if not panel: continue
+            panel.slot_pool = self._pool
+            panel._run_seq()
+            if panel._seq_running:
+                self._active.add(name)
+                if len(self._active) == 1:
+                    items = self.list.findItems(name, Qt.MatchExactly)
+                    if items: self.list.setCurrentItem(items[0])
+            # else: nothing to run in this project (no scenes) - move on
+        if not self._active and not self._pending:
+            self._finish_queue()
 
     def _on_project_completed(self, project_name: str):
+        if self._pool is not None:
+            self._pool.mark_finished(project_name)
         if not self._queue_running:
-            # even nếu user chạy thủ công, vẫn tiếp tục dự án kế tiếp theo yêu cầu
-            self._queue_running = True
-        # find next
-        names = [self.list.item(i).text() for i in range(self.list.count())]
-        if project_name in names:
-            idx = names.index(project_name) + 1
-            if idx < len(names):
-                nxt = self._projects.get(names[idx])
-                if nxt:
-                    self.list.setCurrentRow(idx)
-                    nxt._run_seq()
-                    return
-        # no more
+            # even nếu user chạy thủ công, vẫn tiếp tục các dự án kế tiếp theo yêu cầu
+            names = [self.list.item(i).text() for i in range(self.list.count())]
+            if project_name in names:
+                self._start_queue(names[names.index(project_name) + 1:])
+            return
+        self._active.discard(project_name)
+        self._fill_queue()
+
+    def _finish_queue(self):
         self._queue_running = False
+        self._tput_timer.stop()
+        self._update_throughput()
+        for panel in self._projects.values():
+            panel.slot_pool = None
         self.btn_run_all.setEnabled(True)
 
+    def _update_throughput(self):
+        if self._pool is None: return
+        r = self._pool.report()
+        if not r["elapsed_sec"]:
+            self.lbl_tput.setText(""); return
+        mins = int(r["elapsed_sec"] // 60); secs = int(r["elapsed_sec"] % 60)
+        self.lbl_tput.setText(
+            f"{r['running']} dự án đang chạy · {r['busy_slots']}/{r['slots']} luồng gửi\n"
+            f"Đã gửi {r['submitted']} cảnh ({r['scenes_per_min']:.1f}/phút) · "
+            f"{r['videos']} video ({r['videos_per_min']:.1f}/phút) · {mins:02d}:{secs:02d}")
+
 class MainWindow(QTabWidget):
     def __init__(self):
         super().__init__()
@@ -1,20 +1,43 @@
 # -*- coding: utf-8 -*-
 from typing import Dict, Any, Tuple
-from services.http_retry import request_json
+from services.http_retry import RETRY_STATUS, request_json, server_delay
 from services.core.key_manager import get_all_keys
+from services.rate_limit import labs_limiter
 from services.resilience import acquire
+from utils.config import knob
 
 def labs_call(method:str, url:str, *, json_body=None, params=None, headers=None):
-    tokens = get_all_keys('labs')
+    tokens = get_all_keys('labs') or [""]
+    max_wait = float(knob('resilience', 'max_retry_after_sec', 60.0))
     last_err = ""; last_code = 0; last_headers = {}
-    for t in tokens or [""]:
+    i = 0; waited = False
+    while i < len(tokens):
+        t = tokens[i]
         h = dict(headers or {})
         if t: h['authorization'] = f'Bearer {t}'
+        # concurrency (resilience) + request rate per bearer shared with every other Labs caller
+        # a 429 comes straight back: the bucket is paused and the next token is tried;
+        # the last token waits out the server's delay (up to max_retry_after_sec) instead
+        if t: labs_limiter().acquire(t)
         with acquire('labs'):
-            ok, data, err, code, resp_headers = request_json(method, url, headers=h, params=params, json_body=json_body)
+            ok, data, err, code, resp_headers = request_json(method, url, headers=h, params=params,
+                                                             json_body=json_body,
+                                                             retry_status=RETRY_STATUS - {429})
         if ok: return ok, data, code, resp_headers
         last_err, last_code, last_headers = err, code, resp_headers
-        if code in (401, 403): continue
+        if code in (401, 403):
+            i += 1
+            continue
+        if code == 429 and t:
+            delay = server_delay(resp_headers)
+            delay = 30.0 if delay is None else delay
+            labs_limiter().pause(t, delay)
+            if i == len(tokens) - 1 and not waited and delay <= max_wait:
+                # no other token left: wait out the server's delay (acquire sleeps) and retry once
+                waited = True
+                continue
+            i += 1
+            continue
         break
     return False, {"error": last_err, "trace": last_headers.get("x-request-id","")}, last_code, last_headers
 
@@ -0,0 +1,407 @@
+# -*- coding: utf-8 -*-
+"""
+Headless Image2Video / Text2Video batch runner: no Qt, plain threads.
+
+Drives the same services as ProjectPanel - SubmissionEngine (upload -> start_one), the shared
+OperationPoller, VideoDownloader and the job journal - so a project run here looks exactly
+like one run from the UI (same folders, file names and jobs.jsonl, which the UI can resume).
+Polling starts as soon as each scene is accepted and every finished copy is downloaded
+right away by a small download pool, so submission, rendering and downloading overlap.
+Several manifests run concurrently and share the Labs tokens through a FairSlotPool.
+
+Manifest (JSON; relative paths are resolved against the manifest's folder)::
+
+    {"name": "Project_1",
+     "prompts": "scenes.json",              # or an inline list / {"scenes": [...]}
+     "images": "refs/",                     # folder or list; omitted for *_t2v models
+     "model": "veo_3_1_i2v_s_fast_portrait_ultra",
+     "aspect": "VIDEO_ASPECT_RATIO_PORTRAIT",
+     "copies": 1,
+     "project_id": "...",                   # default: config default_project_id
+     "out_dir": "..."}                      # default: <download_root>/<name>
+
+Run: ``python batch_runner.py manifest.json [more.json ...]`` (see ``--help``).
+
+A run resumes from the project's jobs.jsonl. The journal stores a digest of what the manifest
+asked for (prompts, images, model, aspect, copies). If the manifest was edited since, the run
+refuses to resume and asks for ``--fresh`` rather than silently ignoring the edit.
+
+Knobs (config -> labs.batch): download_workers (4), max_projects (3)
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import queue as _queue
+import shutil
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from services.google.labs_flow_client import DEFAULT_PROJECT_ID, LabsFlowClient
+from services.job_journal import JobJournal, is_pending
+from services.op_poller import TERMINAL, get_poller
+from services.project_files import (
+    IMAGE_GLOB,
+    apply_op_result,
+    new_job,
+    parse_prompt_any,
+    parse_prompt_file,
+    project_paths,
+    safe_name,
+    video_basename,
+)
+from services.project_scheduler import FairSlotPool
+from services.submission_engine import SubmissionEngine, pool_size
+from services.utils.video_downloader import VideoDownloader
+from utils.config import cached, knob
+
+
+def _knob(name: str, default):
+    return knob('labs.batch', name, default)
+
+
+def load_manifest(path: str) -> Dict:
+    """Read a manifest file and resolve its relative paths."""
+    with open(path, "r", encoding="utf-8") as f:
+        m = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+
+    def _abs(p):
+        return p if os.path.isabs(p) else os.path.join(base, p)
+    if isinstance(m.get("prompts"), str):
+        m["prompts"] = _abs(m["prompts"])
+    if isinstance(m.get("images"), str):
+        m["images"] = _abs(m["images"])
+    elif isinstance(m.get("images"), list):
+        m["images"] = [_abs(p) for p in m["images"]]
+    if m.get("out_dir"):
+        m["out_dir"] = _abs(m["out_dir"])
+    m.setdefault("name", os.path.splitext(os.path.basename(path))[0])
+    return m
+
+
+class BatchRunner:
+    """Run one manifest end to end: submit, poll, download (see module docstring)."""
+
+    def __init__(self, manifest: Dict, tokens: List[str], *,
+                 on_log: Optional[Callable[[str, str], None]] = None,
+                 should_stop: Optional[Callable[[], bool]] = None,
+                 slots: Optional[FairSlotPool] = None, poller=None, resume: bool = True):
+        cfg = cached()
+        self.m = manifest
+        self.name = manifest.get("name") or "project"
+        self.model = manifest.get("model") or "veo_3_1_i2v_s_fast_portrait_ultra"
+        self.aspect = manifest.get("aspect") or "VIDEO_ASPECT_RATIO_PORTRAIT"
+        self.copies = max(1, int(manifest.get("copies") or 1))
+        self.project_id = (manifest.get("project_id") or cfg.get("default_project_id")
+                           or DEFAULT_PROJECT_ID)
+        root = (cfg.get("download_root")
+                or os.path.join(os.path.expanduser("~"), "Downloads", "VeoProjects"))
+        self.paths = project_paths(manifest.get("out_dir") or os.path.join(root, self.name))
+        self.on_log = on_log
+        self.should_stop = should_stop or (lambda: False)
+        self.slots = slots
+        self.resume = resume
+        self.poller = poller or get_poller()
+        self.client = LabsFlowClient(tokens, on_event=self._on_event)
+        self.journal = JobJournal.for_project(self.paths["project"])
+        self.downloader = VideoDownloader(log_callback=lambda msg: None)
+        self.jobs: List[Dict] = []
+        self._lock = threading.Lock()
+        self._by_op: Dict[str, int] = {}
+        self._waiting: set = set()
+        self.stats = {"scenes": 0, "submitted": 0, "completed": 0, "failed": 0,
+                      "downloaded": 0, "download_errors": 0}
+
+    def _log(self, level: str, msg: str):
+        if self.on_log:
+            try:
+                self.on_log(level, f"[{self.name}] {msg}")
+            except Exception:
+                pass
+
+    def _on_event(self, ev: dict):
+        if ev.get("kind") == "token_health":
+            self._log("WARN", f"Token {ev.get('token')}: {ev.get('reason')} ({ev.get('state')})")
+
+    # ----- jobs ---------------------------------------------------------------------
+    def _scenes(self) -> List[str]:
+        p = self.m.get("prompts")
+        if isinstance(p, str):
+            return parse_prompt_file(p)
+        return parse_prompt_any(p) if p is not None else []
+
+    def _images(self) -> List[str]:
+        imgs = self.m.get("images")
+        if isinstance(imgs, str):
+            files = []
+            for pat in IMAGE_GLOB:
+                files.extend(glob.glob(os.path.join(imgs, pat)))
+            return sorted(files)
+        return list(imgs or [])
+
+    def _digest(self, scenes: List[str], imgs: List[str]) -> str:
+        """Fingerprint of what the manifest asks for (an edit changes it)."""
+        def _size(p):
+            try:
+                return os.path.getsize(p)
+            except OSError:
+                return -1
+        spec = {"model": self.model, "aspect": self.aspect, "copies": self.copies,
+                "prompts": scenes, "images": [[os.path.abspath(p), _size(p)] for p in imgs]}
+        raw = json.dumps(spec, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        return hashlib.sha256(raw).hexdigest()
+
+    def prepare(self) -> List[Dict]:
+        """Jobs from the journal (resume) or fresh from the manifest.
+
+        Raises ValueError when the journal was written for a different version of the
+        manifest (resume would silently ignore the edit)."""
+        scenes = self._scenes()
+        is_t2v = "_t2v" in self.model
+        imgs = [] if is_t2v else self._images()
+        digest = self._digest(scenes, imgs)
+        if self.resume:
+            saved = self.journal.replay()
+            if saved:
+                was = self.journal.meta().get("manifest")
+                if was and was != digest:
+                    raise ValueError(f"{self.name}: manifest changed since {self.journal.path} "
+                                     f"was written; run with --fresh to submit it again")
+                self.journal.compact(saved)
+                for j in saved.values():
+                    j["downloaded_idx"] = set(j.get("downloaded_idx") or [])
+                    j["thumb_icons"] = {}
+                self.jobs = list(saved.values())
+                self._log("INFO", f"Khôi phục {len(self.jobs)} cảnh từ {self.journal.path}")
+                return self.jobs
+        if not scenes:
+            raise ValueError(f"{self.name}: no prompts in manifest")
+        if not is_t2v and not imgs:
+            raise ValueError(f"{self.name}: no reference images for {self.model}")
+        n = len(scenes) if is_t2v else min(len(scenes), len(imgs))
+        if not is_t2v and len(imgs) < len(scenes):
+            self._log("WARN", f"Số ảnh ({len(imgs)}) ít hơn số cảnh ({len(scenes)}); "
+                              f"chỉ tạo {n} cảnh đầu.")
+        self.journal.reset()
+        self.journal.set_meta({"manifest": digest})
+        self.jobs = []
+        for i in range(n):
+            sid = i + 1
+            prompt = scenes[i]
+            fname = os.path.join(self.paths["prompts"],
+                                 f"{safe_name(self.name)}_canh_{sid}_prompt.json")
+            try:
+                text = json.dumps(json.loads(prompt), ensure_ascii=False, indent=2)
+            except Exception:
+                fname, text = fname[:-5] + ".txt", prompt
+            with open(fname, "w", encoding="utf-8") as f:
+                f.write(text)
+            dst = None
+            if not is_t2v:
+                src = imgs[i]
+                ext = os.path.splitext(src)[1].lower() or ".jpg"
+                dst = os.path.join(self.paths["images"],
+                                   f"{safe_name(self.name)}_canh_{sid}_anh{ext}")
+                if os.path.abspath(src) != os.path.abspath(dst):
+                    shutil.copy2(src, dst)
+            job = new_job(sid, prompt, dst, self.copies)
+            self.jobs.append(job)
+            self.journal.record(job["scene_id"], job)
+        return self.jobs
+
+    # ----- pipeline -----------------------------------------------------------------
+    def _watch(self, idx: int, job: Dict, results: _queue.Queue):
+        self.journal.record(str(job.get("scene_id", idx)), job)
+        names = [n for n in job.get("operation_names") or [] if n]
+        if not names:
+            return
+        with self._lock:
+            new = [n for n in names if n not in self._by_op]
+            for n in new:
+                self._by_op[n] = idx
+                self._waiting.add(n)
+        if new:
+            self.poller.register(self.client, new, queue=results, model=job.get("model_key"),
+                                 aspect=job.get("aspect"), submitted_at=job.get("submitted_at"))
+
+    def _download(self, idx: int, copy_idx: int, url: str):
+        job = self.jobs[idx]
+        base = video_basename(self.name, job.get("scene_id", ""), copy_idx)
+        dest = os.path.join(self.paths["videos"], base + ".mp4")
+        for attempt in range(3):
+            if self.should_stop():
+                return
+            try:
+                self.downloader.download(url, dest)
+                break
+            except Exception as e:
+                err = e
+                time.sleep(1.5 * (attempt + 1))
+        else:
+            with self._lock:
+                self.stats["download_errors"] += 1
+            self._log("ERR", f"Tải thất bại cảnh {job.get('scene_id')} video {copy_idx}: {err}")
+            return
+        with self._lock:
+            job.setdefault("downloaded_idx", set()).add(copy_idx)
+            job.setdefault("local_paths", []).append(dest)
+            job["status"] = "DOWNLOADED"
+            got = len([u for u in job.get("video_by_idx") or [] if u])
+            if len(job["downloaded_idx"]) >= min(self.copies, got or self.copies):
+                job["completed_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+            self.stats["downloaded"] += 1
+        self.journal.record(str(job.get("scene_id", idx)), job)
+        if self.slots is not None:
+            self.slots.record_videos(self.name)
+        self._log("HTTP", f"Tải OK -> {dest}")
+
+    def _queue_downloads(self, idx: int, pool: ThreadPoolExecutor, queued: set):
+        job = self.jobs[idx]
+        done = set(job.get("downloaded_idx") or [])
+        for i, u in enumerate(job.get("video_by_idx") or [], start=1):
+            if u and i not in done and (idx, i) not in queued:
+                queued.add((idx, i))
+                pool.submit(self._download, idx, i, u)
+
+    def _submit(self, engine: SubmissionEngine, jobs: List[Dict]):
+        try:
+            self.stats["submitted"] = engine.run(jobs, self.model, self.aspect, self.copies,
+                                                 self.project_id)
+        except Exception as e:
+            self._log("ERR", f"Gửi cảnh lỗi: {e}")
+
+    def run(self) -> Dict:
+        """Run the manifest to completion; returns counters (see ``self.stats``)."""
+        t0 = time.time()
+        self.prepare()
+        self.stats["scenes"] = len(self.jobs)
+        results: _queue.Queue = _queue.Queue()
+        to_submit = [j for j in self.jobs if not j.get("operation_names")]
+        pos = {id(j): i for i, j in enumerate(self.jobs)}
+        engine = SubmissionEngine(self.client,
+                                  on_update=lambda i, j: self._watch(pos[id(j)], j, results),
+                                  on_log=self._log, should_stop=self.should_stop,
+                                  slots=self.slots, project=self.name)
+        queued: set = set()
+        with ThreadPoolExecutor(max_workers=max(1, int(_knob('download_workers', 4)))) as dl:
+            # already submitted (resumed) scenes: fetch ready videos, poll the rest
+            for idx, j in enumerate(self.jobs):
+                if j.get("operation_names") and is_pending(j):
+                    self._queue_downloads(idx, dl, queued)
+                    self._watch(idx, j, results)
+            submitter = threading.Thread(target=self._submit, args=(engine, to_submit),
+                                         name=f"batch-submit-{self.name}", daemon=True)
+            submitter.start()
+            try:
+                while not self.should_stop():
+                    with self._lock:
+                        idle = not self._waiting
+                    if idle and not submitter.is_alive():
+                        break
+                    try:
+                        name, info = results.get(timeout=1.0)
+                    except _queue.Empty:
+                        continue
+                    with self._lock:
+                        idx = self._by_op.get(name)
+                    if idx is None:
+                        continue
+                    job = self.jobs[idx]
+                    apply_op_result(job, name, info)
+                    self.journal.record(str(job.get("scene_id", idx)), job)
+                    if info.get("status") not in TERMINAL:
+                        continue
+                    with self._lock:
+                        self._waiting.discard(name)
+                        done = info.get("status") == "COMPLETED"
+                        self.stats["completed" if done else "failed"] += 1
+                    if info.get("status") == "COMPLETED":
+                        self._queue_downloads(idx, dl, queued)
+                    else:
+                        msg = f"Cảnh {job.get('scene_id')}: {info.get('status')} "
+                        self._log("WARN", (msg + str(info.get('error', ''))).rstrip())
+            finally:
+                self.poller.unregister(list(self._by_op), queue=results)
+        submitter.join(timeout=1.0)
+        self.stats["elapsed_sec"] = round(time.time() - t0, 1)
+        return dict(self.stats)
+
+
+def run_manifests(manifests: List[Dict], tokens: List[str], *, parallel: Optional[int] = None,
+                  on_log: Optional[Callable[[str, str], None]] = None,
+                  should_stop: Optional[Callable[[], bool]] = None,
+                  resume: bool = True) -> Dict[str, Dict]:
+    """Run several manifests concurrently on one token pool; returns stats per project."""
+    parallel = max(1, int(parallel or _knob('max_projects', 3)))
+    slots = FairSlotPool(pool_size(len(tokens)))
+    out: Dict[str, Dict] = {}
+
+    def _one(m):
+        name = m.get("name") or "project"
+        try:
+            out[name] = BatchRunner(m, tokens, on_log=on_log, should_stop=should_stop,
+                                    slots=slots, resume=resume).run()
+        except Exception as e:
+            out[name] = {"error": f"{e.__class__.__name__}: {e}"}
+            if on_log:
+                on_log("ERR", f"[{name}] {e}")
+        finally:
+            slots.mark_finished(name)
+
+    with ThreadPoolExecutor(max_workers=min(parallel, max(1, len(manifests)))) as ex:
+        list(ex.map(_one, manifests))
+    return out
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Headless Veo batch runner (no Qt).")
+    ap.add_argument("manifests", nargs="+", help="project manifest JSON file(s)")
+    ap.add_argument("--tokens", default=os.environ.get("LABS_TOKENS", ""),
+                    help="comma-separated Labs bearer tokens (default: $LABS_TOKENS, then config)")
+    ap.add_argument("--parallel", type=int, default=None, help="projects running at once")
+    ap.add_argument("--fresh", action="store_true",
+                    help="ignore jobs.jsonl and submit everything again")
+    ap.add_argument("--quiet", action="store_true", help="only warnings and errors")
+    args = ap.parse_args(argv)
+
+    tokens = [t.strip() for t in args.tokens.split(",") if t.strip()] or \
+             [t.strip() for t in cached().get("tokens", []) if t.strip()]
+    if not tokens:
+        print("No Labs tokens: pass --tokens, set LABS_TOKENS or add them in Settings.",
+              file=sys.stderr)
+        return 2
+    stop = threading.Event()
+    log_lock = threading.Lock()
+
+    def on_log(level: str, msg: str):
+        if args.quiet and level not in ("WARN", "ERR"):
+            return
+        with log_lock:
+            print(f"{time.strftime('%H:%M:%S')} {level:<4} {msg}", flush=True)
+
+    def on_sigint(*_):
+        if stop.is_set():
+            raise KeyboardInterrupt
+        stop.set()
+        print("Stopping after the current requests (Ctrl+C again to abort)...", file=sys.stderr)
+    signal.signal(signal.SIGINT, on_sigint)
+
+    manifests = [load_manifest(p) for p in args.manifests]
+    out = run_manifests(manifests, tokens, parallel=args.parallel, on_log=on_log,
+                        should_stop=stop.is_set, resume=not args.fresh)
+    if stop.is_set():
+        print("Interrupted - jobs.jsonl keeps the progress; run again to resume.", file=sys.stderr)
+        return 130
+    print(json.dumps(out, ensure_ascii=False, indent=2))
+    bad = any(r.get("error") or r.get("failed") or r.get("download_errors") for r in out.values())
+    return 1 if bad else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
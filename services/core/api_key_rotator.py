@@ -1,10 +1,22 @@
 # -*- coding: utf-8 -*-
 """
-API Key Rotator - Smart rotation with exponential backoff
+API Key Rotator - Smart rotation on the shared per-key scheduler
 Based on geminiService.ts logic with enhanced error handling
 """
-import time
-from typing import List, Callable, Any, Optional
+from typing import Any, Callable, List, Optional
+
+import requests
+
+from services.http_retry import get_breaker
+from services.key_scheduler import (
+    KeyScheduler,
+    classify,
+    daily_quota,
+    get_key_scheduler,
+    key_preview,
+    retry_after,
+    wait_for,
+)
 
 
 class APIKeyRotationError(Exception):
@@ -14,102 +26,133 @@ class APIKeyRotationError(Exception):
 
 class APIKeyRotator:
     """
-    Smart API key rotation with exponential backoff and intelligent retry logic
-    
+    Smart API key rotation with intelligent retry logic
+
     Features:
-    - Exponential backoff: 2s, 4s, 8s, 16s...
-    - Smart error handling: retry 429, fail fast on 401
+    - Keys come from the process-wide services.key_scheduler, earliest-available first:
+      an idle key is used at once, a throttled one only after its RPM/RPD window allows
+    - Smart error handling: 429 cools the key down (Retry-After aware), fail fast on 401
+    - 5xx/network errors count against the host's circuit breaker (services.http_retry);
+      while it is open calls fail at once instead of burning through every key
     - Transparent logging
     """
-    
-    def __init__(self, keys: List[str], log_callback: Optional[Callable[[str], None]] = None):
+
+    def __init__(self, keys: List[str], log_callback: Optional[Callable[[str], None]] = None,
+                 scheduler: Optional[KeyScheduler] = None,
+                 host: str = "generativelanguage.googleapis.com"):
         """
         Initialize rotator with keys and optional logging
-        
+
         Args:
             keys: List of API keys to rotate through
             log_callback: Optional callback function for logging (receives string messages)
+            scheduler: Key scheduler to share (default: the process-wide "gemini" one)
+            host: API host whose circuit breaker guards the calls
         """
         self.keys = keys if keys else []
         self.log_callback = log_callback
-        
+        self.scheduler = scheduler or get_key_scheduler("gemini")
+        self.breaker = get_breaker(host)
+
         if not self.keys:
             raise APIKeyRotationError("No API keys provided")
-    
+
     def _log(self, msg: str):
         """Log message if callback is provided"""
         if self.log_callback:
             self.log_callback(msg)
-    
-    # Maximum backoff delay in seconds
-    MAX_BACKOFF_SECONDS = 32
-    
-    def execute(self, api_call: Callable[[str], Any]) -> Any:
+
+    def execute(self, api_call: Callable[[str], Any], should_stop: Optional[Callable[[], bool]] = None,
+                max_attempts: Optional[int] = None) -> Any:
         """
         Execute an API call with smart key rotation and error handling
-        
+
         Args:
             api_call: Function that takes an API key and returns result
                      Should raise exceptions on failure
-        
+            should_stop: Optional callable; a pending wait is abandoned when it returns True
+            max_attempts: Calls to make at most (default: one per key)
+
         Returns:
             Result from successful API call
-            
+
         Raises:
-            APIKeyRotationError: If all keys fail
+            APIKeyRotationError: If all keys fail, or none frees up within max_wait_sec
         """
+        sched = self.scheduler
+        limit = max_attempts or len(self.keys)
+        tried = set()  # keys that failed for a reason other than their rate limit
         last_error = None
-        
-        for idx, key in enumerate(self.keys):
-            # Exponential backoff: 4s, 8s, 16s, 32s (increased from 2s, 4s, 8s, 16s)
-            if idx > 0:
-                delay = 4 * (2 ** (idx - 1))  # 4s, 8s, 16s, 32s...
-                # Cap at MAX_BACKOFF_SECONDS to avoid excessive waits
-                delay = min(delay, self.MAX_BACKOFF_SECONDS)
-                self._log(f"[BACKOFF] Waiting {delay}s before trying next key...")
-                time.sleep(delay)
-            
-            key_preview = f"...{key[-6:]}" if len(key) > 6 else "***"
-            self._log(f"[KEY {idx + 1}/{len(self.keys)}] Trying key {key_preview}")
-            
+        attempts = 0
+
+        while attempts < limit:
+            key, wait = sched.reserve(self.keys, exclude=tried, max_wait=sched.max_wait_sec)
+            if key is None:
+                if wait > 0:
+                    self._log(f"[RATE LIMIT] All keys busy, the first frees up in {wait:.0f}s")
+                break
+
+            preview = key_preview(key)
+            if wait > 0.05:
+                self._log(f"[RATE LIMIT] Key {preview} free in {wait:.1f}s")
+                if not wait_for(wait, should_stop):
+                    sched.cancel(key)
+                    raise APIKeyRotationError("Stopped")
+
+            blocked = self.breaker.allow()
+            if blocked > 0:
+                sched.cancel(key)
+                last_error = f"CIRCUIT OPEN: {self.breaker.host} is failing, retry in {blocked:.0f}s"
+                self._log(f"[CIRCUIT OPEN] {self.breaker.host} is failing, retry in {blocked:.0f}s")
+                break
+
+            attempts += 1
+            self._log(f"[KEY {attempts}/{limit}] Trying key {preview}")
+
             try:
                 result = api_call(key)
-                self._log(f"[SUCCESS] Key {key_preview} succeeded")
-                return result
-                
             except Exception as e:
-                error_msg = str(e).lower()
                 last_error = e
-                
-                # Check HTTP status codes in error message
-                # 401: Unauthorized - key is invalid, skip to next immediately
-                if '401' in error_msg or 'unauthorized' in error_msg or 'invalid api key' in error_msg:
-                    self._log(f"[FAIL] Key {key_preview} is invalid (401/unauthorized)")
-                    continue
-                
-                # 429: Rate limit - continue with backoff
-                if '429' in error_msg or 'rate limit' in error_msg or 'quota' in error_msg:
-                    self._log(f"[RATE LIMIT] Key {key_preview} hit rate limit (429)")
-                    continue
-                
-                # 403: Forbidden - permission issue, skip
-                if '403' in error_msg or 'forbidden' in error_msg:
-                    self._log(f"[FORBIDDEN] Key {key_preview} has permission issues (403)")
-                    continue
-                
-                # 5xx: Server errors - might be transient, continue
-                if any(code in error_msg for code in ['500', '502', '503', '504']):
-                    self._log(f"[SERVER ERROR] Key {key_preview} encountered server error (5xx)")
-                    continue
-                
-                # Other errors - log and continue
-                self._log(f"[ERROR] Key {key_preview} failed: {str(e)[:100]}")
+                kind = classify(e)
+                if kind == "server" or (isinstance(e, requests.RequestException)
+                                        and getattr(e, 'response', None) is None):
+                    self.breaker.failure()
+                else:
+                    self.breaker.success()  # the host answered
+
+                # 401/403: key is invalid or lacks permission, skip it
+                if kind == "invalid":
+                    sched.invalid(key)
+                    tried.add(key)
+                    self._log(f"[FAIL] Key {preview} is invalid or forbidden (401/403)")
+                # 429: the scheduler cools this key down and hands out the others first
+                elif kind == "rate_limited":
+                    daily = daily_quota(e)
+                    cooldown = sched.rate_limited(key, retry_after(e), daily=daily)
+                    what = "daily quota" if daily else "rate limit"
+                    self._log(f"[RATE LIMIT] Key {preview} hit {what} (429), cooling down {cooldown:.0f}s")
+                # 5xx: might be transient, move on to the next key
+                elif kind == "server":
+                    sched.failed(key)
+                    tried.add(key)
+                    self._log(f"[SERVER ERROR] Key {preview} encountered server error (5xx)")
+                else:
+                    sched.failed(key)
+                    tried.add(key)
+                    self._log(f"[ERROR] Key {preview} failed: {str(e)[:100]}")
                 continue
-        
+
+            sched.success(key)
+            self.breaker.success()
+            self._log(f"[SUCCESS] Key {preview} succeeded")
+            return result
+
         # All keys exhausted
         error_summary = f"All {len(self.keys)} API keys failed"
         if last_error:
             error_summary += f". Last error: {str(last_error)[:200]}"
-        
+        elif attempts == 0:
+            error_summary = f"All {len(self.keys)} API keys are rate-limited or in cooldown"
+
         self._log(f"[EXHAUSTED] {error_summary}")
         raise APIKeyRotationError(error_summary)
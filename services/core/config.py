@@ -5,27 +5,52 @@ Replaces all duplicate _cfg() implementations across services
 """
 import json
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
 
 CFG_PATH = Path.home() / ".veo_image2video_cfg.json"
 _CACHE: Optional[Dict[str, Any]] = None
+_STAMP: Optional[Tuple[int, int]] = None  # (mtime_ns, size) of the file behind _CACHE
+_VERSION = 0  # bumped whenever the cached config is replaced or saved
+
+
+def _stamp() -> Optional[Tuple[int, int]]:
+    try:
+        st = CFG_PATH.stat()
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+
+def version() -> int:
+    """Counter bumped on every reload, save and clear_cache.
+
+    Lets callers that derive state from the config tell a changed config from an unchanged
+    one, even when save() was given the same (mutated) dict that load() returned.
+    """
+    return _VERSION
 
 
 def load(force_reload: bool = False) -> Dict[str, Any]:
     """
-    Load configuration from file (cached for performance)
-    
+    Load configuration from file (cached until the file changes)
+
+    The cache is checked against the file's mtime and size on every call (one stat), so
+    edits made by the Settings panel or another process are picked up without a restart.
+
     Args:
         force_reload: If True, bypass cache and reload from disk
-        
+
     Returns:
         Configuration dictionary
     """
-    global _CACHE
-    
-    if _CACHE is not None and not force_reload:
+    global _CACHE, _STAMP, _VERSION
+
+    stamp = _stamp()
+    if _CACHE is not None and not force_reload and stamp == _STAMP:
         return _CACHE
-    
+    _STAMP = stamp
+    _VERSION += 1
+
     if CFG_PATH.exists():
         try:
             with open(CFG_PATH, "r", encoding="utf-8") as f:
@@ -34,7 +59,7 @@ def load(force_reload: bool = False) -> Dict[str, Any]:
         except Exception:
             # If file is corrupted, return default config
             pass
-    
+
     # Default configuration
     _CACHE = {
         "google_api_keys": [],
@@ -47,26 +72,28 @@ def load(force_reload: bool = False) -> Dict[str, Any]:
 def save(cfg: Dict[str, Any]) -> bool:
     """
     Save configuration to file (atomic write)
-    
+
     Args:
         cfg: Configuration dictionary to save
-        
+
     Returns:
         True if successful, False otherwise
     """
-    global _CACHE
-    
+    global _CACHE, _STAMP, _VERSION
+
     try:
         # Atomic write using temporary file
         temp_path = CFG_PATH.with_suffix('.tmp')
         with open(temp_path, "w", encoding="utf-8") as f:
             json.dump(cfg, f, indent=2, ensure_ascii=False)
-        
+
         # Rename is atomic on most filesystems
         temp_path.replace(CFG_PATH)
-        
+
         # Update cache
         _CACHE = cfg
+        _STAMP = _stamp()
+        _VERSION += 1
         return True
     except Exception:
         return False
@@ -74,5 +101,7 @@ def save(cfg: Dict[str, Any]) -> bool:
 
 def clear_cache():
     """Clear the configuration cache (useful for testing)"""
-    global _CACHE
+    global _CACHE, _STAMP, _VERSION
     _CACHE = None
+    _STAMP = None
+    _VERSION += 1
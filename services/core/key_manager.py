@@ -2,20 +2,24 @@
 """
 Unified API Key Management - Single source for all key rotation and management
 Replaces all duplicate key management implementations across services
+
+Pools are rebuilt only when the config file changes, and in place, so the round-robin
+cursor and per-key counters carry over: concurrent callers spread evenly across keys.
 """
-from typing import List
+from typing import Any, Dict, List
 import threading
-from services.core.config import load as load_config
+from services.core.config import load as load_config, version as config_version
 
 
 class KeyPool:
     """Thread-safe round-robin key pool"""
-    
+
     def __init__(self):
         self._keys: List[str] = []
         self._index = 0
+        self._served: Dict[str, int] = {}
         self._lock = threading.Lock()
-    
+
     def get_next(self) -> str:
         """Get next key in rotation"""
         with self._lock:
@@ -23,19 +27,45 @@ class KeyPool:
                 return ""
             key = self._keys[self._index % len(self._keys)]
             self._index += 1
+            self._served[key] = self._served.get(key, 0) + 1
             return key
-    
+
     def set_keys(self, keys: List[str]):
-        """Set the list of keys"""
+        """Set the list of keys (restarts the rotation; see update_keys)"""
         with self._lock:
-            self._keys = [k for k in keys if k]
+            self._keys = list(dict.fromkeys(k for k in keys if k))
             self._index = 0
-    
+            self._served = {}
+
+    def update_keys(self, keys: List[str]) -> bool:
+        """Replace the key list, keeping the rotation cursor and per-key stats.
+
+        The key that would have been served next is still served next if it is kept;
+        counters of keys that stay are preserved. Returns False if nothing changed.
+        """
+        keys = list(dict.fromkeys(k for k in keys if k))
+        with self._lock:
+            if keys == self._keys:
+                return False
+            nxt = self._keys[self._index % len(self._keys)] if self._keys else None
+            if nxt in keys:
+                self._index = keys.index(nxt)
+            else:
+                self._index = self._index % len(keys) if keys else 0
+            self._keys = keys
+            self._served = {k: n for k, n in self._served.items() if k in keys}
+            return True
+
     def get_all(self) -> List[str]:
         """Get all keys (snapshot)"""
         with self._lock:
             return list(self._keys)
 
+    def stats(self) -> Dict[str, int]:
+        """Times each current key was handed out by get_next"""
+        with self._lock:
+            return {k: self._served.get(k, 0) for k in self._keys}
+
 
 # Global key pools for each provider
 _POOLS = {
@@ -44,15 +74,14 @@ _POOLS = {
     'openai': KeyPool(),
     'elevenlabs': KeyPool(),
 }
+_REFRESH_LOCK = threading.Lock()
+_LOADED: Dict[str, Any] = {"version": None}  # config version the pools were last built from
 
 
-def refresh():
-    """Refresh all key pools from configuration"""
-    cfg = load_config()
-    
+def _keys_from_config(cfg: Dict[str, Any]) -> Dict[str, List[str]]:
+    # lists are copied: the config dict is load()'s cache and must not be mutated
     # Google keys
-    google_keys = []
-    google_keys.extend(cfg.get('google_api_keys', []))
+    google_keys = list(cfg.get('google_api_keys') or [])
     if cfg.get('google_api_key'):
         google_keys.append(cfg['google_api_key'])
     # Legacy mixed store
@@ -61,11 +90,9 @@ def refresh():
             v = t.get('token') or t.get('value')
             if v:
                 google_keys.append(v)
-    _POOLS['google'].set_keys(google_keys)
-    
+
     # Labs tokens
-    labs_tokens = []
-    labs_tokens.extend(cfg.get('labs_tokens', []))
+    labs_tokens = list(cfg.get('labs_tokens') or [])
     # Legacy mixed store
     for t in cfg.get('tokens', []):
         if isinstance(t, dict) and t.get('kind') == 'labs':
@@ -75,40 +102,67 @@ def refresh():
         elif isinstance(t, str) and len(t) > 30:
             # Assume long strings in tokens are labs tokens
             labs_tokens.append(t)
-    _POOLS['labs'].set_keys(labs_tokens)
-    
+
     # OpenAI keys
-    openai_keys = cfg.get('openai_api_keys', [])
+    openai_keys = list(cfg.get('openai_api_keys') or [])
     if cfg.get('openai_api_key'):
         openai_keys.append(cfg['openai_api_key'])
-    _POOLS['openai'].set_keys(openai_keys)
-    
+
     # ElevenLabs keys
-    elevenlabs_keys = cfg.get('elevenlabs_api_keys', [])
-    _POOLS['elevenlabs'].set_keys(elevenlabs_keys)
+    elevenlabs_keys = list(cfg.get('elevenlabs_api_keys') or [])
+    return {'google': google_keys, 'labs': labs_tokens, 'openai': openai_keys,
+            'elevenlabs': elevenlabs_keys}
+
+
+def refresh(force: bool = False) -> bool:
+    """Refresh key pools from configuration when it has changed
+
+    load_config() re-reads the file only when its mtime/size changed, so an unchanged
+    config is one stat and a version compare here (the version also moves on save(), which
+    catches an in-memory edit of the cached dict). Pools are updated in place
+    (KeyPool.update_keys): rotation cursors and per-key counters survive a refresh.
+
+    Returns:
+        True if any pool's key list changed
+    """
+    ver = config_version()  # read first: a reload racing with us only causes one more refresh
+    cfg = load_config()
+    with _REFRESH_LOCK:
+        if ver == _LOADED["version"] and not force:
+            return False
+        _LOADED["version"] = ver
+        changed = False
+        for provider, keys in _keys_from_config(cfg).items():
+            changed = _POOLS[provider].update_keys(keys) or changed
+        return changed
+
+
+def key_stats(provider: str) -> Dict[str, int]:
+    """Per-key use counts of the provider's pool (since the key was added)"""
+    return _POOLS.get(provider, KeyPool()).stats()
 
 
 def get_key(provider: str) -> str:
     """
     Get next key for provider (with auto-refresh)
-    
+
     Args:
         provider: Provider name ('google', 'labs', 'openai', 'elevenlabs')
-        
+
     Returns:
         API key or empty string if none available
     """
-    refresh()  # Always refresh to get latest config
+    refresh()  # no-op unless the config file changed
     return _POOLS.get(provider, KeyPool()).get_next()
 
 
 def get_all_keys(provider: str) -> List[str]:
     """
     Get all keys for provider
-    
+
     Args:
         provider: Provider name
-        
+
     Returns:
         List of all keys for provider
     """
@@ -119,21 +173,21 @@ def get_all_keys(provider: str) -> List[str]:
 def rotated_list(provider: str, base_list: List[str]) -> List[str]:
     """
     Rotate list to prioritize next key in pool
-    
+
     Args:
         provider: Provider name
         base_list: Base list of keys
-        
+
     Returns:
         Rotated list with pool's next key first
     """
     base_list = [x for x in base_list if x]
     if not base_list:
         return base_list
-    
+
     key = get_key(provider)
     if not key or key not in base_list:
         return base_list
-    
+
     # Move key to front
     return [key] + [x for x in base_list if x != key]
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Bounded download queue served by a worker pool, with a separate post-processing stage.
+
+A polling loop hands finished videos over with ``offer(key, url, dest)`` and goes straight
+back to polling - the call never blocks. At most ``max_queue`` downloads wait in the queue;
+when it is full ``offer`` returns False and the caller keeps the item and offers it again on
+its next pass. ``workers`` threads do the downloads. Each downloaded file is then handed to
+``post`` (thumbnails) on its own ``post_workers`` threads, so a slow ffmpeg never holds a
+download slot; ``post`` also gets what ``download`` returned (e.g. the digest the download
+already computed, so the file is not hashed again).
+
+Outcomes arrive on ``pool.events`` (a queue.Queue) for the owner to apply on its own thread:
+    ("downloaded", key, path) / ("download_failed", key, error) / ("post", key, result)
+
+Knobs (config -> labs.download): workers (4), max_queue (16), post_workers (1)
+"""
+import queue
+import threading
+from typing import Any, Callable, Optional
+
+from utils.config import knob
+
+
+def _knob(name: str, default):
+    return knob('labs.download', name, default)
+
+
+_STOP = object()
+
+
+class DownloadPool:
+    """``download(url, dest)`` raises on failure; ``post(key, path, downloaded)`` gets its
+    return value and returns anything."""
+
+    def __init__(self, download: Callable[[str, str], Any],
+                 post: Optional[Callable[[Any, str, Any], Any]] = None,
+                 workers: Optional[int] = None, max_queue: Optional[int] = None,
+                 post_workers: Optional[int] = None):
+        self.download = download
+        self.post = post
+        self.workers = max(1, int(workers or _knob('workers', 4)))
+        self.events: queue.Queue = queue.Queue()
+        self._q: queue.Queue = queue.Queue(maxsize=max(1, int(max_queue or _knob('max_queue', 16))))
+        self._post_q: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._busy = 0  # offered but not yet fully processed (download + post)
+        self._cancelled = False
+        self._dl_threads = [self._spawn(self._download_loop, f"download-{i}")
+                            for i in range(self.workers)]
+        n_post = max(1, int(post_workers or _knob('post_workers', 1))) if post is not None else 0
+        self._post_threads = [self._spawn(self._post_loop, f"download-post-{i}")
+                              for i in range(n_post)]
+
+    @staticmethod
+    def _spawn(target, name: str) -> threading.Thread:
+        th = threading.Thread(target=target, name=name, daemon=True)
+        th.start()
+        return th
+
+    # ----- owner side ---------------------------------------------------------------
+    def offer(self, key, url: str, dest: str) -> bool:
+        """Queue a download without blocking; False if the queue is full (offer it again later)."""
+        with self._lock:
+            if self._cancelled:
+                return False
+            self._busy += 1
+        try:
+            self._q.put_nowait((key, url, dest))
+            return True
+        except queue.Full:
+            self._done()
+            return False
+
+    def busy(self) -> int:
+        """Items queued, downloading or being post-processed."""
+        with self._lock:
+            return self._busy
+
+    def close(self, wait: bool = True, cancel: bool = False):
+        """Stop the workers once the queue is drained (``cancel`` drops what is still queued)."""
+        with self._lock:
+            self._cancelled = True
+        if cancel:
+            for q in (self._q, self._post_q):
+                while True:
+                    try:
+                        q.get_nowait()
+                    except queue.Empty:
+                        break
+                    self._done()
+        for _ in self._dl_threads:
+            self._q.put(_STOP)
+        if not wait:
+            for _ in self._post_threads:
+                self._post_q.put(_STOP)
+            return
+        for th in self._dl_threads:
+            th.join()
+        # downloads are finished, so every post item is queued ahead of these
+        for _ in self._post_threads:
+            self._post_q.put(_STOP)
+        for th in self._post_threads:
+            th.join()
+
+    # ----- workers ------------------------------------------------------------------
+    def _done(self):
+        with self._lock:
+            self._busy -= 1
+
+    def _download_loop(self):
+        while True:
+            item = self._q.get()
+            if item is _STOP:
+                return
+            key, url, dest = item
+            try:
+                info = self.download(url, dest)
+            except Exception as e:
+                self.events.put(("download_failed", key, str(e) or e.__class__.__name__))
+                self._done()
+                continue
+            self.events.put(("downloaded", key, dest))
+            if self.post is None:
+                self._done()
+            else:
+                self._post_q.put((key, dest, info))
+
+    def _post_loop(self):
+        while True:
+            item = self._post_q.get()
+            if item is _STOP:
+                return
+            key, path, info = item
+            try:
+                res = self.post(key, path, info)
+            except Exception:
+                res = None
+            self.events.put(("post", key, res))
+            self._done()
@@ -1,6 +1,13 @@
-import base64, mimetypes, json, time, requests, os, re
-from typing import List, Dict, Optional, Tuple, Callable, Any
+import base64
+import json
+import mimetypes
+import os
+import re
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
+import requests
 
 # Optional default_project_id from user config (non-breaking)
 try:
@@ -17,12 +24,32 @@ except Exception:
 
 # Support both package and flat layouts
 try:
-    from services.endpoints import UPLOAD_IMAGE_URL, I2V_URL, T2V_URL, BATCH_CHECK_URL
+    from services.endpoints import BATCH_CHECK_URL, I2V_URL, T2V_URL, UPLOAD_IMAGE_URL
 except Exception:  # pragma: no cover
-    from endpoints import UPLOAD_IMAGE_URL, I2V_URL, T2V_URL, BATCH_CHECK_URL
+    from endpoints import BATCH_CHECK_URL, I2V_URL, T2V_URL, UPLOAD_IMAGE_URL
+
+try:
+    from services import http_pool, image_prep, op_extract
+    from services.http_retry import get_breaker, server_delay
+    from services.model_ladder import get_ladder, ladder_for
+    from services.rate_limit import labs_limiter
+    from services.token_health import TokenRouter
+    from services.upload_cache import get_upload_cache
+except Exception:  # pragma: no cover
+    import http_pool
+    import image_prep
+    import op_extract
+    from http_retry import get_breaker, server_delay
+    from model_ladder import get_ladder, ladder_for
+    from rate_limit import labs_limiter
+    from token_health import TokenRouter
+    from upload_cache import get_upload_cache
 
 DEFAULT_PROJECT_ID = "87b19267-13d6-49cd-a7ed-db19a90c9339"
 
+# Backend needs a moment to index a fresh upload before it can be used as startImage
+UPLOAD_SETTLE_SEC = 1.0
+
 def _headers(bearer: str) -> dict:
     return {
         "authorization": f"Bearer {bearer}",
@@ -39,6 +66,11 @@ def _encode_image_file(path: str):
     mime = mimetypes.guess_type(path)[0] or "image/jpeg"
     return b64, mime
 
+def _retry_after(r) -> Optional[float]:
+    """Delay the server asked for (Retry-After, RetryInfo retryDelay, ...; see http_retry)."""
+    try: return server_delay(r.headers, r.text if r.status_code==429 else "") or None
+    except Exception: return None
+
 _URL_PAT = re.compile(r'^(https?://|gs://)', re.I)
 def _collect_urls_any(obj: Any) -> List[str]:
     urls=set(); KEYS={"gcsUrl","gcsUri","signedUrl","signedUri","downloadUrl","downloadUri","videoUrl","url","uri","fileUri"}
@@ -56,13 +88,7 @@ def _collect_urls_any(obj: Any) -> List[str]:
     return lst
 
 def _normalize_status(item: dict) -> str:
-    if item.get("done") is True:
-        if item.get("error"): return "FAILED"
-        return "DONE"
-    s=item.get("status") or ""
-    if s in ("MEDIA_GENERATION_STATUS_SUCCEEDED","SUCCEEDED","SUCCESS"): return "DONE"
-    if s in ("MEDIA_GENERATION_STATUS_FAILED","FAILED","ERROR"): return "FAILED"
-    return "PROCESSING"
+    return op_extract.normalize_status(item)
 
 def _trim_prompt_text(prompt_text: Any)->str:
     """If prompt is a large JSON string/object, reduce to essential fields to avoid 400 'invalid argument'."""
@@ -99,75 +125,127 @@ class LabsFlowClient:
     def __init__(self, bearers: List[str], timeout: Tuple[int,int]=(20,180), on_event: Optional[Callable[[dict], None]]=None):
         self.tokens=[t.strip() for t in (bearers or []) if t.strip()]
         if not self.tokens: raise ValueError("No Labs tokens provided")
-        self._idx=0; self.timeout=timeout; self.on_event=on_event
+        self.timeout=timeout; self.on_event=on_event
+        # health-weighted token choice
+        self.router=TokenRouter(self.tokens, on_event=self._on_router_event)
+        # process-wide per-bearer token bucket, acquired before each call
+        self.rate_limiter=labs_limiter()
+        self.poll_limiter=labs_limiter("poll")  # batchCheck has its own budget
+        self._uploaded_at={}    # mediaGenerationId -> upload time (for the settle delay)
+        self.ladder=get_ladder()  # process-wide: learned per token/project/aspect
 
     def _tok(self)->str:
-        t=self.tokens[self._idx % len(self.tokens)]; self._idx+=1; return t
+        return self.router.pick()
+
+    def _on_router_event(self, ev: dict):
+        if self.on_event:
+            try: self.on_event(ev)
+            except Exception: pass
+
+    def token_health(self)->List[dict]:
+        """Per-token health (ids are hashes, never the bearer itself)."""
+        return self.router.snapshot()
 
     def _emit(self, kind: str, **kw):
         if self.on_event:
             try: self.on_event({"kind":kind, **kw})
             except Exception: pass
 
-    def _post(self, url: str, payload: dict) -> dict:
+    def _post(self, url: str, payload: dict, bearer: Optional[str]=None) -> dict:
+        """POST on the healthiest token (``bearer`` is preferred while it is usable), up to 3
+        attempts. 400/404 are not retried; 401/403/429 move to another token at once; 5xx/network
+        errors back off.
+        The host's circuit breaker (services.http_retry) fails the call at once while it is open."""
         last=None
+        limiter=self.poll_limiter if url==BATCH_CHECK_URL else self.rate_limiter
+        breaker=get_breaker(url)
         for attempt in range(3):
+            if breaker.allow()>0:
+                raise requests.ConnectionError(f"CIRCUIT OPEN: {breaker.host} is failing")
+            tok=self.router.pick(prefer=bearer)
+            wait=self.router.wait_time(tok)  # every token is cooling down
+            if wait>0: time.sleep(min(wait, 30.0))
+            if limiter: limiter.acquire(tok)
+            self.router.begin(tok); t0=time.time()
+            try:
+                r=http_pool.session('labs').post(url, headers=_headers(tok), json=payload,
+                                                 timeout=self.timeout)
+            except Exception as e:
+                self.router.report(tok, None, time.time()-t0)
+                breaker.failure()
+                last=e; time.sleep(0.7*(attempt+1)); continue
+            if r.status_code>=500: breaker.failure()  # 4xx: the host is up and answering
+            else: breaker.success()
+            ra=_retry_after(r)
+            self.router.report(tok, r.status_code, time.time()-t0, ra)
+            if r.status_code==429 and limiter: limiter.pause(tok, ra or self.router.wait_time(tok))
+            if r.status_code==200:
+                self._emit("http_ok", code=200)
+                try: return r.json()
+                except Exception: return {}
+            det=""
+            try: det=r.json().get("error",{}).get("message","")[:300]
+            except Exception: det=(r.text or "")[:300]
+            self._emit("http_other_err", code=r.status_code, detail=det)
             try:
-                r=requests.post(url, headers=_headers(self._tok()), json=payload, timeout=self.timeout)
-                if r.status_code==200:
-                    self._emit("http_ok", code=200)
-                    try: return r.json()
-                    except Exception: return {}
-                det=""
-                try: det=r.json().get("error",{}).get("message","")[:300]
-                except Exception: det=(r.text or "")[:300]
-                self._emit("http_other_err", code=r.status_code, detail=det); r.raise_for_status()
+                r.raise_for_status(); last=requests.HTTPError(f"HTTP {r.status_code}", response=r)
             except Exception as e:
-                last=e; time.sleep(0.7*(attempt+1))
+                last=e
+            # the request itself is wrong; another try won't help
+            if r.status_code in (400, 404): break
+            if r.status_code not in (401, 403, 429): time.sleep(0.7*(attempt+1))
         raise last
 
-    def upload_image_file(self, image_path: str, aspect_hint="IMAGE_ASPECT_RATIO_PORTRAIT")->Optional[str]:
+    def upload_image_file(self, image_path: str, aspect_hint="IMAGE_ASPECT_RATIO_PORTRAIT",
+                          use_cache: bool=True)->Optional[str]:
+        """Upload a reference image; identical content+aspect reuses the cached
+        mediaGenerationId."""
+        # orientation fix + crop/resize/re-encode to a frame-sized image (cached, see image_prep)
+        prep=image_prep.prepare_image(image_path, aspect_hint)
+        if prep["path"]!=image_path or prep["error"]:
+            self._emit("upload_prep", src_bytes=prep["src_bytes"], bytes=prep["bytes"],
+                       saved=prep["src_bytes"]-prep["bytes"], cached=prep["cached"],
+                       error=prep["error"])
+        image_path=prep["path"]
+        if use_cache:
+            return get_upload_cache().get_or_upload(
+                image_path, aspect_hint, lambda: self._upload_image(image_path, aspect_hint))
+        return self._upload_image(image_path, aspect_hint)
+
+    def _upload_image(self, image_path: str, aspect_hint: str)->Optional[str]:
         b64,mime=_encode_image_file(image_path)
         payload={"imageInput":{"rawImageBytes":b64,"mimeType":mime,"isUserUploaded":True,"aspectRatio":aspect_hint},
                  "clientContext":{"sessionId":f"{int(time.time()*1000)}"}}
+        t0=time.time()
         data=self._post(UPLOAD_IMAGE_URL,payload) or {}
+        self._emit("upload_done", bytes=len(b64), sec=round(time.time()-t0, 3))
         mid=(data.get("mediaGenerationId") or {}).get("mediaGenerationId")
+        if mid: self._uploaded_at[mid]=time.time()
         return mid
 
+    def _wait_settle(self, mid: Optional[str]):
+        """Sleep only for what is left of UPLOAD_SETTLE_SEC since ``mid`` was uploaded by this
+        client."""
+        up=self._uploaded_at.get(mid) if mid else None
+        if up:
+            left=UPLOAD_SETTLE_SEC-(time.time()-up)
+            if left>0: time.sleep(left)
+
     def start_one(self, job: Dict, model_key: str, aspect_ratio: str, prompt_text: str, copies:int=1, project_id: Optional[str]=DEFAULT_PROJECT_ID)->int:
         """Start a scene with robust fallbacks: delay-after-upload, model ladder (I2V vs T2V), reupload-on-400, per-copy fallback, prompt trimming."""
         copies=max(1,int(copies)); base_seed=int(job.get("seed",0)) if str(job.get("seed","")).isdigit() else 0
         mid=job.get("media_id")
 
-        # Give backend a moment to index the uploaded image (avoids 400/500 immediately after upload)
-        time.sleep(1.0)
+        # Give backend a moment to index a just-uploaded image
+        # (avoids 400/500 immediately after upload)
+        self._wait_settle(mid)
 
         # IMPORTANT: choose fallbacks based on whether we're doing I2V (has start image) or T2V (no image)
-        FALLBACKS_I2V={
-            "VIDEO_ASPECT_RATIO_PORTRAIT":[
-                "veo_3_1_i2v_s_fast_portrait_ultra","veo_3_1_i2v_s_fast_portrait","veo_3_1_i2v_s_portrait","veo_3_1_i2v_s"
-            ],
-            "VIDEO_ASPECT_RATIO_LANDSCAPE":[
-                "veo_3_1_i2v_s_fast_ultra","veo_3_1_i2v_s_fast","veo_3_1_i2v_s"
-            ],
-            "VIDEO_ASPECT_RATIO_SQUARE":[
-                "veo_3_1_i2v_s_fast","veo_3_1_i2v_s"
-            ]
-        }
-        FALLBACKS_T2V={
-            "VIDEO_ASPECT_RATIO_PORTRAIT":[
-                "veo_3_1_t2v_fast_ultra","veo_3_1_t2v"
-            ],
-            "VIDEO_ASPECT_RATIO_LANDSCAPE":[
-                "veo_3_1_t2v_fast_ultra","veo_3_1_t2v"
-            ],
-            "VIDEO_ASPECT_RATIO_SQUARE":[
-                "veo_3_1_t2v_fast_ultra","veo_3_1_t2v"
-            ]
-        }
-        fallbacks = FALLBACKS_I2V if mid else FALLBACKS_T2V
-        # start with the user's chosen model, then ladder through same-family models for the aspect
-        models=[model_key]+[m for m in fallbacks.get(aspect_ratio, []) if m!=model_key]
+        # the whole scene goes out on one bearer so learned ladder routing applies to that token;
+        # rungs this token/project/aspect rejected recently are skipped (see model_ladder)
+        tok=self._tok()
+        models=self.ladder.order(ladder_for(model_key, aspect_ratio, bool(mid)), tok, project_id,
+                                 aspect_ratio)
 
         # compose prompt text (trim if huge/complex)
         prompt=_trim_prompt_text(prompt_text)
@@ -185,39 +263,50 @@ class LabsFlowClient:
 
         def _try(body):
             url=I2V_URL if mid else T2V_URL
-            return self._post(url, body) or {}
+            return self._post(url, body, bearer=tok) or {}
 
         def _is_invalid(e: Exception)->bool:
             s=str(e).lower()
             return ("400" in str(e)) or ("invalid json" in s) or ("invalid argument" in s)
 
+        def _walk():
+            """Try the ladder in order -> (data, model, error)."""
+            rejected=[]; err=None
+            for mkey in models:
+                try:
+                    dat=_try(_make_body(mkey, mid, copies))
+                except Exception as e:
+                    err=e
+                    if not _is_invalid(e): break
+                    rejected.append(mkey); continue
+                # a later rung accepted the same body, so the rejected ones are model problems
+                for bad in rejected: self.ladder.record_fail(bad, tok, project_id, aspect_ratio)
+                self.ladder.record_ok(mkey, tok, project_id, aspect_ratio, first=not rejected)
+                return dat, mkey, None
+            # every rung failed: likely the image/prompt, not the models - remember nothing
+            self.ladder.miss(len(rejected))
+            return None, model_key, err
+
         # 1) Try batch with model fallbacks
-        data=None; last_err=None
-        for mkey in models:
-            try:
-                data=_try(_make_body(mkey, mid, copies))
-                last_err=None; break
-            except Exception as e:
-                last_err=e
-                if not _is_invalid(e): break
+        data, used, last_err = _walk()
 
         # 2) If invalid and have image -> reupload once then retry ladder (I2V only)
         if last_err and _is_invalid(last_err) and mid and job.get("image_path"):
             try:
-                new_mid=self.upload_image_file(job["image_path"])
+                # the id may be a stale cache hit: drop it and force a real upload
+                get_upload_cache().invalidate(mid)
+                new_mid=self.upload_image_file(job["image_path"],
+                                               image_prep.image_aspect_for(aspect_ratio))
                 if new_mid:
-                    job["media_id"]=new_mid; mid=new_mid
-                    for mkey in models:
-                        try:
-                            data=_try(_make_body(mkey, mid, copies)); last_err=None; break
-                        except Exception as e2:
-                            last_err=e2
-                            if not _is_invalid(e2): break
+                    job["media_id"]=new_mid; mid=new_mid; self._wait_settle(mid)
+                    data, used, last_err = _walk()
             except Exception as e3:
                 last_err=e3
 
         # 3) Per-copy fallback (still invalid)
         job.setdefault("operation_names",[]); job.setdefault("video_by_idx", [None]*copies); job.setdefault("thumb_by_idx", [None]*copies); job.setdefault("op_index_map", {})
+        # what the poller needs to predict completion (see services.poll_schedule)
+        job["aspect"]=aspect_ratio; job["submitted_at"]=time.time()
         if data is None and last_err is not None:
             for k in range(copies):
                 for mkey in models:
@@ -226,18 +315,73 @@ class LabsFlowClient:
                         ops=dat.get("operations",[]) if isinstance(dat,dict) else []
                         if ops:
                             nm=(ops[0].get("operation") or {}).get("name") or ops[0].get("name") or ""
-                            if nm: job["operation_names"].append(nm); job["op_index_map"][nm]=k; break
+                            if nm:
+                                job["operation_names"].append(nm); job["op_index_map"][nm]=k
+                                job["model_key"]=mkey; break
                     except Exception: continue
             return len(job.get("operation_names",[]))
 
         # 4) Batch success
         ops=data.get("operations",[]) if isinstance(data,dict) else []
+        job["model_key"]=used
         for ci,op in enumerate(ops):
             nm=(op.get("operation") or {}).get("name") or op.get("name") or ""
             if nm: job["operation_names"].append(nm); job["op_index_map"][nm]=ci
         if job.get("operation_names"): job["status"]="PENDING"
         return len(job.get("operation_names",[]))
 
+    def start_batch(self, scenes: List[Tuple[Dict, Any, int]], model_key: str, aspect_ratio: str,
+                    project_id: Optional[str]=DEFAULT_PROJECT_ID
+                    ) -> Tuple[str, List[Tuple[int, int, str]]]:
+        """Start several scenes in one request. ``scenes`` are (job, prompt, copies) sharing model,
+        aspect and project, either all with a start image (media_id) or all without.
+
+        Every item goes out on the ladder's first rung for one bearer and is tagged with
+        ``metadata.sceneId``. Returns (model used, [(scene index, copy, operation name)] for every
+        item; the name is "" when the response has no operation for it). Errors are raised as is:
+        no ladder walk, re-upload or per-copy fallback - that is ``start_one``'s job."""
+        i2v=bool(scenes[0][0].get("media_id"))
+        tok=self._tok()
+        rungs=ladder_for(model_key, aspect_ratio, i2v)
+        model=self.ladder.order(rungs, tok, project_id, aspect_ratio)[0]
+        for job, _, _ in scenes:
+            self._wait_settle(job.get("media_id"))
+        reqs=[]
+        owners=[]
+        for si, (job, prompt, copies) in enumerate(scenes):
+            seed0=int(job.get("seed",0)) if str(job.get("seed","")).isdigit() else 0
+            text=_trim_prompt_text(prompt)
+            for k in range(max(1,int(copies))):
+                sid=str(uuid.uuid4())
+                item={"aspectRatio":aspect_ratio,"seed":seed0+k,"videoModelKey":model,
+                      "textInput":{"prompt":text},"metadata":{"sceneId":sid}}
+                if i2v:
+                    item["startImage"]={"mediaId":job["media_id"]}
+                reqs.append(item)
+                owners.append((si, k, sid))
+        body={"requests":reqs}
+        if project_id:
+            body["clientContext"]={"projectId":project_id}
+        try:
+            data=self._post(I2V_URL if i2v else T2V_URL, body, bearer=tok) or {}
+        except Exception as e:
+            self._emit("submit_batch_fallback", scenes=len(scenes), error=str(e)[:200])
+            raise
+        ops=data.get("operations",[]) if isinstance(data,dict) else []
+        # map operations back by the echoed sceneId, else by position
+        by_sid={op.get("sceneId"): op for op in ops if isinstance(op,dict) and op.get("sceneId")}
+        out=[]
+        for i, (si, k, sid) in enumerate(owners):
+            op=by_sid.get(sid) if by_sid else (ops[i] if i<len(ops) else None)
+            nm=""
+            if isinstance(op,dict):
+                nm=(op.get("operation") or {}).get("name") or op.get("name") or ""
+            out.append((si, k, nm))
+        if ops:
+            self.ladder.record_ok(model, tok, project_id, aspect_ratio, first=True)
+        self._emit("submit_batch", scenes=len(scenes), items=len(reqs), operations=len(ops))
+        return model, out
+
     def _wrap_ops(self, op_names: List[str])->dict:
         uniq=[]; seen=set()
         for s in op_names or []:
@@ -248,18 +392,8 @@ class LabsFlowClient:
         if not op_names: return {}
         data=self._post(BATCH_CHECK_URL, self._wrap_ops(op_names)) or {}
         out={}
-        def _dedup(xs):
-            seen=set(); r=[]
-            for x in xs:
-                if x not in seen: seen.add(x); r.append(x)
-            return r
         for item in data.get("operations",[]):
-            key=(item.get("operation") or {}).get("name") or item.get("name") or ""
-            st=_normalize_status(item)
-            urls=_collect_urls_any(item.get("response",{})) or _collect_urls_any(item)
-            vurls=[u for u in urls if "/video/" in u]; iurls=[u for u in urls if "/image/" in u]
-            out[key or "unknown"]={"status": ("COMPLETED" if st=="DONE" and vurls else ("DONE_NO_URL" if st=="DONE" else st)),
-                                   "video_urls": _dedup(vurls), "image_urls": _dedup(iurls), "raw": item}
+            out[op_extract.op_name(item) or "unknown"]=op_extract.summarize(item)
         return out
 
     def generate_videos_batch(self, prompt: str, num_videos: int = 1, model_key: str = "veo_3_1_t2v_fast_ultra", 
@@ -5,11 +5,17 @@ Implements video download using Google Veo API endpoints with quality selection
 """
 
 import os
+import queue
 import time
 from typing import Any, Dict, List, Optional, Tuple
 
 import requests
 
+from services import http_pool, op_extract, video_store
+from services.http_retry import get_breaker, server_delay
+from services.op_poller import get_poller
+from services.rate_limit import labs_limiter
+
 
 class VeoDownloader:
     """
@@ -29,6 +35,29 @@ class VeoDownloader:
         self.log = log_callback or print
         self.base_url = "https://aisandbox-pa.googleapis.com"
 
+    def _post(self, url: str, payload: dict):
+        """POST on the shared Labs session, paced by the per-bearer rate limiter and guarded by
+        the host's circuit breaker (services.http_retry)."""
+        breaker = get_breaker(url)
+        if breaker.allow() > 0:
+            raise requests.ConnectionError(f"CIRCUIT OPEN: {breaker.host} is failing")
+        labs_limiter().acquire(self.api_key)
+        try:
+            response = http_pool.session('labs').post(
+                url, headers=self._headers(), json=payload, timeout=(20, 180)
+            )
+        except requests.RequestException:
+            breaker.failure()
+            raise
+        if response.status_code >= 500:
+            breaker.failure()
+        else:
+            breaker.success()
+        if response.status_code == 429:
+            wait = server_delay(response.headers, response.text)
+            labs_limiter().pause(self.api_key, wait or 30.0)
+        return response
+
     def _headers(self) -> dict:
         """Generate headers for API requests"""
         return {
@@ -86,7 +115,7 @@ class VeoDownloader:
 
         try:
             self.log(f"[Veo] Generating {num_videos} video(s) at {quality}...")
-            response = requests.post(url, headers=self._headers(), json=payload, timeout=(20, 180))
+            response = self._post(url, payload)
             response.raise_for_status()
 
             data = response.json()
@@ -125,26 +154,20 @@ class VeoDownloader:
         payload = {"operations": operations}
 
         try:
-            response = requests.post(url, headers=self._headers(), json=payload, timeout=(20, 180))
+            response = self._post(url, payload)
             response.raise_for_status()
 
             data = response.json()
             results = {}
 
             for item in data.get("operations", []):
-                op_name = (item.get("operation") or {}).get("name") or item.get("name") or ""
-                if not op_name:
+                info = op_extract.extract(item)
+                if not info["name"]:
                     continue
-
-                # Determine status
-                status = self._normalize_status(item)
-
-                # Extract URLs
-                video_urls = self._extract_video_urls(item)
-
-                results[op_name] = {
-                    "status": status,
-                    "video_urls": video_urls,
+                results[info["name"]] = {
+                    "status": "COMPLETED" if info["state"] == "DONE" else info["state"],
+                    "video_urls": info["video_urls"],
+                    "image_urls": info["image_urls"],
                     "raw": item
                 }
 
@@ -154,69 +177,6 @@ class VeoDownloader:
             self.log(f"[Veo] Error checking status: {e}")
             return {}
 
-    def _normalize_status(self, item: dict) -> str:
-        """Normalize status from API response"""
-        if item.get("done") is True:
-            if item.get("error"):
-                return "FAILED"
-            return "COMPLETED"
-
-        status = item.get("status") or ""
-        if status in ("MEDIA_GENERATION_STATUS_SUCCEEDED", "SUCCEEDED", "SUCCESS"):
-            return "COMPLETED"
-        if status in ("MEDIA_GENERATION_STATUS_FAILED", "FAILED", "ERROR"):
-            return "FAILED"
-        return "PROCESSING"
-
-    def _extract_video_urls(self, item: dict) -> List[str]:
-        """Extract video URLs from API response"""
-        urls = []
-
-        # Check response field
-        response = item.get("response", {})
-        if response:
-            urls.extend(self._collect_urls(response))
-
-        # Check root level
-        urls.extend(self._collect_urls(item))
-
-        # Deduplicate and prioritize video URLs
-        video_urls = []
-        seen = set()
-        for url in urls:
-            if "/video/" in url and url not in seen:
-                video_urls.append(url)
-                seen.add(url)
-
-        return video_urls
-
-    def _collect_urls(self, obj: Any) -> List[str]:
-        """Recursively collect URLs from object"""
-        urls = []
-        url_keys = {
-            "gcsUrl", "gcsUri", "signedUrl", "signedUri",
-            "downloadUrl", "downloadUri", "videoUrl",
-            "url", "uri", "fileUri"
-        }
-
-        if isinstance(obj, dict):
-            for key, value in obj.items():
-                if key in url_keys and isinstance(value, str):
-                    is_valid_url = (
-                        value.startswith("http://") or
-                        value.startswith("https://") or
-                        value.startswith("gs://")
-                    )
-                    if is_valid_url:
-                        urls.append(value)
-                else:
-                    urls.extend(self._collect_urls(value))
-        elif isinstance(obj, list):
-            for item in obj:
-                urls.extend(self._collect_urls(item))
-
-        return urls
-
     def download_video(
         self,
         url: str,
@@ -237,29 +197,23 @@ class VeoDownloader:
         try:
             self.log(f"[Veo] Downloading video: {os.path.basename(output_path)}")
 
-            # Ensure output directory exists
-            os.makedirs(os.path.dirname(output_path), exist_ok=True)
-
-            # Download with streaming
-            with requests.get(url, stream=True, timeout=timeout, allow_redirects=True) as r:
-                r.raise_for_status()
+            # Linked from the local video store when this video was fetched before; otherwise
+            # parallel byte ranges into the store, where a dropped connection resumes from the
+            # last good offset instead of starting over (services.video_store, ranged_download)
+            last = [0]
 
-                total = int(r.headers.get('content-length', 0))
-                downloaded = 0
+            def _progress(done, total):
+                if total and done - last[0] >= total / 4:
+                    last[0] = done
+                    self.log(f"[Veo] Downloaded {done}/{total} bytes ({done * 100.0 / total:.1f}%)")
 
-                with open(output_path, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                            downloaded += len(chunk)
-
-                # Log progress
-                if total > 0:
-                    progress = (downloaded / total) * 100
-                    self.log(f"[Veo] Downloaded {downloaded}/{total} bytes ({progress:.1f}%)")
+            size, _, hit = video_store.fetch(url, output_path, timeout=(20, timeout),
+                                             on_progress=_progress)
+            if hit:
+                self.log("[Veo] Video already in the local store, linked without downloading")
 
             # Verify download
-            if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+            if size == 0 or not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
                 self.log("[Veo] Download verification failed - file empty or missing")
                 # Clean up empty or corrupted file
                 if os.path.exists(output_path):
@@ -274,55 +228,69 @@ class VeoDownloader:
             return True
 
         except Exception as e:
+            # the .part file is kept so the next attempt resumes where this one stopped
             self.log(f"[Veo] Download error: {e}")
-            # Clean up partial download on error
-            if os.path.exists(output_path):
-                try:
-                    os.remove(output_path)
-                    self.log("[Veo] Removed partial download")
-                except OSError:
-                    pass
             return False
 
+    def batch_check_operations(self, operation_names: List[str]) -> Dict[str, Dict[str, Any]]:
+        """LabsFlowClient-compatible alias so the shared OperationPoller can drive this client."""
+        return self.check_generation_status(operation_names)
+
     def poll_and_download(
         self,
         operation_names: List[str],
         output_dir: str,
         filename_prefix: str = "video",
         quality: str = "1080p",
-        max_polls: int = 120,
-        poll_interval: int = 5
+        max_polls: Optional[int] = None,
+        poll_interval: int = 5,
+        deadline_sec: Optional[float] = None,
+        model_key: Optional[str] = None,
+        aspect_ratio: Optional[str] = None
     ) -> List[Tuple[str, str]]:
         """
-        Poll operation status and auto-download completed videos.
+        Wait for operations through the shared OperationPoller and auto-download completed videos.
 
         Args:
             operation_names: List of operation names to poll
             output_dir: Directory to save downloaded videos
             filename_prefix: Prefix for output filenames
             quality: Quality indicator for filename
-            max_polls: Maximum number of polling attempts
-            poll_interval: Seconds between polls
+            max_polls: Legacy bound; if given, the wait is capped at max_polls * poll_interval
+            poll_interval: Seconds per poll round used for that bound; the poller sets the cadence
+            deadline_sec: Overall wait; defaults to the deadline learned for model_key/aspect_ratio
+            model_key: videoModelKey used for the operations (selects the learned ETA)
+            aspect_ratio: Aspect ratio used for the operations
 
         Returns:
             List of tuples (operation_name, local_path) for completed downloads
         """
         completed = []
-        pending = operation_names.copy()
+        pending = set(operation_names)
+        results: "queue.Queue" = queue.Queue()
+        poller = get_poller()
+        if deadline_sec is None:
+            deadline_sec = poller.schedule.plan(model_key, aspect_ratio)[1]
+        if max_polls:
+            deadline_sec = min(deadline_sec, max_polls * poll_interval)
+        poller.register(self, list(pending), queue=results, model=model_key,
+                        aspect=aspect_ratio, deadline_sec=deadline_sec)
+        deadline = time.time() + deadline_sec
+        self.log(f"[Veo] Waiting for {len(pending)} operation(s)...")
 
-        for poll_count in range(max_polls):
-            if not pending:
-                break
-
-            self.log(f"[Veo] Polling status (attempt {poll_count + 1}/{max_polls})...")
-            statuses = self.check_generation_status(pending)
-
-            still_pending = []
-            for op_name in pending:
-                status_info = statuses.get(op_name, {})
+        try:
+            while pending and time.time() < deadline:
+                try:
+                    wait = min(5.0, max(0.1, deadline - time.time()))
+                    op_name, status_info = results.get(timeout=wait)
+                except queue.Empty:
+                    continue
+                if op_name not in pending:
+                    continue
                 status = status_info.get("status", "PROCESSING")
 
                 if status == "COMPLETED":
+                    pending.discard(op_name)
                     video_urls = status_info.get("video_urls", [])
                     if video_urls:
                         # Download first video URL
@@ -338,19 +306,17 @@ class VeoDownloader:
                     else:
                         self.log(f"[Veo] No video URL for completed operation {op_name}")
                 elif status == "FAILED":
+                    pending.discard(op_name)
                     self.log(f"[Veo] Generation failed: {op_name}")
-                else:
-                    # Still processing
-                    still_pending.append(op_name)
-
-            pending = still_pending
-
-            if pending:
-                time.sleep(poll_interval)
+                elif status == "TIMEOUT":
+                    pending.discard(op_name)
+                    self.log(f"[Veo] Timed out: {op_name}")
+        finally:
+            poller.unregister(list(operation_names), queue=results)
 
         if pending:
             msg = f"[Veo] Warning: {len(pending)} operations still pending"
-            msg += f" after {max_polls} polls"
+            msg += f" after {int(deadline_sec)}s"
             self.log(msg)
 
         return completed
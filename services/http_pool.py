@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Shared keep-alive HTTP sessions.
+
+One pooled ``requests.Session`` per logical pool name ('labs', 'media', ...), created lazily
+and shared by every thread. Each session mounts an ``HTTPAdapter`` whose ``pool_maxsize``
+caps the number of open connections per host; ``pool_block`` makes extra callers wait for a
+free connection instead of opening (and tearing down) throwaway sockets.
+
+Knobs (config -> resilience.pool):
+    per_host   max keep-alive connections per host (default 8)
+    hosts      number of per-host pools kept alive (default 8)
+"""
+import threading
+from typing import Dict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.config import knob
+
+
+def _knob(name: str, default):
+    return knob('resilience.pool', name, default)
+
+
+_LOCK = threading.Lock()
+_SESSIONS: Dict[str, requests.Session] = {}
+
+
+def _build() -> requests.Session:
+    adapter = HTTPAdapter(pool_connections=int(_knob('hosts', 8)),
+                          pool_maxsize=int(_knob('per_host', 8)),
+                          pool_block=True, max_retries=0)
+    s = requests.Session()
+    s.mount('https://', adapter)
+    s.mount('http://', adapter)
+    return s
+
+
+def session(name: str = 'default') -> requests.Session:
+    """Return the process-wide pooled session for ``name`` (thread-safe, created once)."""
+    s = _SESSIONS.get(name)
+    if s is not None:
+        return s
+    with _LOCK:
+        s = _SESSIONS.get(name)
+        if s is None:
+            s = _build()
+            _SESSIONS[name] = s
+        return s
+
+
+def close_all():
+    """Close every pooled session (tests/benchmarks, or before the process exits)."""
+    with _LOCK:
+        for s in _SESSIONS.values():
+            try:
+                s.close()
+            except Exception:
+                pass
+        _SESSIONS.clear()
@@ -1,6 +1,37 @@
 # -*- coding: utf-8 -*-
-import time, random, requests
-from typing import Dict, Any, Tuple
+"""
+JSON requests with retries for the provider clients (services.api_clients).
+
+429/5xx and network errors are retried up to ``max_attempts``. When the server says how long
+to wait (``server_delay``: Retry-After, retry-after-ms, x-ratelimit-reset-*, Google's
+RetryInfo ``retryDelay``) that delay is used instead of jittered back-off; a delay over
+``max_retry_after_sec`` is not slept at all - the failure goes straight back so the caller can
+switch key or pause the token.
+
+Every host has a circuit breaker shared by all callers: ``failures`` consecutive 5xx/network
+errors open it, and calls then fail at once ("CIRCUIT OPEN") instead of tying up worker
+threads. After ``open_sec`` one probe call is let through (half-open); success closes the
+breaker, failure reopens it for twice as long (up to ``max_open_sec``). ``breakers()`` returns
+the state of every host. LabsFlowClient, VeoDownloader and the Gemini key rotator share the
+same breakers and ``server_delay``.
+
+Requests go out on the pooled keep-alive session (services.http_pool, pool "api").
+
+Knobs (config -> resilience): max_attempts (5), base_backoff_sec (1.2), max_backoff_sec (30),
+conn_timeout (15), read_timeout (60), max_retry_after_sec (60);
+resilience.breaker: failures (5), open_sec (30), max_open_sec (300)
+"""
+import random
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+
+from services import http_pool
 
 
 def _knob(name:str, default):
@@ -8,36 +39,173 @@ def _knob(name:str, default):
     c = load_config()
     return c.get('resilience', {}).get(name, default)
 
+def _breaker_knob(name:str, default):
+    return (_knob('breaker', {}) or {}).get(name, default)
+
 RETRY_STATUS = {429, 500, 502, 503, 504}
+_RETRY_DELAY = re.compile(r'retryDelay"?\s*[:=]\s*"?(\d+(?:\.\d+)?)s', re.I)
+_DURATION = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+_UNIT = {'ms': 0.001, 's': 1.0, 'm': 60.0, 'h': 3600.0}
 
-def _sleep(i:int):
+def _seconds(v:str) -> Optional[float]:
+    """"12", "1.5", epoch seconds, or a duration like "6m0s" / "250ms" -> seconds from now."""
+    try:
+        n = float(v)
+        return max(0.0, n - time.time()) if n > 1e9 else max(0.0, n)
+    except ValueError:
+        parts = _DURATION.findall(v)
+        return sum(float(n) * _UNIT[u] for n, u in parts) if parts else None
+
+def server_delay(headers:Dict[str,str]=None, body:str="") -> Optional[float]:
+    """Seconds the server asked the client to wait, or None if it did not say."""
+    h = {str(k).lower(): str(v).strip() for k, v in (headers or {}).items()}
+    if h.get('retry-after-ms'):
+        try:
+            return max(0.0, float(h['retry-after-ms']) / 1000.0)
+        except ValueError:
+            pass
+    if h.get('retry-after'):
+        v = _seconds(h['retry-after'])
+        if v is not None:
+            return v
+        try:
+            return max(0.0, parsedate_to_datetime(h['retry-after']).timestamp() - time.time())
+        except (TypeError, ValueError):
+            pass
+    resets = [_seconds(h[n]) for n in ('x-ratelimit-reset-requests', 'x-ratelimit-reset-tokens',
+                                       'x-ratelimit-reset', 'ratelimit-reset') if h.get(n)]
+    resets = [v for v in resets if v is not None]
+    if resets:
+        return max(resets)
+    m = _RETRY_DELAY.search(body or "")
+    return float(m.group(1)) if m else None
+
+def _sleep(i:int, delay:Optional[float]=None):
+    if delay is not None:
+        time.sleep(delay)
+        return
     # base_backoff_sec with full jitter; capped
     base = min((_knob('base_backoff_sec', 1.2) ** i), _knob('max_backoff_sec', 30.0))
     time.sleep(random.random() * base)
 
+
+class CircuitBreaker:
+    """closed -> open after ``failures`` consecutive failures -> half-open probe after
+    ``open_sec``."""
+
+    def __init__(self, host:str, failures:int=None, open_sec:float=None, max_open_sec:float=None):
+        self.host = host
+        self.threshold = max(1, int(failures or _breaker_knob('failures', 5)))
+        self.base_open = float(open_sec if open_sec is not None else _breaker_knob('open_sec', 30))
+        self.max_open = float(max_open_sec if max_open_sec is not None
+                              else _breaker_knob('max_open_sec', 300))
+        self.state = "closed"
+        self.failures = 0
+        self.trips = 0
+        self._open_for = self.base_open
+        self._opened_at = 0.0
+        self._probing = 0.0  # start of the half-open probe in flight
+        self._lock = threading.Lock()
+
+    def allow(self) -> float:
+        """0 if a call may go ahead now, else seconds until the breaker lets one through."""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == "open":
+                left = self._opened_at + self._open_for - now
+                if left > 0:
+                    return left
+                self.state, self._probing = "half_open", 0.0
+            if self.state == "half_open":
+                # one probe at a time; a probe that never reported back is replaced after open_sec
+                if self._probing and now - self._probing < self.base_open:
+                    return self._probing + self.base_open - now
+                self._probing = now
+            return 0.0
+
+    def success(self):
+        with self._lock:
+            self.state, self.failures, self._probing = "closed", 0, 0.0
+            self._open_for = self.base_open
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open":
+                self._open_for = min(self.max_open, self._open_for * 2)
+            elif self.state != "closed" or self.failures < self.threshold:
+                return
+            self.state, self._opened_at, self._probing = "open", time.monotonic(), 0.0
+            self.trips += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            left = 0.0
+            if self.state == "open":
+                left = max(0.0, self._opened_at + self._open_for - time.monotonic())
+            return {"host": self.host, "state": self.state, "failures": self.failures,
+                    "trips": self.trips, "retry_in": round(left, 1)}
+
+
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+_BREAKERS_LOCK = threading.Lock()
+
+def get_breaker(url:str) -> CircuitBreaker:
+    """The process-wide breaker of ``url``'s host."""
+    host = (urlsplit(url).netloc or url).lower()
+    with _BREAKERS_LOCK:
+        b = _BREAKERS.get(host)
+        if b is None:
+            b = _BREAKERS[host] = CircuitBreaker(host)
+        return b
+
+def breakers() -> List[Dict[str, Any]]:
+    """State of every host's breaker (closed / open / half_open)."""
+    with _BREAKERS_LOCK:
+        items = list(_BREAKERS.values())
+    return [b.snapshot() for b in items]
+
 def request_json(method:str, url:str, *, headers:Dict[str,str]=None, params:Dict[str,Any]=None,
-                 json_body:Any=None, data:Any=None, timeout=None) -> Tuple[bool, Any, str, int, Dict[str,str]]:
-    sess = requests.Session()
+                 json_body:Any=None, data:Any=None, timeout=None,
+                 retry_status=RETRY_STATUS) -> Tuple[bool, Any, str, int, Dict[str,str]]:
+    sess = http_pool.session('api')
     max_attempts = int(_knob('max_attempts', 5))
+    max_wait = float(_knob('max_retry_after_sec', 60.0))
     timeout = timeout or (_knob('conn_timeout', 15), _knob('read_timeout', 60))
+    breaker = get_breaker(url)
     last_err, last_code, last_headers = "", 0, {}
     for attempt in range(1, max_attempts+1):
+        wait = breaker.allow()
+        if wait > 0:
+            err = f"CIRCUIT OPEN: {breaker.host} is failing, retry in {wait:.0f}s"
+            return False, None, err, last_code, last_headers
         try:
             r = sess.request(method=method, url=url, headers=headers, params=params, json=json_body,
                              data=data, timeout=timeout)
-            last_code = r.status_code; last_headers = dict(r.headers or {})
-            if 200 <= r.status_code < 300:
-                try:
-                    return True, (r.json() if r.content else {}), "", r.status_code, last_headers
-                except Exception:
-                    return True, r.text, "", r.status_code, last_headers
-            if r.status_code in RETRY_STATUS:
-                last_err = f"HTTP {r.status_code}: {r.text[:300]}"
-                _sleep(attempt)
-                continue
-            return False, None, f"HTTP {r.status_code}: {r.text[:500]}", r.status_code, last_headers
         except requests.RequestException as e:
+            breaker.failure()
             last_err = f"REQ ERR: {e}"
-            _sleep(attempt)
+            if attempt < max_attempts:
+                _sleep(attempt)
+            continue
+        # only 5xx count against the host: 4xx (429 included) mean it is up and answering
+        if r.status_code >= 500:
+            breaker.failure()
+        else:
+            breaker.success()
+        last_code = r.status_code; last_headers = dict(r.headers or {})
+        if 200 <= r.status_code < 300:
+            try:
+                return True, (r.json() if r.content else {}), "", r.status_code, last_headers
+            except Exception:
+                return True, r.text, "", r.status_code, last_headers
+        if r.status_code in retry_status:
+            last_err = f"HTTP {r.status_code}: {r.text[:300]}"
+            delay = server_delay(last_headers, r.text)
+            if delay is not None and delay > max_wait:
+                break  # not worth holding the thread: the caller switches key / pauses the token
+            if attempt < max_attempts:
+                _sleep(attempt, delay)
             continue
+        return False, None, f"HTTP {r.status_code}: {r.text[:500]}", r.status_code, last_headers
     return False, None, last_err or "exhausted", last_code, last_headers
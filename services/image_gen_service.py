@@ -1,9 +1,10 @@
 # -*- coding: utf-8 -*-
-import os, base64, json, requests, mimetypes, uuid, time
+import os, base64, json, requests, mimetypes, uuid
 from typing import Optional, Dict, Any, List
 from services.core.api_config import GEMINI_IMAGE_MODEL, GEMINI_BASE, gemini_image_endpoint, IMAGE_GEN_TIMEOUT
 from services.core.key_manager import get_all_keys, refresh
 from services.core.api_key_rotator import APIKeyRotator, APIKeyRotationError
+from services.key_scheduler import get_key_scheduler
 
 
 class ImageGenError(Exception):
@@ -14,24 +15,24 @@ class ImageGenError(Exception):
 def _extract_image_from_response(data: dict) -> bytes:
     """
     Extract image bytes from Gemini API response
-    
+
     Args:
         data: JSON response from Gemini API
-        
+
     Returns:
         Image as bytes
-        
+
     Raises:
         ImageGenError: If image data cannot be extracted
     """
     candidates = data.get("candidates", [])
     if not candidates:
         raise ImageGenError("No candidates in response")
-    
+
     parts = candidates[0].get("content", {}).get("parts", [])
     if not parts:
         raise ImageGenError("No parts in candidate")
-    
+
     # Look for inline_data with image
     for part in parts:
         if "inline_data" in part:
@@ -40,49 +41,50 @@ def _extract_image_from_response(data: dict) -> bytes:
                 b64_data = part["inline_data"].get("data", "")
                 if b64_data:
                     return base64.b64decode(b64_data)
-    
+
     raise ImageGenError("No image data found in response")
 
 
-def generate_image_gemini(prompt: str, timeout: int = None, retry_delay: float = 15.0, enforce_rate_limit: bool = True, log_callback=None) -> bytes:
+def generate_image_gemini(prompt: str, timeout: int = None, retry_delay: float = 15.0,
+                          enforce_rate_limit: bool = True, log_callback=None,
+                          should_stop=None) -> bytes:
     """
     Generate image using Gemini Flash Image model with APIKeyRotator (PR#5)
-    
+
+    Keys come from the shared "gemini_image" scheduler, which waits only as long as the
+    chosen key's RPM/RPD window or cooldown requires (config -> labs.gemini_image).
+
     Args:
         prompt: Text prompt for image generation
         timeout: Request timeout in seconds (default from api_config)
-        retry_delay: Base delay before first API call (15.0s for Gemini free tier safety)
-        enforce_rate_limit: If True, wait before first API call (default True)
+        retry_delay: Ignored - kept for backwards compatibility
+        enforce_rate_limit: Ignored - the key scheduler always applies
         log_callback: Optional callback function for logging (receives string messages)
-        
+        should_stop: Optional callable; a pending rate-limit wait is abandoned when it returns True
+
     Returns:
         Generated image as bytes
-        
+
     Raises:
         ImageGenError: If generation fails
     """
     def log(msg):
         if log_callback:
             log_callback(msg)
-    
+
     timeout = timeout or IMAGE_GEN_TIMEOUT
     refresh()
     keys = get_all_keys('google')
     if not keys:
         raise ImageGenError("No Google API keys available")
-    
+
     log(f"[DEBUG] Tìm thấy {len(keys)} Google API keys")
-    
-    # Enforce rate limit before first call
-    if enforce_rate_limit:
-        log(f"[RATE LIMIT] Đợi {retry_delay}s trước khi gọi API...")
-        time.sleep(retry_delay)
-    
+
     # PR#5: Define API call function for APIKeyRotator
     def api_call_with_key(api_key: str) -> bytes:
         """Make API call with given key"""
         url = gemini_image_endpoint(api_key)
-        
+
         payload = {
             "contents": [{
                 "parts": [{
@@ -95,40 +97,49 @@ def generate_image_gemini(prompt: str, timeout: int = None, retry_delay: float =
                 "topP": 0.95,
             }
         }
-        
+
         response = requests.post(url, json=payload, timeout=timeout)
         response.raise_for_status()
-        
+
         data = response.json()
-        
+
         # Extract image data using helper
         return _extract_image_from_response(data)
-    
+
     # PR#5: Use APIKeyRotator
     try:
-        rotator = APIKeyRotator(keys, log_callback=log)
-        return rotator.execute(api_call_with_key)
+        rotator = APIKeyRotator(keys, log_callback=log, scheduler=get_key_scheduler("gemini_image"))
+        return rotator.execute(api_call_with_key, should_stop=should_stop)
     except APIKeyRotationError as e:
         raise ImageGenError(str(e))
 
 
 # New implementation: Intelligent rate-limited image generation with API key rotation
 def generate_image_with_rate_limit(
+    prompt: str = None,
+    api_keys: List[str] = None,
+    model: str = "gemini",
     aspect_ratio: str = "1:1",
+    size: str = None,
+    delay_before: float = 0,
+    rate_limit_delay: float = None,
+    max_calls_per_minute: int = None,
+    logger=None,
+    log_callback=None,
     reference_images: list = None,
+    text: str = None,
+    should_stop=None,
 ) -> Optional[bytes]:
     """
     Generate image with intelligent API key rotation and rate limiting
-    
-    This function uses the new APIKeyRotationManager to handle:
-    - Per-key usage tracking and cooldowns
-    - Exponential backoff (2s, 4s, 8s) on rate limits
-    - 60s cooldown after exhausting retries on a key
-    - Minimum 2s interval between calls on same key
-    - Smart rotation that skips rate-limited keys
-    
+
+    Keys are handed out by the shared "gemini_image" key scheduler:
+    - Per-key RPM/RPD windows and cooldowns, shared by every worker thread
+    - The earliest-available key first, so idle keys are used at once
+    - Retry-After aware cooldowns on 429, invalid keys skipped
+
     Args:
-        prompt: Image generation prompt (REQUIRED)
+        prompt: Image generation prompt (REQUIRED; ``text`` is accepted as an alias)
         api_keys: List of API keys to rotate through (optional, uses config if not provided)
         model: Model to use (gemini, dalle, imagen_4, etc.)
         aspect_ratio: Image aspect ratio (e.g., "9:16", "16:9", "1:1", "4:5")
@@ -138,40 +149,42 @@ def generate_image_with_rate_limit(
         max_calls_per_minute: Maximum API calls per minute (default 6)
         logger: Optional callback function for logging (alias for log_callback)
         log_callback: Optional callback function for logging
-        
+        should_stop: Optional callable; a pending rate-limit wait is abandoned when it returns True
+
         # Legacy parameters (kept for backwards compatibility, ignored):
-        delay_before: Ignored - rotation manager handles delays
+        delay_before: Ignored - the key scheduler handles delays
         size: Ignored - use aspect_ratio instead
-        rate_limit_delay: Ignored - rotation manager handles delays
-        max_calls_per_minute: Ignored - rotation manager handles rate limits
-    
+        rate_limit_delay: Ignored - the key scheduler handles delays
+        max_calls_per_minute: Ignored - set labs.gemini_image.rpm instead
+
     Returns:
         Generated image bytes or None if generation fails
-        
+
     Note:
         - For Imagen 4: Automatically normalizes 4:5 to 3:4 (closest supported ratio)
         - For Gemini: Accepts any aspect ratio from UI
-        - Legacy parameters (delay_before, size, etc.) are ignored - use new rotation manager
+        - Legacy parameters (delay_before, size, etc.) are ignored - use the key scheduler
     """
     # Support both logger and log_callback parameter names
     log_fn = logger or log_callback
-    
+    prompt = prompt if prompt is not None else (text or "")
+
     def log(msg):
         if log_fn:
             log_fn(msg)
-    
+
     # Load API keys if not provided
     if not api_keys:
         from services.core.key_manager import get_all_keys, refresh
         refresh()
         api_keys = get_all_keys('google')
-    
+
     if not api_keys:
         log("[ERROR] No Google API keys available")
         return None
-    
+
     log(f"[IMAGE GEN] Using {len(api_keys)} API keys with intelligent rotation")
-    
+
     # Normalize aspect ratio for Imagen 4
     normalized_ratio = aspect_ratio
     if model.lower() == 'imagen_4':
@@ -179,19 +192,19 @@ def generate_image_with_rate_limit(
         if aspect_ratio == "4:5":
             normalized_ratio = "3:4"
             log(f"[ASPECT RATIO] Normalized {aspect_ratio} to {normalized_ratio} for Imagen 4")
-    
+
     # Call appropriate generation function with key rotation
     try:
         if model.lower() in ("gemini", "imagen_4"):
             log(f"[IMAGE GEN] Tạo ảnh với {model}...")
-            
+
             # Build generation config with aspect ratio hint if provided
             generation_config = {
                 "temperature": 0.9,
                 "topK": 40,
                 "topP": 0.95,
             }
-            
+
             # Add aspect ratio to prompt for better results
             # Note: Gemini doesn't have explicit aspect_ratio parameter, so we enhance the prompt
             aspect_hint = ""
@@ -200,33 +213,35 @@ def generate_image_with_rate_limit(
                     aspect_hint = " (portrait orientation, vertical format)"
                 elif aspect_ratio in ("16:9", "21:9"):
                     aspect_hint = " (landscape orientation, horizontal format)"
-            
+
             enhanced_prompt = prompt + aspect_hint if aspect_hint else prompt
-            
+
+            parts = [{"text": enhanced_prompt}]
+
             # Use APIKeyRotator for key rotation with shared API call logic
             def api_call_with_key(api_key: str) -> bytes:
                 """Make API call with given key"""
                 url = gemini_image_endpoint(api_key)
-                
+
                 payload = {
                     "contents": [{
                         "parts": parts
                     }],
                     "generationConfig": generation_config
                 }
-                
+
                 response = requests.post(url, json=payload, timeout=IMAGE_GEN_TIMEOUT)
                 response.raise_for_status()
-                
+
                 data = response.json()
-                
+
                 # Extract image data using helper
                 return _extract_image_from_response(data)
-            
+
             # Use APIKeyRotator with provided keys
-            rotator = APIKeyRotator(api_keys, log_callback=log_fn)
-            return rotator.execute(api_call_with_key)
-            
+            rotator = APIKeyRotator(api_keys, log_callback=log_fn, scheduler=get_key_scheduler("gemini_image"))
+            return rotator.execute(api_call_with_key, should_stop=should_stop)
+
         elif model.lower() == "dalle":
             log(f"[IMAGE GEN] Tạo ảnh với DALL-E...")
             # Import DALL-E client if available
@@ -239,7 +254,7 @@ def generate_image_with_rate_limit(
         else:
             log(f"[ERROR] Unsupported model: {model}")
             return None
-        
+
     except Exception as e:
         log(f"[ERROR] Image generation failed: {str(e)[:200]}")
         return None
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Pre-upload normalisation of reference images.
+
+Phone photos are often 8-12 MB and sideways (EXIF orientation), while Labs only needs a
+frame-sized start image. ``prepare_image`` fixes the orientation, centre-crops to the target
+``IMAGE_ASPECT_RATIO_*``, shrinks the long side to ``max_side`` and re-encodes (JPEG or WebP)
+under a byte budget. Outputs are cached under ~/.veo_image_prep by source content hash +
+settings, so repeated runs cost one ``stat``. ``prepare_batch`` fills the cache for many
+images at once on a thread pool (Pillow releases the GIL while decoding, resizing and
+encoding, and threads need no ``multiprocessing.freeze_support()`` in the frozen app).
+
+If Pillow is missing or an image cannot be decoded, the original file is used unchanged.
+
+Off unless enabled in config: uploads are byte-for-byte the user's file by default.
+
+Knobs (config -> labs.image_prep): enabled (false), crop (false), max_side (1280),
+max_bytes (1500000), format ("JPEG"), workers (cpu count, max 4)
+"""
+import hashlib
+import io
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from services.upload_cache import file_digest
+from utils.config import knob
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".veo_image_prep")
+
+# width:height of each upload aspect hint
+ASPECTS = {
+    "IMAGE_ASPECT_RATIO_PORTRAIT": (9, 16),
+    "IMAGE_ASPECT_RATIO_LANDSCAPE": (16, 9),
+    "IMAGE_ASPECT_RATIO_SQUARE": (1, 1),
+}
+
+
+def _knob(name: str, default):
+    return knob('labs.image_prep', name, default)
+
+
+def image_aspect_for(video_aspect: Optional[str]) -> str:
+    """VIDEO_ASPECT_RATIO_X -> IMAGE_ASPECT_RATIO_X (portrait when unknown)."""
+    a = (video_aspect or "").replace("VIDEO_ASPECT_RATIO_", "IMAGE_ASPECT_RATIO_")
+    return a if a in ASPECTS else "IMAGE_ASPECT_RATIO_PORTRAIT"
+
+
+def _settings() -> Dict:
+    fmt = str(_knob('format', "JPEG")).upper()
+    return {"crop": bool(_knob('crop', False)), "max_side": int(_knob('max_side', 1280)),
+            "max_bytes": int(_knob('max_bytes', 1_500_000)),
+            "format": "WEBP" if fmt == "WEBP" else "JPEG"}
+
+
+def _cache_path(src: str, aspect: Optional[str], s: Dict) -> str:
+    sig = (f"{file_digest(src)}|{aspect if s['crop'] else ''}|{s['max_side']}|{s['max_bytes']}"
+           f"|{s['format']}")
+    ext = ".webp" if s["format"] == "WEBP" else ".jpg"
+    return os.path.join(CACHE_DIR, hashlib.sha256(sig.encode("utf-8")).hexdigest()[:32] + ext)
+
+
+def _encode(img, fmt: str, max_bytes: int) -> bytes:
+    """Encode with falling quality, then smaller size, until under ``max_bytes``."""
+    data = b""
+    for _ in range(6):
+        for q in (88, 80, 72, 64):
+            buf = io.BytesIO()
+            if fmt == "WEBP":
+                img.save(buf, "WEBP", quality=q, method=4)
+            else:
+                img.save(buf, "JPEG", quality=q, optimize=True, progressive=True)
+            data = buf.getvalue()
+            if len(data) <= max_bytes:
+                return data
+        img = img.resize((max(1, int(img.width * 0.8)), max(1, int(img.height * 0.8))))
+    return data
+
+
+def _render(src: str, dst: str, aspect: Optional[str], s: Dict) -> str:
+    from PIL import Image, ImageOps
+    with Image.open(src) as im:
+        im = ImageOps.exif_transpose(im)
+        if im.mode not in ("RGB", "L"):
+            im = im.convert("RGB")
+        ratio = ASPECTS.get(aspect or "")
+        if s["crop"] and ratio:
+            w, h = im.size
+            if w * ratio[1] <= h * ratio[0]:
+                tw, th = w, int(w * ratio[1] / ratio[0])
+            else:
+                tw, th = int(h * ratio[0] / ratio[1]), h
+            if (tw, th) != (w, h):
+                im = ImageOps.fit(im, (tw, th), method=Image.LANCZOS)
+        if max(im.size) > s["max_side"]:
+            im.thumbnail((s["max_side"], s["max_side"]), Image.LANCZOS)
+        data = _encode(im, s["format"], s["max_bytes"])
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=".tmp_prep_", dir=os.path.dirname(dst))
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp, dst)
+    return dst
+
+
+def _prepare(src: str, aspect: Optional[str], s: Dict) -> Dict:
+    src_bytes = os.path.getsize(src)
+    out = {"path": src, "src_bytes": src_bytes, "bytes": src_bytes, "cached": False, "error": ""}
+    try:
+        dst = _cache_path(src, aspect, s)
+        if os.path.exists(dst):
+            out["cached"] = True
+        else:
+            _render(src, dst, aspect, s)
+        size = os.path.getsize(dst)
+        if size < src_bytes or out["cached"] or s["crop"]:
+            out.update(path=dst, bytes=size)
+    except Exception as e:  # Pillow missing, unreadable image, ...
+        out["error"] = f"{e.__class__.__name__}: {e}"
+    return out
+
+
+def enabled() -> bool:
+    return bool(_knob('enabled', False))
+
+
+def prepare_image(path: str, aspect: Optional[str] = None) -> Dict:
+    """Normalised copy of ``path`` for upload.
+
+    Returns {"path", "src_bytes", "bytes", "cached", "error"}; ``path`` is the original file
+    when preprocessing is disabled or failed."""
+    if not enabled():
+        n = os.path.getsize(path)
+        return {"path": path, "src_bytes": n, "bytes": n, "cached": False, "error": ""}
+    return _prepare(path, aspect, _settings())
+
+
+def prepare_batch(paths: List[str], aspect: Optional[str] = None,
+                  workers: Optional[int] = None) -> Dict[str, Dict]:
+    """Prepare many images, decoding/encoding the uncached ones on a thread pool."""
+    uniq = list(dict.fromkeys(p for p in paths if p))
+    if not uniq or not enabled():
+        return {p: prepare_image(p, aspect) for p in uniq}
+    s = _settings()
+    out, todo = {}, []
+    for p in uniq:
+        try:
+            if os.path.exists(_cache_path(p, aspect, s)):
+                out[p] = _prepare(p, aspect, s)
+                continue
+        except OSError:
+            pass
+        todo.append(p)
+    n = max(1, min(len(todo), int(workers or _knob('workers', min(4, os.cpu_count() or 1)))))
+    if len(todo) > 1 and n > 1:
+        with ThreadPoolExecutor(max_workers=n, thread_name_prefix="image-prep") as ex:
+            results = ex.map(_prepare, todo, [aspect] * len(todo), [s] * len(todo))
+            for p, r in zip(todo, results):
+                out[p] = r
+        return out
+    for p in todo:
+        out[p] = _prepare(p, aspect, s)
+    return out
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Append-only, crash-safe journal of submitted Labs/Veo jobs.
+
+One JSONL file per project (``<download_root>/<project>/jobs.jsonl``). Every change to a job is
+appended as a full snapshot ``{"k": key, "job": {...}}`` and fsync'ed, so after a crash or
+restart ``replay()`` rebuilds the latest state of every job (last snapshot wins) and
+``pending()`` lists the ones whose operations still have to be polled or downloaded - they can
+be re-attached to the poller without submitting them again.
+
+A torn last line (power loss mid-write) is skipped on replay; ``{"reset": true}`` drops every
+earlier job and ``{"k": key, "drop": true}`` a single one. ``{"meta": {...}}`` records facts
+about the run that wrote the jobs (e.g. the manifest digest, see ``meta()``); a reset clears
+it. ``compact()`` rewrites the file with only the meta and the live snapshots.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Optional
+
+JOURNAL_NAME = "jobs.jsonl"
+
+# statuses after which nothing is left to poll (downloads are checked separately)
+FINAL_STATUSES = {"DOWNLOADED", "UPSCALED_4K", "FAILED", "FAILED_START", "UPLOAD_FAILED",
+                  "DONE_NO_URL", "TIMEOUT"}
+
+# in-memory only fields (Qt objects, back references)
+_VOLATILE = {"thumb_icons", "card"}
+
+
+def _plain(v: Any) -> Any:
+    if isinstance(v, (set, frozenset)):
+        return sorted(v)
+    if isinstance(v, dict):
+        return {str(k): _plain(x) for k, x in v.items()}
+    if isinstance(v, (list, tuple)):
+        return [_plain(x) for x in v]
+    if v is None or isinstance(v, (str, int, float, bool)):
+        return v
+    return str(v)
+
+
+def snapshot(job: Dict) -> Dict:
+    """JSON-safe copy of ``job`` (sets become sorted lists, Qt objects are dropped)."""
+    return {k: _plain(v) for k, v in job.items() if k not in _VOLATILE}
+
+
+def is_pending(job: Dict) -> bool:
+    """True if ``job`` has operations that still need polling or a finished video to download."""
+    ops = job.get("operation_names") or ([job["op"]] if job.get("op") else [])
+    if not ops:
+        return False
+    got = {i for i, u in enumerate(job.get("video_by_idx") or [], start=1) if u}
+    if got - set(job.get("downloaded_idx") or []):
+        return True
+    if job.get("url") and not job.get("path"):
+        return True
+    return job.get("status") not in FINAL_STATUSES
+
+
+class JobJournal:
+    """Thread-safe append-only journal stored at ``path``."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._last: Dict[str, str] = {}
+        self._torn = self._ends_torn()
+
+    @classmethod
+    def for_project(cls, project_dir: str) -> "JobJournal":
+        os.makedirs(project_dir, exist_ok=True)
+        return cls(os.path.join(project_dir, JOURNAL_NAME))
+
+    def _ends_torn(self) -> bool:
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() == 0:
+                    return False
+                f.seek(-1, os.SEEK_END)
+                return f.read(1) != b"\n"
+        except OSError:
+            return False
+
+    # ----- writing ------------------------------------------------------------------
+    def _append(self, rec: Dict):
+        line = json.dumps(rec, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with open(self.path, "a", encoding="utf-8") as f:
+            if self._torn:
+                # terminate a torn last line so this record is not glued onto it
+                f.write("\n")
+                self._torn = False
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def record(self, key: str, job: Dict):
+        """Append the current state of ``job``; unchanged snapshots are not written again."""
+        snap = snapshot(job)
+        enc = json.dumps(snap, ensure_ascii=False, sort_keys=True)
+        with self._lock:
+            if self._last.get(key) == enc:
+                return
+            self._append({"k": key, "t": round(time.time(), 3), "job": snap})
+            self._last[key] = enc
+
+    def drop(self, key: str):
+        with self._lock:
+            self._append({"k": key, "t": round(time.time(), 3), "drop": True})
+            self._last.pop(key, None)
+
+    def reset(self):
+        """Forget every job recorded so far (a new run replaces the project's jobs)."""
+        with self._lock:
+            self._append({"t": round(time.time(), 3), "reset": True})
+            self._last.clear()
+
+    def set_meta(self, meta: Dict):
+        """Record ``meta`` for the current run (merged into what ``meta()`` returns)."""
+        with self._lock:
+            self._append({"t": round(time.time(), 3), "meta": _plain(meta)})
+
+    # ----- reading ------------------------------------------------------------------
+    def replay(self) -> Dict[str, Dict]:
+        """Latest snapshot of every live job, in first-recorded order."""
+        return self._read()[0]
+
+    def meta(self) -> Dict:
+        """Meta recorded since the last reset (empty for journals written without any)."""
+        return self._read()[1]
+
+    def _read(self):
+        jobs: Dict[str, Dict] = {}
+        meta: Dict = {}
+        try:
+            f = open(self.path, "r", encoding="utf-8")
+        except OSError:
+            return jobs, meta
+        with f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue  # torn / partial line
+                if not isinstance(rec, dict):
+                    continue
+                if rec.get("reset"):
+                    jobs.clear()
+                    meta.clear()
+                    continue
+                if isinstance(rec.get("meta"), dict):
+                    meta.update(rec["meta"])
+                    continue
+                key = rec.get("k")
+                if key is None:
+                    continue
+                if rec.get("drop"):
+                    jobs.pop(key, None)
+                elif isinstance(rec.get("job"), dict):
+                    jobs[key] = rec["job"]
+        return jobs, meta
+
+    def pending(self) -> Dict[str, Dict]:
+        return {k: j for k, j in self.replay().items() if is_pending(j)}
+
+    def compact(self, keep: Optional[Dict[str, Dict]] = None):
+        """Atomically rewrite the journal with one snapshot per live job."""
+        with self._lock:
+            saved, meta = self._read()
+            jobs = saved if keep is None else {k: snapshot(j) for k, j in keep.items()}
+            d = os.path.dirname(self.path) or "."
+            fd, tmp = tempfile.mkstemp(prefix=".tmp_jobs_", dir=d)
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    if meta:
+                        f.write(json.dumps({"meta": meta}, ensure_ascii=False) + "\n")
+                    for k, j in jobs.items():
+                        line = json.dumps({"k": k, "job": j}, ensure_ascii=False,
+                                          separators=(",", ":"))
+                        f.write(line + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.path)
+            except Exception:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+                raise
+            self._torn = False
+            self._last = {k: json.dumps(j, ensure_ascii=False, sort_keys=True)
+                          for k, j in jobs.items()}
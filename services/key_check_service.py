@@ -1,6 +1,32 @@
 # -*- coding: utf-8 -*-
-import requests, datetime
-from typing import Tuple
+"""
+API key / token validation.
+
+``check(kind, key)`` validates one key with a blocking request. ``get_key_checker()`` wraps it
+for the UI: results are cached per (kind, key fingerprint) with their time in
+~/.veo_key_checks.json, so the last-known state is shown at once, and ``submit``/``check_many``
+validate many keys concurrently - at most ``concurrency`` checks per provider at a time,
+concurrent requests for one key sharing a check. A cached result is reused while it is
+younger than ``ttl_sec`` (``fail_ttl_sec`` for failures, which are often transient). The cache
+file is rewritten once the last in-flight check finishes, so a ``check_many`` batch costs one
+write, not one per key.
+
+Knobs (config -> labs.key_check): concurrency (6), ttl_sec (1800), fail_ttl_sec (60)
+"""
+import datetime
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from services import http_pool
+from services.key_health import fingerprint
+from utils.config import knob
+
+CACHE_PATH = os.path.join(os.path.expanduser("~"), ".veo_key_checks.json")
 
 # Constants
 MIN_JWT_TOKEN_LENGTH = 50  # Minimum expected length for JWT session tokens
@@ -23,22 +49,28 @@ def check(kind: str, key: str) -> Tuple[bool, str]:
         if kind in ('labs','google_labs','google labs'):
             url='https://aisandbox-pa.googleapis.com/v1/video:batchCheck'
             h={'authorization': f'Bearer {k}', 'content-type':'application/json'}
-            r=requests.post(url, json={}, headers=h, timeout=(10,20))
+            from services.rate_limit import labs_limiter
+            labs_limiter().acquire(k)  # counts against the same per-bearer quota as generation
+            r=http_pool.session('keycheck').post(url, json={}, headers=h, timeout=(10,20))
             if r.status_code in (200,400): return True, f'OK @ {_ts()}'
             if r.status_code in (401,403): return False, _fmt_err('Unauthorized', r)
             return False, _fmt_err('HTTP', r)
         if kind in ('google','gemini','google_api'):
-            r=requests.get('https://generativelanguage.googleapis.com/v1/models', params={'key':k}, timeout=(10,20))
+            r=http_pool.session('keycheck').get('https://generativelanguage.googleapis.com/v1/models',
+                                                params={'key':k}, timeout=(10,20))
             if r.status_code==200: return True, f'OK @ {_ts()}'
             if r.status_code in (401,403): return False, _fmt_err('Unauthorized', r)
             return False, _fmt_err('HTTP', r)
         if kind in ('eleven','elevenlabs'):
-            r=requests.get('https://api.elevenlabs.io/v1/user', headers={'xi-api-key':k}, timeout=(10,20))
+            r=http_pool.session('keycheck').get('https://api.elevenlabs.io/v1/user',
+                                                headers={'xi-api-key':k}, timeout=(10,20))
             if r.status_code==200: return True, f'OK @ {_ts()}'
             if r.status_code in (401,403): return False, _fmt_err('Unauthorized', r)
             return False, _fmt_err('HTTP', r)
         if kind in ('openai',):
-            r=requests.get('https://api.openai.com/v1/models', headers={'authorization': f'Bearer {k}'}, timeout=(10,20))
+            r=http_pool.session('keycheck').get('https://api.openai.com/v1/models',
+                                                headers={'authorization': f'Bearer {k}'},
+                                                timeout=(10,20))
             if r.status_code==200: return True, f'OK @ {_ts()}'
             if r.status_code in (401,403): return False, _fmt_err('Unauthorized', r)
             return False, _fmt_err('HTTP', r)
@@ -51,3 +83,155 @@ def check(kind: str, key: str) -> Tuple[bool, str]:
     except Exception as e:
         return False, f'ERR {e} @ {_ts()}'
     return False, 'Unknown kind'
+
+
+def _knob(name: str, default):
+    return knob('labs.key_check', name, default)
+
+
+def provider(kind: str) -> str:
+    """Canonical provider name of a ``check`` kind (cache and concurrency are per provider)."""
+    kind = (kind or '').lower()
+    if kind in ('labs', 'google_labs', 'google labs'):
+        return 'labs'
+    if kind in ('google', 'gemini', 'google_api'):
+        return 'google'
+    if kind in ('eleven', 'elevenlabs'):
+        return 'elevenlabs'
+    if kind in ('session', 'whisk_session'):
+        return 'session'
+    return kind
+
+
+class KeyChecker:
+    """Cached, concurrency-capped key validation on top of ``check``."""
+
+    def __init__(self, path: str = CACHE_PATH, concurrency: Optional[int] = None,
+                 ttl_sec: Optional[float] = None, fail_ttl_sec: Optional[float] = None,
+                 check_fn: Callable[[str, str], Tuple[bool, str]] = None):
+        self.path = path
+        self.concurrency = max(1, int(concurrency or _knob('concurrency', 6)))
+        self.ttl = float(ttl_sec if ttl_sec is not None else _knob('ttl_sec', 1800))
+        self.fail_ttl = float(fail_ttl_sec if fail_ttl_sec is not None
+                              else _knob('fail_ttl_sec', 60))
+        self._check = check_fn or check
+        self._lock = threading.Lock()
+        self._results: Dict[str, Dict] = self._load()
+        self._inflight: Dict[str, Future] = {}
+        self._dirty = False
+        self._pools: Dict[str, ThreadPoolExecutor] = {}
+
+    # ----- persistence ----------------------------------------------------------------
+    def _load(self) -> Dict[str, Dict]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return {k: v for k, v in (data or {}).items() if isinstance(v, dict)}
+        except Exception:
+            return {}
+
+    def _save(self):
+        # called with self._lock held
+        self._dirty = False
+        d = os.path.dirname(self.path) or "."
+        try:
+            fd, tmp = tempfile.mkstemp(prefix=".tmp_keychk_", dir=d)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self._results, f)
+            os.replace(tmp, self.path)
+        except Exception:
+            pass
+
+    def flush(self):
+        """Write results that are not on disk yet (checks still in flight hold the write back)."""
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    # ----- cache ----------------------------------------------------------------------
+    @staticmethod
+    def _id(kind: str, key: str) -> str:
+        return f"{provider(kind)}:{fingerprint((key or '').strip())}"
+
+    def cached(self, kind: str, key: str) -> Optional[Dict]:
+        """Last-known result ``{"ok", "msg", "at"}`` (even if stale), or None - no network I/O."""
+        with self._lock:
+            entry = self._results.get(self._id(kind, key))
+            return dict(entry) if entry else None
+
+    def is_fresh(self, entry: Optional[Dict]) -> bool:
+        if not entry:
+            return False
+        ttl = self.ttl if entry.get("ok") else self.fail_ttl
+        return time.time() - float(entry.get("at") or 0) < ttl
+
+    # ----- checking -------------------------------------------------------------------
+    def _pool(self, prov: str) -> ThreadPoolExecutor:
+        # called with self._lock held
+        pool = self._pools.get(prov)
+        if pool is None:
+            pool = self._pools[prov] = ThreadPoolExecutor(max_workers=self.concurrency,
+                                                          thread_name_prefix=f"keycheck-{prov}")
+        return pool
+
+    def _run(self, ident: str, kind: str, key: str) -> Tuple[bool, str]:
+        try:
+            ok, msg = self._check(kind, key)
+        except Exception as e:
+            ok, msg = False, f'ERR {e} @ {_ts()}'
+        with self._lock:
+            self._results[ident] = {"ok": bool(ok), "msg": msg, "at": time.time()}
+            self._inflight.pop(ident, None)
+            self._dirty = True
+            if not self._inflight:  # the last check of the batch writes the file
+                self._save()
+        return ok, msg
+
+    def submit(self, kind: str, key: str, callback: Optional[Callable[[bool, str], None]] = None,
+               force: bool = False) -> Future:
+        """Validate ``key`` on the provider's pool; the Future gives ``(ok, msg)``.
+
+        A fresh cached result is returned without a request unless ``force``; ``callback``
+        then runs on the calling thread, otherwise on a pool thread."""
+        key = (key or '').strip()
+        ident = self._id(kind, key)
+        with self._lock:
+            entry = self._results.get(ident)
+            fut = self._inflight.get(ident)
+            if fut is None and not force and self.is_fresh(entry):
+                fut = Future()
+                fut.set_result((bool(entry["ok"]), entry["msg"]))
+            elif fut is None:
+                pool = self._pool(provider(kind))
+                fut = self._inflight[ident] = pool.submit(self._run, ident, kind, key)
+        if callback is not None:
+            fut.add_done_callback(lambda f: callback(*f.result()))
+        return fut
+
+    def check_many(self, kind: str, keys: Iterable[str], force: bool = False,
+                   callback: Optional[Callable[[str, bool, str], None]] = None
+                   ) -> Dict[str, Tuple[bool, str]]:
+        """Validate all ``keys`` concurrently and wait; ``callback(key, ok, msg)`` as each
+        finishes."""
+        futs = {}
+        for key in dict.fromkeys((k or '').strip() for k in keys):
+            if key:
+                cb = (lambda ok, msg, k=key: callback(k, ok, msg)) if callback else None
+                futs[key] = self.submit(kind, key, cb, force=force)
+        return {k: f.result() for k, f in futs.items()}
+
+    def stale(self, kind: str, keys: Iterable[str]) -> List[str]:
+        """Keys with no cached result or one older than its TTL."""
+        return [k for k in keys if k and not self.is_fresh(self.cached(kind, k))]
+
+
+_CHECKER: Optional[KeyChecker] = None
+_CHECKER_LOCK = threading.Lock()
+
+
+def get_key_checker() -> KeyChecker:
+    global _CHECKER
+    with _CHECKER_LOCK:
+        if _CHECKER is None:
+            _CHECKER = KeyChecker()
+        return _CHECKER
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk health of API keys, so cooldowns and quota usage survive a restart.
+
+One record per (provider, key fingerprint) - the key itself is never written, only the first
+16 hex digits of its SHA-256:
+
+- ``cooldown_until``: epoch until which the key must not be used (429 / invalid key);
+- ``last_429``, ``strikes`` (consecutive 429s), ``invalid``;
+- ``day_count`` and ``day_reset``: requests made in the current quota day and when that day
+  ends - Google resets per-day quotas at midnight Pacific time (``quota_reset_after``).
+
+services.key_scheduler loads a key's record the first time it sees the key and writes every
+change back: cooldowns at once, usage counts at most every ``flush_sec`` (and at exit).
+Records whose cooldown and quota day have both passed are dropped on load.
+The store lives in ~/.veo_key_health.json.
+
+Knobs (config -> labs.key_health): enabled (true), flush_sec (5), reset_tz ("America/Los_Angeles")
+"""
+import atexit
+import datetime as _dt
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, Optional
+
+from utils.config import knob
+
+HEALTH_PATH = os.path.join(os.path.expanduser("~"), ".veo_key_health.json")
+
+
+def _knob(name: str, default):
+    return knob('labs.key_health', name, default)
+
+
+def fingerprint(key: str) -> str:
+    """Non-secret identity of a key."""
+    return hashlib.sha256((key or "").encode("utf-8")).hexdigest()[:16]
+
+
+def quota_reset_after(now: float, tz_name: Optional[str] = None) -> float:
+    """Epoch of the next midnight in ``tz_name`` (default: the reset_tz knob), i.e. the end of
+    the quota day ``now`` falls in. Without tz data it assumes UTC-8, which is never early."""
+    try:
+        from zoneinfo import ZoneInfo
+        tz = ZoneInfo(tz_name or _knob('reset_tz', "America/Los_Angeles"))
+    except Exception:
+        tz = _dt.timezone(_dt.timedelta(hours=-8))
+    local = _dt.datetime.fromtimestamp(now, tz)
+    nxt = (local + _dt.timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return nxt.timestamp()
+
+
+class KeyHealthStore:
+    """(provider, key fingerprint) -> health record, persisted as JSON."""
+
+    def __init__(self, path: str = HEALTH_PATH, flush_sec: Optional[float] = None):
+        self.path = path
+        self.flush_sec = float(flush_sec if flush_sec is not None else _knob('flush_sec', 5))
+        self._lock = threading.Lock()
+        self._records: Dict[str, Dict] = self._load()
+        self._dirty = False
+        self._saved_at = 0.0
+
+    # ----- persistence ----------------------------------------------------------------
+    def _load(self) -> Dict[str, Dict]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            return {}
+        now = time.time()
+        return {k: v for k, v in ((data or {}).get("keys") or {}).items()
+                if isinstance(v, dict) and max(float(v.get("cooldown_until") or 0),
+                                               float(v.get("day_reset") or 0)) > now}
+
+    def _save(self):
+        # called with self._lock held
+        d = os.path.dirname(self.path) or "."
+        try:
+            fd, tmp = tempfile.mkstemp(prefix=".tmp_keyhealth_", dir=d)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"version": 1, "keys": self._records}, f)
+            os.replace(tmp, self.path)
+            self._dirty = False
+            self._saved_at = time.monotonic()
+        except Exception:
+            pass
+
+    def flush(self):
+        """Write pending changes now."""
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    # ----- records --------------------------------------------------------------------
+    def get(self, provider: str, key: str) -> Optional[Dict]:
+        with self._lock:
+            rec = self._records.get(f"{provider}:{fingerprint(key)}")
+            return dict(rec) if rec else None
+
+    def update(self, provider: str, key: str, record: Dict, urgent: bool = False):
+        """Merge ``record`` into the key's entry; written at once when ``urgent`` (cooldowns),
+        else with the next write or after ``flush_sec``."""
+        with self._lock:
+            self._records.setdefault(f"{provider}:{fingerprint(key)}", {}).update(record)
+            self._dirty = True
+            if urgent or time.monotonic() - self._saved_at >= self.flush_sec:
+                self._save()
+
+    def records(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {k: dict(v) for k, v in self._records.items()}
+
+
+_STORE: Optional[KeyHealthStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_key_health() -> Optional[KeyHealthStore]:
+    """Process-wide store, or None when disabled (labs.key_health.enabled = false)."""
+    global _STORE
+    if not _knob('enabled', True):
+        return None
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = KeyHealthStore()
+            atexit.register(_STORE.flush)
+        return _STORE
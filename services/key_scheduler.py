@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+Per-key request scheduling for Google (Gemini) API keys, shared by every thread in the process.
+
+Each key has a sliding one-minute window of request times, a count of requests in the current
+quota day (Google resets per-day quotas at midnight Pacific time) and a cooldown.
+``reserve(keys)`` picks the key that can be used soonest, books a slot on it and returns
+``(key, wait)``; the caller sleeps ``wait`` (0 for an idle key) without holding any lock, so one
+throttled key never holds up work an idle key could do, and many workers can share the keys.
+
+Callers report how the call went:
+
+- ``success`` clears the key's 429 streak;
+- ``rate_limited`` (429 / quota) cools the key down for the server's Retry-After or
+  ``retryDelay`` when given, else ``cooldown_sec`` doubling per consecutive 429 up to
+  ``max_cooldown_sec``; a per-day quota 429 parks the key until the quota day ends;
+- ``invalid`` (401/403) parks the key for ``max_cooldown_sec``;
+- ``failed`` only counts the failure.
+
+``get_key_scheduler(name)`` returns the process-wide scheduler of one quota bucket: "gemini"
+for text calls, "gemini_image" for image generation (Google counts quota per model).
+services.core.api_key_rotator and both APIKeyRotationManager classes run on it.
+Cooldowns, 429 streaks and daily counts are kept in services.key_health, so a restart does
+not re-learn every exhausted key through 429s.
+
+rpm/rpd caps are off by default (0 = unlimited; a daily-quota 429 still parks the key until
+the quota day ends): set them to the key tier's limits to stay under quota without 429s.
+
+Knobs (config -> labs.<name>, falling back to labs.gemini): rpm (0), rpd (0),
+cooldown_sec (60), max_cooldown_sec (900), max_wait_sec (120)
+"""
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from services.http_retry import server_delay
+from services.key_health import KeyHealthStore, get_key_health, quota_reset_after
+from utils.config import knob
+
+
+def _knob(name: str, key: str, default):
+    return knob(f'labs.{name}', key, default, fallback='labs.gemini')
+
+
+def key_preview(key: str) -> str:
+    return f"...{key[-6:]}" if len(key) > 6 else "***"
+
+
+def classify(exc: BaseException) -> str:
+    """"invalid" (401/403), "rate_limited" (429/quota), "server" (5xx) or "error"."""
+    status = getattr(getattr(exc, 'response', None), 'status_code', None)
+    if isinstance(status, int):
+        # the message of an HTTPError carries the URL - and the key - so trust the status
+        if status in (401, 403):
+            return "invalid"
+        if status == 429:
+            return "rate_limited"
+        return "server" if status >= 500 else "error"
+    msg = str(exc).lower()
+    if any(s in msg for s in ('401', 'unauthorized', 'invalid api key', '403', 'forbidden',
+                              'permission_denied')):
+        return "invalid"
+    if any(s in msg for s in ('429', 'rate limit', 'quota', 'resource_exhausted',
+                              'too many requests')):
+        return "rate_limited"
+    if any(s in msg for s in ('500', '502', '503', '504')):
+        return "server"
+    return "error"
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Delay the server asked for (Retry-After, RetryInfo ``retryDelay``, ...; see http_retry)."""
+    resp = getattr(exc, 'response', None)
+    if resp is None:
+        return server_delay(None, str(exc))
+    try:
+        body = resp.text or str(exc)
+    except Exception:
+        body = str(exc)
+    return server_delay(getattr(resp, 'headers', None), body)
+
+
+def daily_quota(exc: BaseException) -> bool:
+    """True when a 429 names a per-day quota (e.g. ``GenerateRequestsPerDayPerProjectPerModel``)."""
+    resp = getattr(exc, 'response', None)
+    text = str(exc)
+    try:
+        text = (resp.text if resp is not None else "") or text
+    except Exception:
+        pass
+    return "perday" in text.lower()
+
+
+def wait_for(seconds: float, should_stop: Optional[Callable[[], bool]] = None) -> bool:
+    """Sleep ``seconds`` in short slices; False if ``should_stop`` fired first."""
+    end = time.monotonic() + seconds
+    while True:
+        if should_stop and should_stop():
+            return False
+        left = end - time.monotonic()
+        if left <= 0:
+            return True
+        time.sleep(min(left, 0.25))
+
+
+class _KeyState:
+    __slots__ = ("minute", "day_count", "day_reset", "cooldown_until", "strikes", "calls",
+                 "failures", "rate_limits", "last_429", "invalid")
+
+    def __init__(self):
+        self.minute = deque()  # booked request times (epoch), ascending
+        self.day_count = 0     # requests booked in the quota day ending at day_reset
+        self.day_reset = 0.0
+        self.cooldown_until = 0.0
+        self.strikes = 0
+        self.calls = 0
+        self.failures = 0
+        self.rate_limits = 0
+        self.last_429 = 0.0
+        self.invalid = False
+
+
+class KeyScheduler:
+    """RPM/RPD windows and cooldowns per key; hands out the earliest-available key."""
+
+    def __init__(self, name: str = "gemini", rpm: Optional[int] = None, rpd: Optional[int] = None,
+                 cooldown_sec: Optional[float] = None, max_cooldown_sec: Optional[float] = None,
+                 health: Optional[KeyHealthStore] = None):
+        self.name = name
+        self.health = health
+        self.rpm = int(rpm if rpm is not None else _knob(name, 'rpm', 0))
+        self.rpd = int(rpd if rpd is not None else _knob(name, 'rpd', 0))
+        self.cooldown_sec = float(cooldown_sec if cooldown_sec is not None
+                                  else _knob(name, 'cooldown_sec', 60))
+        self.max_cooldown_sec = float(max_cooldown_sec if max_cooldown_sec is not None
+                                      else _knob(name, 'max_cooldown_sec', 900))
+        self.max_wait_sec = float(_knob(name, 'max_wait_sec', 120))
+        self._lock = threading.Lock()
+        self._keys: Dict[str, _KeyState] = {}
+        self._cursor = 0
+
+    def _state(self, key: str) -> _KeyState:
+        st = self._keys.get(key)
+        if st is None:
+            st = self._keys[key] = _KeyState()
+            rec = self.health.get(self.name, key) if self.health else None
+            if rec:
+                now = time.time()
+                st.cooldown_until = float(rec.get("cooldown_until") or 0)
+                st.last_429 = float(rec.get("last_429") or 0)
+                st.strikes = int(rec.get("strikes") or 0)
+                st.invalid = bool(rec.get("invalid")) and st.cooldown_until > now
+                if float(rec.get("day_reset") or 0) > now:
+                    st.day_reset = float(rec["day_reset"])
+                    st.day_count = int(rec.get("day_count") or 0)
+        return st
+
+    def _persist(self, key: str, st: _KeyState, urgent: bool = True):
+        # called with self._lock held; cooldown changes are urgent, usage counts are batched
+        if self.health:
+            self.health.update(self.name, key, {
+                "cooldown_until": st.cooldown_until, "last_429": st.last_429, "strikes": st.strikes,
+                "invalid": st.invalid, "day_count": st.day_count, "day_reset": st.day_reset,
+            }, urgent=urgent)
+
+    def _free_at(self, st: _KeyState, now: float) -> float:
+        # earliest time a new request fits: bookings only ever go after the last one, so the
+        # minute window stays sorted and checking the rpm-th latest entry is enough
+        t = max(now, st.cooldown_until, st.minute[-1] if st.minute else 0.0)
+        while st.minute and st.minute[0] <= now - 60.0:
+            st.minute.popleft()
+        if self.rpm > 0 and len(st.minute) >= self.rpm:
+            t = max(t, st.minute[-self.rpm] + 60.0)
+        if now >= st.day_reset:
+            st.day_count = 0
+            st.day_reset = quota_reset_after(now)
+        if self.rpd > 0 and st.day_count >= self.rpd:
+            t = max(t, st.day_reset)
+        return t
+
+    def reserve(self, keys: List[str], exclude: Iterable[str] = (),
+                max_wait: Optional[float] = None) -> Tuple[Optional[str], float]:
+        """Book a request on the key usable soonest; returns (key, seconds to wait before using it).
+        (None, wait) - nothing booked - when every key is excluded or the best wait is over
+        ``max_wait``."""
+        exclude = set(exclude)
+        now = time.time()
+        with self._lock:
+            n = len(keys)
+            best, best_t, best_j = None, 0.0, 0
+            for j in range(n):
+                key = keys[(self._cursor + j) % n]
+                if not key or key in exclude:
+                    continue
+                t = self._free_at(self._state(key), now)
+                if best is None or t < best_t:
+                    best, best_t, best_j = key, t, j
+            if best is None:
+                return None, 0.0
+            wait = best_t - now
+            if max_wait is not None and wait > max_wait:
+                return None, wait
+            st = self._keys[best]
+            st.minute.append(best_t)
+            if best_t >= st.day_reset:  # booked into the next quota day
+                st.day_count = 0
+                st.day_reset = quota_reset_after(best_t)
+            st.day_count += 1
+            st.calls += 1
+            self._cursor = (self._cursor + best_j + 1) % n
+            self._persist(best, st, urgent=False)
+            return best, wait
+
+    def cancel(self, key: str):
+        """Give back the latest booking on ``key`` (the caller gave up before using it)."""
+        with self._lock:
+            st = self._state(key)
+            if st.minute:
+                st.minute.pop()
+            st.day_count = max(0, st.day_count - 1)
+            st.calls = max(0, st.calls - 1)
+
+    def success(self, key: str):
+        with self._lock:
+            st = self._state(key)
+            if st.strikes or st.invalid:
+                st.strikes = 0
+                st.invalid = False
+                self._persist(key, st)
+
+    def failed(self, key: str):
+        with self._lock:
+            self._state(key).failures += 1
+
+    def rate_limited(self, key: str, retry_after_sec: Optional[float] = None,
+                     daily: bool = False) -> float:
+        """Cool ``key`` down after a 429 (``daily``: its per-day quota is spent, so until the
+        quota day ends); returns the cooldown in seconds."""
+        now = time.time()
+        with self._lock:
+            st = self._state(key)
+            st.strikes += 1
+            st.failures += 1
+            st.rate_limits += 1
+            st.last_429 = now
+            if retry_after_sec is not None:
+                delay = min(float(retry_after_sec), self.max_cooldown_sec)
+            else:
+                delay = min(self.cooldown_sec * (2 ** (st.strikes - 1)), self.max_cooldown_sec)
+            if daily:
+                self._free_at(st, now)  # rolls day_reset forward if needed
+                st.day_count = max(st.day_count, self.rpd)
+                delay = max(delay, st.day_reset - now)
+            st.cooldown_until = max(st.cooldown_until, now + delay)
+            self._persist(key, st)
+            return delay
+
+    def invalid(self, key: str):
+        with self._lock:
+            st = self._state(key)
+            st.failures += 1
+            st.invalid = True
+            st.cooldown_until = max(st.cooldown_until, time.time() + self.max_cooldown_sec)
+            self._persist(key, st)
+
+    def cooldown_until(self, key: str) -> float:
+        with self._lock:
+            return self._state(key).cooldown_until
+
+    def stats(self, keys: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Per-key counters and availability (all keys seen so far when ``keys`` is None)."""
+        now = time.time()
+        with self._lock:
+            out = []
+            for key in (keys if keys is not None else list(self._keys)):
+                st = self._state(key)
+                free = self._free_at(st, now)
+                out.append({
+                    'key_preview': key_preview(key),
+                    'calls': st.calls,
+                    'failed_calls': st.failures,
+                    'rate_limit_hits': st.rate_limits,
+                    'last_minute': sum(1 for t in st.minute if t <= now),
+                    'today': st.day_count,
+                    'quota_reset_in': max(0.0, st.day_reset - now),
+                    'invalid': st.invalid,
+                    'cooldown_remaining': max(0.0, st.cooldown_until - now),
+                    'available_in': free - now,
+                })
+            return out
+
+
+_SCHEDULERS: Dict[str, KeyScheduler] = {}
+_SCHEDULERS_LOCK = threading.Lock()
+
+
+def get_key_scheduler(name: str = "gemini") -> KeyScheduler:
+    """Process-wide scheduler for one quota bucket (created on first use, with the on-disk
+    key health loaded)."""
+    with _SCHEDULERS_LOCK:
+        s = _SCHEDULERS.get(name)
+        if s is None:
+            s = _SCHEDULERS[name] = KeyScheduler(name, health=get_key_health())
+        return s
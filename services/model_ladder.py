@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Model fallback ladders for Labs video starts, with learned routing.
+
+``start_one`` tries the user's ``videoModelKey`` first and then walks the same-family
+fallbacks for the aspect ratio. ``ModelLadder`` remembers which rungs the backend rejected
+(400 / invalid argument) for a given bearer token, project and aspect and skips them for
+``fail_window_sec``. Later scenes of a project then start on the first request instead of
+paying one round trip per rejected rung. If every rung is marked bad the full ladder is
+tried again, so a transient rejection never blocks a project.
+
+Knobs (config -> labs.ladder): fail_window_sec (1800)
+"""
+import hashlib
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from utils.config import knob
+
+FALLBACKS_I2V = {
+    "VIDEO_ASPECT_RATIO_PORTRAIT": [
+        "veo_3_1_i2v_s_fast_portrait_ultra", "veo_3_1_i2v_s_fast_portrait",
+        "veo_3_1_i2v_s_portrait", "veo_3_1_i2v_s",
+    ],
+    "VIDEO_ASPECT_RATIO_LANDSCAPE": [
+        "veo_3_1_i2v_s_fast_ultra", "veo_3_1_i2v_s_fast", "veo_3_1_i2v_s"
+    ],
+    "VIDEO_ASPECT_RATIO_SQUARE": [
+        "veo_3_1_i2v_s_fast", "veo_3_1_i2v_s"
+    ],
+}
+FALLBACKS_T2V = {
+    "VIDEO_ASPECT_RATIO_PORTRAIT": [
+        "veo_3_1_t2v_fast_ultra", "veo_3_1_t2v"
+    ],
+    "VIDEO_ASPECT_RATIO_LANDSCAPE": [
+        "veo_3_1_t2v_fast_ultra", "veo_3_1_t2v"
+    ],
+    "VIDEO_ASPECT_RATIO_SQUARE": [
+        "veo_3_1_t2v_fast_ultra", "veo_3_1_t2v"
+    ],
+}
+
+
+def _knob(name: str, default):
+    return knob('labs.ladder', name, default)
+
+
+def ladder_for(model_key: str, aspect_ratio: str, i2v: bool) -> List[str]:
+    """User's model first, then the same-family fallbacks for the aspect."""
+    fallbacks = FALLBACKS_I2V if i2v else FALLBACKS_T2V
+    return [model_key] + [m for m in fallbacks.get(aspect_ratio, []) if m != model_key]
+
+
+def _fp(token: Optional[str]) -> str:
+    return hashlib.sha1((token or "").encode("utf-8")).hexdigest()[:12]
+
+
+class ModelLadder:
+    """Remembers rejected (token, project, aspect, model) rungs and skips them for a while."""
+
+    def __init__(self, fail_window_sec: Optional[float] = None):
+        self.window = float(fail_window_sec if fail_window_sec is not None
+                            else _knob('fail_window_sec', 1800))
+        self._lock = threading.Lock()
+        self._bad: Dict[Tuple[str, str, str, str], float] = {}
+        self.hits = 0      # scene started on the first rung tried
+        self.misses = 0    # rejected rungs (each one a wasted round trip)
+        self.skipped = 0   # rungs not tried because they were known to fail
+
+    def order(self, models: List[str], token: str, project_id: Optional[str],
+              aspect: str) -> List[str]:
+        """``models`` without the rungs known to fail for this token/project/aspect."""
+        now = time.time()
+        tk, pid = _fp(token), project_id or ""
+        with self._lock:
+            keep = [m for m in models if self._bad.get((tk, pid, aspect, m), 0) <= now]
+            if not keep:
+                return list(models)
+            self.skipped += len(models) - len(keep)
+        return keep
+
+    def record_ok(self, model: str, token: str, project_id: Optional[str], aspect: str,
+                  first: bool):
+        with self._lock:
+            self._bad.pop((_fp(token), project_id or "", aspect, model), None)
+            if first:
+                self.hits += 1
+
+    def record_fail(self, model: str, token: str, project_id: Optional[str], aspect: str):
+        with self._lock:
+            self._bad[(_fp(token), project_id or "", aspect, model)] = time.time() + self.window
+            self.misses += 1
+
+    def miss(self, n: int = 1):
+        """Count rejected rungs that are not remembered (the whole ladder failed)."""
+        with self._lock:
+            self.misses += n
+
+    def stats(self) -> Dict[str, int]:
+        now = time.time()
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "skipped": self.skipped,
+                    "known_bad": sum(1 for t in self._bad.values() if t > now)}
+
+    def reset(self):
+        with self._lock:
+            self._bad.clear()
+            self.hits = self.misses = self.skipped = 0
+
+
+_LADDER: Optional[ModelLadder] = None
+_LADDER_LOCK = threading.Lock()
+
+
+def get_ladder() -> ModelLadder:
+    global _LADDER
+    with _LADDER_LOCK:
+        if _LADDER is None:
+            _LADDER = ModelLadder()
+        return _LADDER
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Single-pass extraction of status / video URL / thumbnail URL / error from one Labs operation
+(an item of ``batchCheckAsyncVideoGenerationStatus`` -> ``operations``).
+
+Known locations are read first (``operation.metadata.video.fifeUrl`` ...). Only a finished
+operation (or one carrying a ``response``) whose video URL is not at a known location is
+scanned, and that scan is an iterative walk bounded by ``MAX_NODES``/``MAX_DEPTH`` with plain
+prefix checks instead of a regex per string. Operations still rendering - the bulk of every
+poll - cost a few dict lookups.
+
+Used by LabsFlowClient.batch_check_operations, VeoDownloader.check_generation_status and
+the text-to-video worker, so all three agree on what a finished operation looks like.
+"""
+from typing import Any, Dict, List, Tuple
+
+DONE_STATUSES = frozenset(("MEDIA_GENERATION_STATUS_SUCCESSFUL",
+                           "MEDIA_GENERATION_STATUS_SUCCEEDED", "SUCCEEDED", "SUCCESS"))
+FAILED_STATUSES = frozenset(("MEDIA_GENERATION_STATUS_FAILED", "FAILED", "ERROR"))
+
+_PREFIXES = ("http://", "https://", "gs://")
+
+# (path, kind) checked before any scan
+_KNOWN: Tuple[Tuple[Tuple[str, ...], str], ...] = (
+    (("operation", "metadata", "video", "fifeUrl"), "video"),
+    (("operation", "metadata", "video", "servingBaseUri"), "image"),
+    (("operation", "metadata", "video", "thumbnailUrl"), "image"),
+    (("response", "video", "fifeUrl"), "video"),
+)
+
+MAX_NODES = 2000
+MAX_DEPTH = 12
+
+
+def _is_url(s: str) -> bool:
+    return s[:8].lower().startswith(_PREFIXES)
+
+
+def _dig(obj: Any, path: Tuple[str, ...]) -> Any:
+    for k in path:
+        if not isinstance(obj, dict):
+            return None
+        obj = obj.get(k)
+    return obj
+
+
+def op_name(item: Dict) -> str:
+    return (item.get("operation") or {}).get("name") or item.get("name") or ""
+
+
+def normalize_status(item: Dict) -> str:
+    """DONE / FAILED / PROCESSING."""
+    if item.get("done") is True:
+        return "FAILED" if item.get("error") else "DONE"
+    s = item.get("status") or ""
+    if s in DONE_STATUSES:
+        return "DONE"
+    if s in FAILED_STATUSES:
+        return "FAILED"
+    return "PROCESSING"
+
+
+def _error(item: Dict) -> str:
+    for e in (item.get("error"), (item.get("operation") or {}).get("error")):
+        if isinstance(e, dict):
+            return str(e.get("message") or e.get("status") or e.get("code") or "")[:300]
+        if e:
+            return str(e)[:300]
+    return ""
+
+
+def _scan(obj: Any, videos: List[str], images: List[str], seen: set):
+    """Bounded iterative walk collecting media URLs (video first, then images)."""
+    stack = [(obj, 0, "")]
+    nodes = 0
+    while stack and nodes < MAX_NODES:
+        x, depth, key = stack.pop()
+        nodes += 1
+        if isinstance(x, dict):
+            if depth < MAX_DEPTH:
+                stack.extend((v, depth + 1, k) for k, v in reversed(list(x.items())))
+        elif isinstance(x, list):
+            if depth < MAX_DEPTH:
+                stack.extend((v, depth + 1, key) for v in reversed(x))
+        elif isinstance(x, str) and x not in seen and _is_url(x):
+            seen.add(x)
+            if "/video/" in x:
+                videos.append(x)
+            elif "/image/" in x or "thumbnail" in key.lower():
+                images.append(x)
+
+
+def extract(item: Dict) -> Dict[str, Any]:
+    """-> {"name", "state" (DONE/FAILED/PROCESSING), "video_urls", "image_urls", "error"}."""
+    state = normalize_status(item)
+    videos: List[str] = []
+    images: List[str] = []
+    seen: set = set()
+    for path, kind in _KNOWN:
+        v = _dig(item, path)
+        if isinstance(v, str) and v and v not in seen and _is_url(v):
+            seen.add(v)
+            (videos if kind == "video" else images).append(v)
+    if not videos and (state == "DONE" or "response" in item):
+        # unknown layout: scan "response" first so its URLs keep priority, then the rest
+        resp = item.get("response")
+        if resp:
+            _scan(resp, videos, images, seen)
+        _scan({k: v for k, v in item.items() if k != "response"}, videos, images, seen)
+    return {"name": op_name(item), "state": state, "video_urls": videos, "image_urls": images,
+            "error": _error(item) if state == "FAILED" else ""}
+
+
+def summarize(item: Dict) -> Dict[str, Any]:
+    """``batch_check_operations`` value: COMPLETED / DONE_NO_URL / FAILED / PROCESSING + URLs."""
+    x = extract(item)
+    st = x["state"]
+    if st == "DONE":
+        st = "COMPLETED" if x["video_urls"] else "DONE_NO_URL"
+    out = {"status": st, "video_urls": x["video_urls"], "image_urls": x["image_urls"], "raw": item}
+    if x["error"]:
+        out["error"] = x["error"]
+    return out
@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""
+Process-wide poller for Labs/Veo video operations.
+
+Every panel/worker registers the operation names it is waiting on; one background thread
+merges all of them into chunked ``batch_check_operations`` calls (grouped by token set, so
+projects sharing the same Labs tokens share requests) and fans each result out to the
+registered callbacks / queues. An operation stops being polled as soon as it reaches a
+terminal status; its last result stays available through ``latest()`` for result_ttl_sec
+after that (so late subscribers still get it), then it is evicted.
+
+When each operation is checked is decided by services.poll_schedule: young renders are
+checked with exponential back-off, renders near their learned completion time are checked
+often, and an operation that outlives its deadline is reported once with status TIMEOUT.
+
+A failed check backs off the whole chunk (per token group) only for 5xx, throttling and
+network errors. A 400/404 means some name in the chunk is bad, so the chunk is split in
+halves until the offending operations are isolated; only those are reported FAILED.
+
+Knobs (config -> labs.poll): chunk_size (50), max_backoff_sec (60), result_ttl_sec (600)
++ poll_schedule knobs
+"""
+import queue as _queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from services.poll_schedule import PollSchedule, get_schedule
+from utils.config import knob
+
+TERMINAL = {"COMPLETED", "FAILED", "DONE_NO_URL", "TIMEOUT"}
+
+
+def _knob(name: str, default):
+    return knob('labs.poll', name, default)
+
+
+def _http_status(exc: Exception) -> Optional[int]:
+    return getattr(getattr(exc, 'response', None), 'status_code', None)
+
+
+def _client_key(client) -> Any:
+    toks = getattr(client, 'tokens', None)
+    if toks:
+        return ('tokens',) + tuple(toks)
+    key = getattr(client, 'api_key', None)
+    return ('key', key) if key else ('id', id(client))
+
+
+class _Op:
+    __slots__ = ("name", "group", "callbacks", "queues", "model", "aspect",
+                 "submitted_at", "expected", "deadline", "polls", "next_due")
+
+    def __init__(self, name: str, group, model, aspect, submitted_at: float,
+                 expected: float, deadline: float):
+        self.name = name
+        self.group = group
+        self.callbacks: List[Callable[[str, Dict], None]] = []
+        self.queues: List[_queue.Queue] = []
+        self.model = model
+        self.aspect = aspect
+        self.submitted_at = submitted_at
+        self.expected = expected
+        self.deadline = deadline
+        self.polls = 0
+        self.next_due = 0.0
+
+
+class OperationPoller:
+    """Background batch poller shared by all callers (see module docstring)."""
+
+    def __init__(self, chunk_size: Optional[int] = None, schedule: Optional[PollSchedule] = None):
+        self.schedule = schedule or get_schedule()
+        self.chunk_size = max(1, int(chunk_size or _knob('chunk_size', 50)))
+        self.max_backoff = float(_knob('max_backoff_sec', 60.0))
+        self.result_ttl = float(_knob('result_ttl_sec', 600.0))
+        self._ops: Dict[str, _Op] = {}
+        self._clients: Dict[Any, Any] = {}
+        self._latest: Dict[str, Dict] = {}
+        self._latest_at: Dict[str, float] = {}  # when each result was stored (for eviction)
+        self._fails: Dict[Any, int] = {}
+        self._cv = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+        self.last_error: str = ""
+        self.requests_sent = 0
+
+    # ----- registration -------------------------------------------------------------
+    def register(self, client, names: Iterable[str], *,
+                 callback: Optional[Callable[[str, Dict], None]] = None,
+                 queue: Optional[_queue.Queue] = None,
+                 model: Optional[str] = None, aspect: Optional[str] = None,
+                 submitted_at: Optional[float] = None, deadline_sec: Optional[float] = None):
+        """Start (or keep) polling ``names`` with ``client``; results go to callback/queue.
+
+        ``model``/``aspect`` select the learned ETA, ``submitted_at`` (epoch seconds) gives the
+        age of the render and ``deadline_sec`` overrides the learned deadline."""
+        group = _client_key(client)
+        now = time.time()
+        start = float(submitted_at or now)
+        expected, deadline = self.schedule.plan(model, aspect)
+        if deadline_sec:
+            deadline = float(deadline_sec)
+        finished = []
+        with self._cv:
+            self._evict(now)
+            self._clients[group] = client
+            for nm in names:
+                if not nm:
+                    continue
+                done = self._latest.get(nm)
+                if done and done.get("status") in TERMINAL:
+                    # already finished: hand out the cached result instead of polling again
+                    finished.append((nm, done))
+                    continue
+                op = self._ops.get(nm)
+                if op is None:
+                    op = self._ops[nm] = _Op(nm, group, model, aspect, start, expected,
+                                             start + deadline)
+                    op.next_due = now + self.schedule.next_delay(now - start, expected, 0)
+                if callback and callback not in op.callbacks:
+                    op.callbacks.append(callback)
+                if queue is not None and queue not in op.queues:
+                    op.queues.append(queue)
+            self._ensure_thread()
+            self._cv.notify_all()
+        cbs = [callback] if callback else []
+        qs = [queue] if queue is not None else []
+        for nm, info in finished:
+            self._deliver_one(nm, info, cbs, qs)
+
+    def unregister(self, names: Iterable[str], *, callback=None, queue=None):
+        """Detach a subscriber; an operation nobody listens to any more is dropped."""
+        with self._cv:
+            for nm in names:
+                op = self._ops.get(nm)
+                if op is None:
+                    continue
+                if callback is None and queue is None:
+                    op.callbacks.clear()
+                    op.queues.clear()
+                if callback in op.callbacks:
+                    op.callbacks.remove(callback)
+                if queue in op.queues:
+                    op.queues.remove(queue)
+                if not op.callbacks and not op.queues:
+                    self._ops.pop(nm, None)
+
+    def latest(self, name: str) -> Optional[Dict]:
+        """Last known result for ``name`` (same shape as batch_check_operations values)."""
+        with self._cv:
+            return self._latest.get(name)
+
+    def snapshot(self, names: Iterable[str]) -> Dict[str, Dict]:
+        with self._cv:
+            return {n: self._latest[n] for n in names if n in self._latest}
+
+    def forget(self, names: Iterable[str]):
+        with self._cv:
+            for n in names:
+                self._latest.pop(n, None)
+                self._latest_at.pop(n, None)
+
+    def pending_count(self) -> int:
+        with self._cv:
+            return len(self._ops)
+
+    def stop(self):
+        with self._cv:
+            self._stopped = True
+            self._cv.notify_all()
+
+    def _store(self, name: str, info: Dict, now: float):
+        self._latest[name] = info
+        self._latest_at[name] = now
+
+    def _evict(self, now: float):
+        """Drop results older than result_ttl of operations nobody is polling any more."""
+        cutoff = now - self.result_ttl
+        for nm in [n for n, t in self._latest_at.items() if t < cutoff and n not in self._ops]:
+            self._latest.pop(nm, None)
+            self._latest_at.pop(nm, None)
+
+    # ----- worker -------------------------------------------------------------------
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped = False
+            self._thread = threading.Thread(target=self._loop, name="op-poller", daemon=True)
+            self._thread.start()
+
+    def _due(self, now: float):
+        """Split off expired operations and group the due ones into request chunks."""
+        expired, groups = [], {}
+        for nm, op in list(self._ops.items()):
+            if now >= op.deadline:
+                expired.append((nm, op))
+                self._ops.pop(nm, None)
+            elif now >= op.next_due:
+                groups.setdefault(op.group, []).append(nm)
+        batches = []
+        for group, names in groups.items():
+            client = self._clients.get(group)
+            for i in range(0, len(names), self.chunk_size):
+                batches.append((group, client, names[i:i + self.chunk_size]))
+        return expired, batches
+
+    def _reschedule(self, names: List[str], now: float, failed_group=None):
+        for nm in names:
+            op = self._ops.get(nm)
+            if op is None:
+                continue
+            if failed_group is not None:
+                fails = self._fails.get(failed_group, 1)
+                op.next_due = now + min(self.max_backoff, self.schedule.interval * (2 ** fails))
+            else:
+                op.polls += 1
+                delay = self.schedule.next_delay(now - op.submitted_at, op.expected, op.polls)
+                op.next_due = now + delay
+
+    def _loop(self):
+        while True:
+            with self._cv:
+                while not self._ops and not self._stopped:
+                    self._cv.wait()
+                if self._stopped:
+                    return
+                expired, batches = self._due(time.time())
+            for nm, op in expired:
+                info = {"status": "TIMEOUT", "video_urls": [], "image_urls": [], "raw": {},
+                        "error": f"no result after {int(op.deadline - op.submitted_at)}s"}
+                with self._cv:
+                    self._store(nm, info, time.time())
+                self._deliver_one(nm, info, list(op.callbacks), list(op.queues))
+            for group, client, names in batches:
+                try:
+                    rs = self._check(client, names)
+                except Exception as e:
+                    self.last_error = f"{e.__class__.__name__}: {e}"
+                    with self._cv:
+                        self._fails[group] = self._fails.get(group, 0) + 1
+                        self._reschedule(names, time.time(), failed_group=group)
+                    continue
+                with self._cv:
+                    self._fails.pop(group, None)
+                self._dispatch(rs)
+                with self._cv:
+                    self._reschedule(names, time.time())
+            with self._cv:
+                if self._stopped or not self._ops:
+                    continue
+                wake = min(min(op.next_due, op.deadline) for op in self._ops.values())
+                self._cv.wait(max(0.05, wake - time.time()))
+
+    def _check(self, client, names: List[str]) -> Dict[str, Dict]:
+        """``batch_check_operations(names)``; on a 400/404 bisect the chunk so only the names
+        the server rejects are failed. Other errors propagate (group back-off)."""
+        try:
+            self.requests_sent += 1
+            return client.batch_check_operations(names) or {}
+        except Exception as e:
+            if _http_status(e) not in (400, 404):
+                raise
+            if len(names) == 1:
+                return {names[0]: {"status": "FAILED", "video_urls": [], "image_urls": [],
+                                   "raw": {}, "error": f"{e.__class__.__name__}: {e}"}}
+            mid = len(names) // 2
+            rs = self._check(client, names[:mid])
+            rs.update(self._check(client, names[mid:]))
+            return rs
+
+    def _dispatch(self, rs: Dict[str, Dict]):
+        now = time.time()
+        learned, deliveries = [], []
+        with self._cv:
+            self._evict(now)
+            for nm, info in rs.items():
+                self._store(nm, info, now)
+                op = self._ops.get(nm)
+                if op is None:
+                    continue
+                deliveries.append((nm, info, list(op.callbacks), list(op.queues)))
+                if info.get("status") in TERMINAL:
+                    self._ops.pop(nm, None)
+                    if info.get("status") == "COMPLETED":
+                        learned.append((op.model, op.aspect, now - op.submitted_at))
+        for model, aspect, secs in learned:
+            self.schedule.record(model, aspect, secs)
+        for nm, info, cbs, qs in deliveries:
+            self._deliver_one(nm, info, cbs, qs)
+
+    @staticmethod
+    def _deliver_one(name: str, info: Dict, callbacks, queues):
+        for cb in callbacks:
+            try:
+                cb(name, info)
+            except Exception:
+                pass
+        for q in queues:
+            try:
+                q.put_nowait((name, info))
+            except Exception:
+                pass
+
+
+_POLLER: Optional[OperationPoller] = None
+_POLLER_LOCK = threading.Lock()
+
+
+def get_poller() -> OperationPoller:
+    """The process-wide poller (created on first use)."""
+    global _POLLER
+    with _POLLER_LOCK:
+        if _POLLER is None:
+            _POLLER = OperationPoller()
+        return _POLLER
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+ETA-aware polling schedule for Veo operations.
+
+Completion times are learned per (videoModelKey, aspect) from finished runs and kept in
+~/.veo_poll_stats.json. For each operation the schedule then decides when to check next:
+
+- young (age < ~0.8 x expected): exponential back-off from ``interval_sec`` up to
+  ``max_interval_sec``, but never past the moment the render is expected to finish;
+- around the expected completion: check every ``min_interval_sec``;
+- overdue: slowly widen again (10% of the age, capped at ``max_interval_sec``).
+
+Instead of a fixed number of rounds every operation gets a deadline of
+``deadline_factor`` x expected, clamped to [min_deadline_sec, max_deadline_sec].
+
+Knobs (config -> labs.poll): interval_sec (5), min_interval_sec (3), max_interval_sec (30),
+deadline_factor (4), min_deadline_sec (900), max_deadline_sec (3600)
+"""
+import json
+import os
+import statistics
+import tempfile
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from utils.config import knob
+
+STATS_PATH = os.path.join(os.path.expanduser("~"), ".veo_poll_stats.json")
+MAX_SAMPLES = 30
+DEFAULT_EXPECTED_SEC = 120.0
+
+
+def _knob(name: str, default):
+    return knob('labs.poll', name, default)
+
+
+def _key(model: Optional[str], aspect: Optional[str]) -> str:
+    return f"{model or '?'}|{aspect or '?'}"
+
+
+def _prior(model: Optional[str]) -> float:
+    """Initial guess before any run of this model has been observed."""
+    m = (model or "").lower()
+    if "fast" in m:
+        return 60.0
+    if "slow" in m or m.startswith("veo_2"):
+        return 240.0
+    return DEFAULT_EXPECTED_SEC
+
+
+class PollSchedule:
+    """Learns completion times and computes next-check delays and deadlines."""
+
+    def __init__(self, path: str = STATS_PATH):
+        self.path = path
+        self.interval = float(_knob('interval_sec', 5.0))
+        self.min_interval = float(_knob('min_interval_sec', 3.0))
+        self.max_interval = float(_knob('max_interval_sec', 30.0))
+        self.deadline_factor = float(_knob('deadline_factor', 4.0))
+        self.min_deadline = float(_knob('min_deadline_sec', 900.0))
+        self.max_deadline = float(_knob('max_deadline_sec', 3600.0))
+        self._lock = threading.Lock()
+        self._samples: Dict[str, List[float]] = self._load()
+
+    # ----- persistence ----------------------------------------------------------------
+    def _load(self) -> Dict[str, List[float]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return {k: [float(x) for x in v][-MAX_SAMPLES:] for k, v in (data or {}).items()
+                    if isinstance(v, list)}
+        except Exception:
+            return {}
+
+    def _save(self):
+        d = os.path.dirname(self.path) or "."
+        try:
+            fd, tmp = tempfile.mkstemp(prefix=".tmp_poll_", dir=d)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self._samples, f)
+            os.replace(tmp, self.path)
+        except Exception:
+            pass
+
+    # ----- learning -------------------------------------------------------------------
+    def record(self, model: Optional[str], aspect: Optional[str], seconds: float):
+        """Remember that an operation of this (model, aspect) finished after ``seconds``."""
+        if seconds <= 0:
+            return
+        with self._lock:
+            xs = self._samples.setdefault(_key(model, aspect), [])
+            xs.append(round(float(seconds), 1))
+            del xs[:-MAX_SAMPLES]
+            self._save()
+
+    def expected(self, model: Optional[str], aspect: Optional[str]) -> float:
+        """Median observed completion time, falling back to the model-level prior."""
+        with self._lock:
+            xs = self._samples.get(_key(model, aspect))
+            if not xs:
+                # same model, any aspect
+                prefix = f"{model or '?'}|"
+                xs = [x for k, v in self._samples.items() if k.startswith(prefix) for x in v]
+        return float(statistics.median(xs)) if xs else _prior(model)
+
+    # ----- scheduling -----------------------------------------------------------------
+    def next_delay(self, age: float, expected: float, polls: int) -> float:
+        """Seconds to wait before checking an operation that is ``age`` seconds old."""
+        if age < 0.8 * expected:
+            backoff = min(self.max_interval, self.interval * (2 ** max(0, polls)))
+            return max(self.min_interval, min(backoff, 0.8 * expected - age))
+        if age <= 1.5 * expected:
+            return self.min_interval
+        return max(self.min_interval, min(self.max_interval, 0.1 * age))
+
+    def deadline(self, expected: float) -> float:
+        """How long to keep polling an operation before giving up on it."""
+        return max(self.min_deadline, min(self.max_deadline, expected * self.deadline_factor))
+
+    def plan(self, model: Optional[str], aspect: Optional[str]) -> Tuple[float, float]:
+        """(expected seconds, deadline seconds) for a new operation."""
+        exp = self.expected(model, aspect)
+        return exp, self.deadline(exp)
+
+
+_SCHEDULE: Optional[PollSchedule] = None
+_SCHEDULE_LOCK = threading.Lock()
+
+
+def get_schedule() -> PollSchedule:
+    global _SCHEDULE
+    with _SCHEDULE_LOCK:
+        if _SCHEDULE is None:
+            _SCHEDULE = PollSchedule()
+        return _SCHEDULE
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Qt-free helpers shared by the Image2Video panel and the headless batch runner: prompt JSON
+parsing, project folder layout, file naming and the per-scene job dict.
+
+A job dict is what SubmissionEngine/start_one fill in and what the job journal persists:
+scene_id, prompt, image_path, media_id, operation_names, op_index_map, status,
+video_by_idx / thumb_by_idx (one slot per copy), downloaded_idx, completed_at.
+"""
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+IMAGE_GLOB = ("*.png", "*.jpg", "*.jpeg", "*.webp", "*.bmp")
+
+
+def safe_name(s: str) -> str:
+    s = s or ""
+    s = s.lower().strip()
+    s = re.sub(r"\s+", "_", s)
+    s = re.sub(r"[^a-z0-9._-]+", "_", s)
+    s = re.sub(r"_+", "_", s).strip("_")
+    return s or "project"
+
+
+def parse_prompt_any(obj) -> List[str]:
+    scenes = []
+
+    def _to_text(p):
+        if isinstance(p, str):
+            return p
+        try:
+            return json.dumps(p, ensure_ascii=False)
+        except Exception:
+            return str(p)
+    if isinstance(obj, list):
+        for it in obj:
+            if isinstance(it, dict) and "prompt" in it:
+                scenes.append(_to_text(it["prompt"]))
+            else:
+                scenes.append(_to_text(it))
+    elif isinstance(obj, dict):
+        if "scenes" in obj and isinstance(obj["scenes"], list):
+            for it in obj["scenes"]:
+                if isinstance(it, dict) and "prompt" in it:
+                    scenes.append(_to_text(it["prompt"]))
+                else:
+                    scenes.append(_to_text(it))
+        elif "prompt" in obj:
+            scenes.append(_to_text(obj["prompt"]))
+        else:
+            scenes.append(_to_text(obj))
+    return scenes
+
+
+def parse_prompt_file(path: str) -> List[str]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            obj = json.load(f)
+    except Exception:
+        return []
+    return parse_prompt_any(obj)
+
+
+def project_paths(project_dir: str) -> Dict[str, str]:
+    """Folder layout of one project (created if missing)."""
+    dirs = {
+        "root": os.path.dirname(project_dir),
+        "project": project_dir,
+        "prompts": os.path.join(project_dir, "Prompt video"),
+        "images": os.path.join(project_dir, "Ảnh tham chiếu"),
+        "videos": os.path.join(project_dir, "Video"),
+    }
+    for d in dirs.values():
+        os.makedirs(d, exist_ok=True)
+    return dirs
+
+
+def video_basename(project_name: str, scene_id: Any, copy_idx: int) -> str:
+    """``<project>_canh_<scene>_video_<n>`` (``copy_idx`` is 1-based)."""
+    return f"{safe_name(project_name)}_canh_{scene_id}_video_{copy_idx}"
+
+
+def new_job(scene_id: Any, prompt: str, image_path: Optional[str], copies: int) -> Dict:
+    return {"scene_id": f"{scene_id}", "prompt": prompt, "image_path": image_path,
+            "image_name": os.path.basename(image_path) if image_path else "",
+            "media_id": None, "operation_names": [], "status": "NEW",
+            "video_by_idx": [None] * copies, "thumb_by_idx": [None] * copies, "op_index_map": {},
+            "downloaded_idx": set(), "thumb_icons": {}, "completed_at": ""}
+
+
+def apply_op_result(job: Dict, name: str, info: Dict):
+    """Merge one poller/batch-check result for operation ``name`` into ``job``."""
+    vids = info.get("video_urls") or []
+    if vids:
+        ci = job.get("op_index_map", {}).get(name, 0)
+        job.setdefault("video_by_idx", [])
+        job.setdefault("thumb_by_idx", [])
+        while len(job["video_by_idx"]) <= ci:
+            job["video_by_idx"].append(None)
+            job["thumb_by_idx"].append(None)
+        if not job["video_by_idx"][ci]:
+            job["video_by_idx"][ci] = vids[0]
+        if info.get("image_urls"):
+            job["thumb_by_idx"][ci] = info["image_urls"][0]
+    job["status"] = info.get("status", "PROCESSING")
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Fair sharing of the Labs submission slots between projects that run at the same time.
+
+``FairSlotPool`` has ``slots`` concurrent submissions in total (normally tokens x
+workers_per_token). Each project's SubmissionEngine asks for a slot per scene; when a slot
+frees up it goes to the next waiting project by smooth weighted round-robin, never to a
+project already holding ``per_project_cap`` slots. A project with weight 2 therefore gets
+twice the submissions of a weight-1 project while both have scenes waiting, and a big
+project cannot starve a small one.
+
+The pool also counts what went through it, so ``report()`` gives aggregate throughput
+(scenes submitted and videos downloaded per minute) across all running projects.
+
+Knobs (config -> labs.scheduler): max_projects (3), per_project_cap (4), weights ({project: w})
+"""
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from utils.config import knob
+
+
+def _knob(name: str, default):
+    return knob('labs.scheduler', name, default)
+
+
+class _Project:
+    __slots__ = ("name", "weight", "current", "waiting", "grants", "active",
+                 "submitted", "videos", "started_at", "finished_at")
+
+    def __init__(self, name: str, weight: int):
+        self.name = name
+        self.weight = max(1, int(weight))
+        self.current = 0
+        self.waiting = 0
+        self.grants = 0
+        self.active = 0
+        self.submitted = 0
+        self.videos = 0
+        self.started_at = 0.0
+        self.finished_at = 0.0
+
+
+class FairSlotPool:
+    """Weighted round-robin admission of per-scene submissions (see module docstring)."""
+
+    def __init__(self, slots: int, per_project_cap: Optional[int] = None):
+        self.slots = max(1, int(slots))
+        self.per_project_cap = max(1, int(per_project_cap or _knob('per_project_cap', 4)))
+        self._cv = threading.Condition()
+        self._projects: Dict[str, _Project] = {}
+        self._t0 = 0.0
+
+    def _get(self, name: str) -> _Project:
+        p = self._projects.get(name)
+        if p is None:
+            weights = _knob('weights', {}) or {}
+            weight = weights.get(name, 1) if isinstance(weights, dict) else 1
+            p = self._projects[name] = _Project(name, weight)
+        return p
+
+    def set_weight(self, project: str, weight: int):
+        with self._cv:
+            self._get(project).weight = max(1, int(weight))
+
+    # ----- admission ------------------------------------------------------------------
+    def _dispatch(self):
+        busy = sum(p.active + p.grants for p in self._projects.values())
+        while busy < self.slots:
+            elig = [p for p in self._projects.values()
+                    if p.waiting > p.grants and p.active + p.grants < self.per_project_cap]
+            if not elig:
+                break
+            total = sum(p.weight for p in elig)
+            for p in elig:
+                p.current += p.weight
+            best = max(elig, key=lambda p: p.current)
+            best.current -= total
+            best.grants += 1
+            busy += 1
+        self._cv.notify_all()
+
+    def acquire(self, project: str, should_stop: Optional[Callable[[], bool]] = None) -> bool:
+        """Block until ``project`` is granted a slot; False if ``should_stop`` fired first."""
+        with self._cv:
+            p = self._get(project)
+            if not p.started_at:
+                p.started_at = time.time()
+                p.finished_at = 0.0
+                self._t0 = self._t0 or p.started_at
+            p.waiting += 1
+            self._dispatch()
+            while p.grants == 0:
+                if should_stop and should_stop():
+                    p.waiting -= 1
+                    self._dispatch()
+                    return False
+                self._cv.wait(0.25)
+            p.grants -= 1
+            p.waiting -= 1
+            p.active += 1
+            return True
+
+    def release(self, project: str, submitted: bool = True):
+        with self._cv:
+            p = self._get(project)
+            p.active = max(0, p.active - 1)
+            if submitted:
+                p.submitted += 1
+            self._dispatch()
+
+    # ----- accounting -----------------------------------------------------------------
+    def record_videos(self, project: str, n: int = 1):
+        with self._cv:
+            self._get(project).videos += n
+
+    def mark_finished(self, project: str):
+        with self._cv:
+            p = self._get(project)
+            p.finished_at = time.time()
+
+    def reset_stats(self):
+        with self._cv:
+            self._t0 = 0.0
+            for p in self._projects.values():
+                p.submitted = p.videos = 0
+                p.started_at = p.finished_at = 0.0
+
+    def report(self) -> Dict:
+        """Aggregate and per-project throughput since the first project started."""
+        now = time.time()
+        with self._cv:
+            elapsed = max(1e-6, now - self._t0) if self._t0 else 0.0
+            per = {}
+            for p in self._projects.values():
+                if not p.started_at:
+                    continue
+                dur = max(1e-6, (p.finished_at or now) - p.started_at)
+                per[p.name] = {"weight": p.weight, "active": p.active, "waiting": p.waiting,
+                               "submitted": p.submitted, "videos": p.videos,
+                               "done": bool(p.finished_at), "videos_per_min": p.videos * 60.0 / dur}
+            submitted = sum(x["submitted"] for x in per.values())
+            videos = sum(x["videos"] for x in per.values())
+            return {"elapsed_sec": elapsed, "submitted": submitted, "videos": videos,
+                    "scenes_per_min": submitted * 60.0 / elapsed if elapsed else 0.0,
+                    "videos_per_min": videos * 60.0 / elapsed if elapsed else 0.0,
+                    "running": sum(1 for x in per.values() if not x["done"]),
+                    "busy_slots": sum(p.active for p in self._projects.values()),
+                    "slots": self.slots, "projects": per}
+
+
+def max_parallel_projects() -> int:
+    return max(1, int(_knob('max_projects', 3)))
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel, resumable HTTP downloads for generated videos.
+
+``fetch(url, dest)`` probes the file with a one-byte ``Range`` request (signed storage URLs
+are only valid for GET, so no HEAD). If the server reports the size and accepts ranges,
+a file of at least ``2 x min_part_mb`` is split into up to ``parts`` byte ranges fetched on
+separate connections with ``chunk_kb`` reads. Everything is written into ``<dest>.part``;
+the progress of each range is saved next to it in ``<dest>.part.json``, so a dropped
+connection resumes from the last good offset - in the same call (``retries`` per range)
+or in a later call for the same file and size. The ``.part`` file is renamed to ``dest``
+only once every byte is in place, so ``dest`` never exists half-written. Each checkpoint
+fsyncs the ``.part`` data before it records the offsets, so after a crash the saved progress
+never points past bytes that did not reach the disk.
+
+Servers without range support get a single stream (restarted from zero on failure) through
+``services.stream_writer``. ``fetch_file`` also returns the file's digest.
+
+Knobs (config -> labs.download): parts (4), min_part_mb (4), chunk_kb (1024), retries (3)
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from services import http_pool, stream_writer
+from utils.config import knob
+
+
+def _knob(name: str, default):
+    return knob('labs.download', name, default)
+
+
+class DownloadError(IOError):
+    pass
+
+
+class DownloadStopped(DownloadError, stream_writer.Stopped):
+    """The caller's ``should_stop`` asked the download to end."""
+
+
+class _NoRanges(DownloadError):
+    """The server ignored a Range header after the probe said it supports ranges."""
+
+
+def probe(url: str, session=None, timeout=(20, 60)) -> Tuple[int, bool, str]:
+    """-> (size or 0 if unknown, accepts byte ranges, validator such as ETag)."""
+    s = session or http_pool.session('media')
+    with s.get(url, headers={"Range": "bytes=0-0"}, stream=True, timeout=timeout,
+               allow_redirects=True) as r:
+        r.raise_for_status()
+        tag = r.headers.get("ETag") or r.headers.get("Last-Modified") or ""
+        if r.status_code == 206:
+            total = (r.headers.get("Content-Range") or "").rpartition("/")[2]
+            return (int(total) if total.isdigit() else 0), True, tag
+        return int(r.headers.get("Content-Length") or 0), False, tag
+
+
+def _split(size: int, parts: int) -> List[List[int]]:
+    """[[start, end_inclusive, next_offset], ...] covering ``size`` bytes."""
+    step = -(-size // parts)
+    return [[a, min(size, a + step) - 1, a] for a in range(0, size, step)]
+
+
+def _save_state(path: str, state: Dict):
+    d = os.path.dirname(path) or "."
+    fd, tmp = tempfile.mkstemp(prefix=".dl_", dir=d)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+
+def _load_state(path: str, size: int, tag: str) -> Optional[List[List[int]]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            st = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if st.get("size") != size or (tag and st.get("tag") and st.get("tag") != tag):
+        return None
+    ranges = st.get("ranges")
+    return ranges if isinstance(ranges, list) and ranges else None
+
+
+class _Job:
+    """Shared progress of one ranged download."""
+
+    def __init__(self, url, part, state_path, size, tag, ranges, session, timeout, chunk,
+                 retries, on_progress, should_stop):
+        self.url, self.part, self.state_path = url, part, state_path
+        self.size, self.tag, self.ranges = size, tag, ranges
+        self.session, self.timeout, self.chunk, self.retries = session, timeout, chunk, retries
+        self.on_progress = on_progress
+        self.should_stop = should_stop or (lambda: False)
+        self.lock = threading.Lock()
+        self.saved_at = 0.0
+
+    def done_bytes(self) -> int:
+        return sum(r[2] - r[0] for r in self.ranges)
+
+    def checkpoint(self, force: bool = False):
+        now = time.time()
+        with self.lock:
+            if not force and now - self.saved_at < 1.0:
+                return
+            self.saved_at = now
+            state = {"size": self.size, "tag": self.tag, "ranges": [list(r) for r in self.ranges]}
+        # the offsets only count bytes already flushed by the range workers; make them durable
+        # before the state says they are there
+        with open(self.part, "r+b") as f:
+            os.fsync(f.fileno())
+        _save_state(self.state_path, state)
+
+    def run_range(self, rng: List[int]):
+        attempt = 0
+        while rng[2] <= rng[1]:
+            if self.should_stop():
+                raise DownloadStopped("stopped")
+            start = rng[2]
+            try:
+                hdr = {"Range": f"bytes={rng[2]}-{rng[1]}"}
+                with self.session.get(self.url, headers=hdr, stream=True, timeout=self.timeout,
+                                      allow_redirects=True) as r:
+                    r.raise_for_status()
+                    if r.status_code != 206:
+                        raise _NoRanges(f"range request answered {r.status_code}")
+                    with open(self.part, "r+b") as f:
+                        f.seek(rng[2])
+                        for data in r.iter_content(self.chunk):
+                            if not data:
+                                continue
+                            data = data[:rng[1] + 1 - rng[2]]
+                            f.write(data)
+                            f.flush()  # checkpoint() fsyncs through its own handle
+                            with self.lock:
+                                rng[2] += len(data)
+                            if self.on_progress:
+                                self.on_progress(self.done_bytes(), self.size)
+                            self.checkpoint()
+                            if rng[2] > rng[1] or self.should_stop():
+                                break
+                if rng[2] > start:
+                    attempt = 0
+                    continue
+                err: Exception = DownloadError("connection closed without data")
+            except DownloadError:
+                raise
+            except Exception as e:
+                err = e
+            # no progress on this pass (or an error): back off, resume from rng[2]
+            attempt += 1
+            if attempt > self.retries:
+                self.checkpoint(force=True)
+                raise err
+            time.sleep(min(8.0, 0.5 * 2 ** attempt))
+
+
+def _stream(url: str, dest: str, session, timeout, chunk: int, retries: int,
+            on_progress, should_stop) -> Tuple[int, str]:
+    """Single connection, no ranges: retried from zero (services.stream_writer)."""
+    for attempt in range(retries + 1):
+        try:
+            with session.get(url, stream=True, timeout=timeout, allow_redirects=True) as r:
+                r.raise_for_status()
+                return stream_writer.stream_response(r, dest, chunk, on_progress, should_stop)
+        except stream_writer.Stopped:
+            raise DownloadStopped("stopped")
+        except Exception:
+            if attempt >= retries:
+                raise
+        time.sleep(min(8.0, 0.5 * 2 ** (attempt + 1)))
+    return 0, ""
+
+
+def fetch(url: str, dest: str, **kw) -> int:
+    """Download ``url`` to ``dest`` (see module docstring); returns the file size."""
+    return fetch_file(url, dest, **kw)[0]
+
+
+def fetch_file(url: str, dest: str, *, session=None, timeout=(20, 300),
+               parts: Optional[int] = None, min_part_mb: Optional[float] = None,
+               chunk_kb: Optional[int] = None, retries: Optional[int] = None,
+               on_progress: Optional[Callable[[int, int], None]] = None,
+               should_stop: Optional[Callable[[], bool]] = None) -> Tuple[int, str]:
+    """Like ``fetch`` but returns (size, hex digest of the file)."""
+    s = session or http_pool.session('media')
+    parts = max(1, int(parts or _knob('parts', 4)))
+    min_part_mb = min_part_mb if min_part_mb is not None else _knob('min_part_mb', 4)
+    min_part = int(float(min_part_mb) * (1 << 20))
+    chunk = max(8192, int(chunk_kb or _knob('chunk_kb', 1024)) * 1024)
+    retries = int(retries if retries is not None else _knob('retries', 3))
+    d = os.path.dirname(dest)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    part, state_path = dest + ".part", dest + ".part.json"
+
+    size, ranged, tag = probe(url, s)
+    if not (ranged and size > 0):
+        got, digest = _stream(url, dest, s, timeout, chunk, retries, on_progress, should_stop)
+        if got == 0:
+            raise DownloadError("empty download")
+        return got, digest
+
+    ranges = _load_state(state_path, size, tag) if os.path.exists(part) else None
+    if ranges is None:
+        n = max(1, min(parts, size // max(1, min_part)))
+        ranges = _split(size, n)
+        with open(part, "wb") as f:
+            f.truncate(size)
+    job = _Job(url, part, state_path, size, tag, ranges, s, timeout, chunk, retries, on_progress,
+               should_stop)
+    job.checkpoint(force=True)
+    todo = [r for r in ranges if r[2] <= r[1]]
+    try:
+        if len(todo) <= 1:
+            for r in todo:
+                job.run_range(r)
+        else:
+            with ThreadPoolExecutor(max_workers=len(todo)) as ex:
+                for f in [ex.submit(job.run_range, r) for r in todo]:
+                    f.result()
+    except _NoRanges:
+        for p in (part, state_path):
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+        return _stream(url, dest, s, timeout, chunk, retries, on_progress, should_stop)
+    if job.done_bytes() != size or os.path.getsize(part) != size:
+        job.checkpoint(force=True)
+        raise DownloadError(f"incomplete download {job.done_bytes()}/{size}")
+    # ranges arrive out of order, so the digest is one sequential pass over the finished file
+    digest = stream_writer.file_digest(part, chunk)
+    # the range workers wrote through their own handles: make the data durable before the
+    # rename, or a crash could leave a complete-looking ``dest`` with unwritten blocks
+    with open(part, "r+b") as f:
+        os.fsync(f.fileno())
+    os.replace(part, dest)
+    try:
+        os.remove(state_path)
+    except OSError:
+        pass
+    return size, digest
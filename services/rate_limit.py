@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Token-bucket rate limiting.
+
+``TokenBucket`` refills at ``rate`` tokens/second up to ``burst``. Callers *reserve* a token
+and are told how long to wait for it, so concurrent threads queue up fairly behind each other
+instead of all sleeping a fixed amount. ``KeyedRateLimiter`` keeps one bucket per key
+(e.g. per Labs bearer token).
+
+``labs_limiter()`` is the process-wide limiter every Labs call path acquires per bearer
+(LabsFlowClient, VeoDownloader, api_clients.labs_call, key checks), so the request rate per
+token is bounded no matter how many panels, workers and clients share it. A 429 pauses that
+bearer's bucket for the Retry-After time, so callers wait instead of retrying into the limit.
+``labs_limiter("poll")`` is a separate budget for batchCheck polling, so status checks never
+queue behind uploads and starts (and vice versa).
+
+Labs documents no per-token request quota; the only signal is a 429 with Retry-After. So the
+shipped default is rpm 0 = unlimited: buckets hand out tokens at once and only 429 pauses
+pace a bearer. Set rpm once a real quota has been measured (``labs_quota()`` is what the
+submission pool is sized against).
+
+Knobs (config -> labs.rate): rpm (0 = unlimited), burst (3), poll_rpm (0), poll_burst (3);
+older configs' labs.submit.rpm/burst are honoured.
+"""
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from utils.config import knob
+
+
+def _knob(name: str, default):
+    return knob('labs.rate', name, default, fallback='labs.submit')
+
+
+class TokenBucket:
+    """Thread-safe token bucket; ``rate`` is tokens per second (0 = unlimited, only ``pause``
+    holds callers back), ``burst`` the bucket size."""
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.rate = max(0.0, float(rate))
+        self.burst = max(1.0, float(burst))
+        self._tokens = self.burst
+        self._stamp = time.monotonic()
+        self._paused_until = 0.0  # monotonic; also holds back callers already waiting
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def reserve(self, n: float = 1.0) -> float:
+        """Take ``n`` tokens now (possibly going into debt); return seconds to wait before use."""
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= n
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def pause(self, seconds: float):
+        """Hand out nothing for the next ``seconds`` (e.g. after a 429 with Retry-After)."""
+        with self._lock:
+            now = time.monotonic()
+            if self.rate:
+                self._refill(now)
+                self._tokens = min(self._tokens, 0.0) - max(0.0, seconds) * self.rate
+            self._paused_until = max(self._paused_until, now + max(0.0, seconds))
+
+    def acquire(self, n: float = 1.0, should_stop: Optional[Callable[[], bool]] = None) -> float:
+        """Block until ``n`` tokens are available; returns the time waited.
+        A ``pause`` that comes in while waiting extends the wait."""
+        start = time.monotonic()
+        end = start + self.reserve(n)
+        while True:
+            now = time.monotonic()
+            left = max(end, self._paused_until) - now
+            if left <= 0 or (should_stop and should_stop()):
+                return now - start
+            time.sleep(min(left, 0.25))
+
+
+class KeyedRateLimiter:
+    """One ``TokenBucket`` per key, created on first use."""
+
+    def __init__(self, per_minute: float, burst: float = 1.0):
+        self.rate = float(per_minute) / 60.0
+        self.burst = burst
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, key: str) -> TokenBucket:
+        with self._lock:
+            b = self._buckets.get(key)
+            if b is None:
+                b = self._buckets[key] = TokenBucket(self.rate, self.burst)
+            return b
+
+    def acquire(self, key: str, should_stop: Optional[Callable[[], bool]] = None) -> float:
+        return self.bucket(key).acquire(should_stop=should_stop)
+
+    def pause(self, key: str, seconds: float):
+        self.bucket(key).pause(seconds)
+
+
+_LABS: Dict[str, KeyedRateLimiter] = {}
+_LABS_LOCK = threading.Lock()
+
+
+def labs_quota(kind: str = "submit") -> Tuple[float, float]:
+    """(requests per minute, burst) per bearer for ``kind`` ("submit" or "poll"); rpm 0 = none."""
+    pre = "poll_" if kind == "poll" else ""
+    return max(0.0, float(_knob(pre + 'rpm', 0) or 0)), float(_knob(pre + 'burst', 3) or 1)
+
+
+def labs_limiter(kind: str = "submit") -> KeyedRateLimiter:
+    """Process-wide per-bearer limiter for Labs calls of ``kind`` (created on first use)."""
+    with _LABS_LOCK:
+        lim = _LABS.get(kind)
+        if lim is None:
+            lim = _LABS[kind] = KeyedRateLimiter(*labs_quota(kind))
+        return lim
@@ -1,8 +1,12 @@
 # -*- coding: utf-8 -*-
-import os, time
+import os, queue
 from typing import List, Dict, Any
 from utils import config as cfg
 from services.labs_flow_service import LabsClient, DEFAULT_PROJECT_ID
+from services import video_store
+from services.image_prep import image_aspect_for
+from services.op_poller import get_poller
+from services.submit_batcher import SubmitBatcher
 
 _RATIO_MAP = {
     '16:9': 'VIDEO_ASPECT_RATIO_LANDSCAPE',
@@ -28,53 +32,66 @@ def start_pipeline(project_name:str, ratio_str:str, scenes:List[Dict[str,Any]],
     client = LabsClient(tokens, on_event=None)
     aspect = _aspect(ratio_str)
 
+    # uploads are cached by content hash, so re-running a project reuses the product image id
     media_id = None
+    ref_img = (product_imgs or model_imgs or [None])[0]
     try:
-        if product_imgs: media_id = client.upload_image_file(product_imgs[0])
-        elif model_imgs: media_id = client.upload_image_file(model_imgs[0])
+        if ref_img: media_id = client.upload_image_file(ref_img, image_aspect_for(aspect))
     except Exception:
         media_id = None
 
-    jobs = []
+    # scenes share start requests (same model/aspect/image), see services.submit_batcher
+    items = []
     for sc in scenes:
-        body = {"project": project_name, "scene": sc.get("index"), "media_id": media_id}
+        # image_path lets start_one re-upload if a cached id has gone stale
+        body = {"project": project_name, "scene": sc.get("index"), "media_id": media_id,
+                "image_path": ref_img if media_id else None}
         prompt_json = {"objective": sc.get("prompt_video") or sc.get("desc") or "", "language": lang, "image_style": image_style}
-        rc = client.start_one(body, model_key="auto", aspect_ratio=aspect, prompt_text=prompt_json, copies=max(1, int(copies)), project_id=proj_id)
-        op_names = body.get("operation_names") or getattr(client, "last_operation_names", []) or []
+        items.append({"job": body, "model": "auto", "aspect": aspect, "prompt": prompt_json,
+                      "copies": max(1, int(copies)), "project_id": proj_id})
+    SubmitBatcher(client).start_many(items)
+
+    jobs = []
+    for sc, it in zip(scenes, items):
+        body = it["job"]
+        op_names = body.get("operation_names") or []
         for nm in op_names:
-            jobs.append({"scene": sc.get("index"), "copy": 1, "op": nm})
+            jobs.append({"scene": sc.get("index"), "copy": 1, "op": nm, "model_key": body.get("model_key"),
+                         "aspect": aspect, "submitted_at": body.get("submitted_at")})
     return {"jobs": jobs, "project_id": proj_id}
 
 def poll_and_download(client:LabsClient, jobs:List[Dict[str,Any]], out_dir:str, on_progress=None, sleep_sec:int=5)->List[Dict[str,Any]]:
+    """Wait for ``jobs`` via the shared OperationPoller and download finished videos.
+    ``sleep_sec`` is kept for compatibility; the poller sets the polling cadence."""
     os.makedirs(out_dir, exist_ok=True)
-    done = []
-    ops = [j["op"] for j in jobs]
-    while ops:
-        rs = client.batch_check_operations(ops) or {}
-        new_ops = []
-        for j in jobs:
-            info = rs.get(j["op"]) or {}
+    done = []; finished = set()
+    by_op = {j["op"]: j for j in jobs}
+    results = queue.Queue()
+    poller = get_poller()
+    for nm, j in by_op.items():
+        poller.register(client, [nm], queue=results, model=j.get("model_key"),
+                        aspect=j.get("aspect"), submitted_at=j.get("submitted_at"))
+    try:
+        while len(finished) < len(by_op):
+            nm, info = results.get()
+            j = by_op.get(nm)
+            if j is None or nm in finished: continue
             st = info.get("status") or "PROCESSING"
-            if st in ("DONE","COMPLETED","DONE_NO_URL","FAILED","ERROR"):
+            if st in ("DONE","COMPLETED","DONE_NO_URL","FAILED","ERROR","TIMEOUT"):
                 url = (info.get("video_urls") or [None])[0]
                 if url and st in ("DONE","COMPLETED"):
-                    import requests
                     fp = os.path.join(out_dir, f"scene_{j['scene']}_copy_{j['copy']}.mp4")
                     try:
-                        r = requests.get(url, timeout=600); r.raise_for_status()
-                        with open(fp, "wb") as f: f.write(r.content)
+                        # linked from the local video store, or streamed into it on a miss
+                        _, j["digest"], _ = video_store.fetch(url, fp, timeout=(20, 600))
                         j["path"] = fp
                     except Exception:
                         pass
                 j["status"] = st
-                done.append(j)
-            else:
-                new_ops.append(j["op"])
+                done.append(j); finished.add(nm)
             if callable(on_progress):
                 try: on_progress(j, info)
                 except Exception: pass
-        ops = new_ops
-        if ops:
-            try: time.sleep(sleep_sec)
-            except Exception: pass
+    finally:
+        poller.unregister(list(by_op), queue=results)
     return done
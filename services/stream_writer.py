@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Memory-bounded file writes for downloads.
+
+``StreamWriter(dest)`` writes into a temp file next to ``dest`` through a fixed-size buffer,
+hashes every byte as it goes, and on ``commit()`` flushes, fsyncs and renames the temp file
+onto ``dest`` in one step - a reader never sees a half-written video, and memory stays at
+one buffer no matter how large the file is. Leaving the ``with`` block without ``commit()``
+(an exception, a stop request) removes the temp file.
+
+``stream_response(resp, dest)`` drains a ``requests`` response opened with ``stream=True``
+into a StreamWriter; ``file_digest(path)`` hashes an existing file with the same buffer.
+
+Knobs (config -> labs.download): buffer_kb (1024), digest ("sha256")
+"""
+import hashlib
+import os
+import tempfile
+from typing import Callable, Optional, Tuple
+
+from utils.config import knob
+
+
+def _knob(name: str, default):
+    return knob('labs.download', name, default)
+
+
+def buffer_size() -> int:
+    return max(64 * 1024, int(_knob('buffer_kb', 1024)) * 1024)
+
+
+def digest_name() -> str:
+    return str(_knob('digest', 'sha256') or 'sha256')
+
+
+class Stopped(IOError):
+    """A ``should_stop`` request ended the download."""
+
+
+class StreamWriter:
+    """Temp file + running digest + atomic rename (see module docstring)."""
+
+    def __init__(self, dest: str, buffer: Optional[int] = None, algo: Optional[str] = None):
+        self.dest = dest
+        self.buffer = int(buffer or buffer_size())
+        self.hash = hashlib.new(algo or digest_name())
+        self.size = 0
+        d = os.path.dirname(os.path.abspath(dest))
+        os.makedirs(d, exist_ok=True)
+        fd, self.tmp = tempfile.mkstemp(prefix="." + os.path.basename(dest) + ".", suffix=".tmp",
+                                        dir=d)
+        self._f = os.fdopen(fd, "wb", buffering=self.buffer)
+        self.committed = False
+
+    def write(self, data: bytes):
+        if data:
+            self._f.write(data)
+            self.hash.update(data)
+            self.size += len(data)
+
+    def commit(self) -> Tuple[int, str]:
+        """Move the finished file onto ``dest``; returns (size, hex digest)."""
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._f.close()
+        os.replace(self.tmp, self.dest)
+        self.committed = True
+        return self.size, self.hash.hexdigest()
+
+    def abort(self):
+        if not self._f.closed:
+            self._f.close()
+        if not self.committed:
+            try:
+                os.remove(self.tmp)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.abort()
+        return False
+
+
+def stream_response(resp, dest: str, buffer: Optional[int] = None,
+                    on_progress: Optional[Callable[[int, int], None]] = None,
+                    should_stop: Optional[Callable[[], bool]] = None) -> Tuple[int, str]:
+    """Write a streamed response to ``dest``; checks Content-Length. -> (size, hex digest)."""
+    total = int(resp.headers.get("Content-Length") or 0)
+    with StreamWriter(dest, buffer) as w:
+        for data in resp.iter_content(w.buffer):
+            if should_stop and should_stop():
+                raise Stopped("stopped")
+            w.write(data)
+            if on_progress and data:
+                on_progress(w.size, total)
+        if total and w.size != total:
+            raise IOError(f"short read {w.size}/{total}")
+        return w.commit()
+
+
+def file_digest(path: str, buffer: Optional[int] = None, algo: Optional[str] = None) -> str:
+    h = hashlib.new(algo or digest_name())
+    buf = bytearray(int(buffer or buffer_size()))
+    view = memoryview(buf)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            h.update(view[:n])
+    return h.hexdigest()
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Concurrent scene submission (upload -> start_one) for Labs/Veo projects.
+
+Scenes go through a bounded worker pool sized per Labs token (``workers_per_token`` x tokens,
+capped by ``max_workers``). Pacing is done by the process-wide per-bearer token bucket
+(services.rate_limit.labs_limiter) the client acquires before every call, instead of fixed
+sleeps. The pool is sized against the same quota (services.rate_limit.labs_quota): when an
+rpm is configured a token gets at most ``burst`` workers, since more would only sit blocked
+in acquire(). Every scene is reported back through ``on_update`` as soon as it is accepted
+(or fails), so the UI can fill rows in completion order.
+
+Scenes started at about the same time with the same model/aspect share one start request
+(services.submit_batcher), so a burst of N scenes costs about N / 4 start calls.
+
+When several projects submit at once they share a services.project_scheduler.FairSlotPool:
+every scene then waits for a slot of its project before uploading/starting.
+
+Knobs (config -> labs.submit): workers_per_token (2), max_workers (16)
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
+
+from services import submit_batcher
+from services.image_prep import image_aspect_for, prepare_batch
+from services.rate_limit import labs_quota
+from utils.config import knob
+
+
+def _knob(name: str, default):
+    return knob('labs.submit', name, default)
+
+
+def pool_size(n_tokens: int, workers_per_token: Optional[int] = None) -> int:
+    """Concurrent submissions for ``n_tokens`` tokens (workers_per_token x tokens, capped).
+    With a rate quota configured, workers per token are also capped by the bucket's burst."""
+    wpt = int(workers_per_token or _knob('workers_per_token', 2))
+    rpm, burst = labs_quota()
+    if rpm > 0:
+        wpt = min(wpt, max(1, int(burst)))
+    return max(1, min(max(1, n_tokens) * wpt, int(_knob('max_workers', 16))))
+
+
+class SubmissionEngine:
+    """Submit many scenes in parallel through one LabsFlowClient."""
+
+    def __init__(self, client, *, workers_per_token: Optional[int] = None,
+                 on_update: Optional[Callable[[int, Dict], None]] = None,
+                 on_log: Optional[Callable[[str, str], None]] = None,
+                 on_progress: Optional[Callable[[int, int], None]] = None,
+                 should_stop: Optional[Callable[[], bool]] = None,
+                 slots=None, project: str = "default"):
+        self.client = client
+        self.max_workers = pool_size(len(getattr(client, 'tokens', None) or []), workers_per_token)
+        self.slots = slots      # optional FairSlotPool shared with other running projects
+        self.project = project
+        self.batcher = submit_batcher.SubmitBatcher(client) if submit_batcher.enabled() else None
+        self.on_update = on_update
+        self.on_log = on_log
+        self.on_progress = on_progress
+        self.should_stop = should_stop or (lambda: False)
+        self._lock = threading.Lock()
+        self._done = 0
+
+    def _log(self, level: str, msg: str):
+        if self.on_log:
+            try:
+                self.on_log(level, msg)
+            except Exception:
+                pass
+
+    def _report(self, idx: int, job: Dict, total: int):
+        with self._lock:
+            self._done += 1
+            done = self._done
+        if self.on_update:
+            try:
+                self.on_update(idx, job)
+            except Exception:
+                pass
+        if self.on_progress:
+            try:
+                self.on_progress(done, total)
+            except Exception:
+                pass
+
+    def _submit_one(self, idx: int, job: Dict, total: int, model: str, aspect: str,
+                    copies: int, project_id: Optional[str]) -> bool:
+        if self.slots is None:
+            return self._submit_scene(idx, job, total, model, aspect, copies, project_id)
+        if not self.slots.acquire(self.project, self.should_stop):
+            return False
+        ok = False
+        try:
+            ok = self._submit_scene(idx, job, total, model, aspect, copies, project_id)
+            return ok
+        finally:
+            self.slots.release(self.project, submitted=ok)
+
+    def _submit_scene(self, idx: int, job: Dict, total: int, model: str, aspect: str,
+                      copies: int, project_id: Optional[str]) -> bool:
+        if self.should_stop():
+            return False
+        tag = f"[{idx + 1}/{total}]"
+        if job.get("image_path") and not job.get("media_id"):
+            try:
+                mid = self.client.upload_image_file(job["image_path"], image_aspect_for(aspect))
+                job["media_id"] = mid
+                self._log("HTTP", f"{tag} UPLOAD OK mediaId={mid}")
+            except Exception as e:
+                self._log("ERR", f"{tag} Upload lỗi: {e}")
+                job["status"] = "UPLOAD_FAILED"
+                self._report(idx, job, total)
+                return False
+        if self.should_stop():
+            return False
+        try:
+            if self.batcher is not None:
+                rc = self.batcher.submit(job, model, aspect, job.get("prompt", ""),
+                                         copies=copies, project_id=project_id)
+            else:
+                rc = self.client.start_one(job, model, aspect, job.get("prompt", ""),
+                                           copies=copies, project_id=project_id)
+            self._log("HTTP", f"{tag} START OK -> {rc} ref(s).")
+        except Exception as e:
+            rc = 0
+            self._log("ERR", f"{tag} Start thất bại: {e}")
+        self._report(idx, job, total)
+        return rc > 0
+
+    def run(self, jobs: List[Dict], model: str, aspect: str, copies: int = 1,
+            project_id: Optional[str] = None) -> int:
+        """Submit ``jobs`` concurrently; returns how many scenes got at least one operation."""
+        total = len(jobs)
+        self._done = 0
+        if not total:
+            return 0
+        imgs = [j["image_path"] for j in jobs if j.get("image_path") and not j.get("media_id")]
+        if len(imgs) > 1:
+            # normalise all reference images up front (process pool); uploads then hit the cache
+            try:
+                prep = prepare_batch(imgs, image_aspect_for(aspect))
+                saved = sum(r["src_bytes"] - r["bytes"] for r in prep.values())
+                self._log("INFO", f"Chuẩn hoá {len(prep)} ảnh, giảm {saved / 1e6:.1f} MB tải lên.")
+            except Exception as e:
+                self._log("WARN", f"Bỏ qua chuẩn hoá ảnh: {e}")
+        self._log("INFO", f"Gửi {total} cảnh song song ({self.max_workers} luồng).")
+        accepted = 0
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, total)) as ex:
+            futs = [ex.submit(self._submit_one, i, j, total, model, aspect, copies, project_id)
+                    for i, j in enumerate(jobs)]
+            for f in as_completed(futs):
+                try:
+                    accepted += 1 if f.result() else 0
+                except Exception as e:
+                    self._log("ERR", f"Lỗi gửi cảnh: {e}")
+        if self.batcher is not None:
+            bs = self.batcher.stats()
+            if bs["requests"]:
+                self._log("INFO", f"Gộp lệnh: {bs['scenes']} cảnh trong {bs['requests']} request, "
+                                  f"{bs['fallbacks']} cảnh gửi lẻ.")
+        ladder = getattr(self.client, 'ladder', None)
+        if ladder is not None:
+            st = ladder.stats()
+            self._log("INFO", f"Model ladder: {st['hits']} lần trúng ngay, "
+                              f"{st['misses']} lần bị từ chối, {st['skipped']} bậc bỏ qua.")
+        return accepted
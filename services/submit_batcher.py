@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Coalesces scene starts into shared ``batchAsyncGenerateVideo*`` requests.
+
+The start endpoints take a ``requests`` array, so scenes that go to the same endpoint with
+the same model, aspect and project can share one HTTP call. Scenes are grouped by
+(endpoint, model, aspect, project_id) and packed up to ``max_items`` request items (copies
+count as items). Each item carries ``metadata.sceneId``; returned operations are mapped
+back to their (scene, copy) by that id, or by position if the backend does not echo it.
+
+Requests go out through ``LabsFlowClient.start_batch``. If a batch is rejected (400) or
+otherwise fails, its scenes fall back to ``LabsFlowClient.start_one`` one by one - the model
+ladder, re-upload and per-copy retries there are per scene, and one bad scene must not sink
+the others. Scenes whose copies alone fill a request go straight to ``start_one`` too.
+
+Two ways in:
+- ``start_many(items)`` for callers that have the whole scene list (text2video, sales);
+- ``submit(...)`` for concurrent workers (SubmissionEngine): the first scene of a group waits
+  up to ``linger_sec`` for others to join, then sends the group for everyone.
+
+Knobs (config -> labs.batch_submit): enabled (true), max_items (4), linger_sec (0.2)
+"""
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from utils.config import knob
+
+
+def _knob(name: str, default):
+    return knob('labs.batch_submit', name, default)
+
+
+def enabled() -> bool:
+    return bool(_knob('enabled', True))
+
+
+class _Entry:
+    __slots__ = ("job", "model", "aspect", "prompt", "copies", "project_id", "result")
+
+    def __init__(self, job: Dict, model: str, aspect: str, prompt, copies: int,
+                 project_id: Optional[str]):
+        self.job = job
+        self.model = model
+        self.aspect = aspect
+        self.prompt = prompt
+        self.copies = max(1, int(copies))
+        self.project_id = project_id
+        self.result = 0
+
+    def key(self) -> Tuple:
+        return (bool(self.job.get("media_id")), self.model, self.aspect, self.project_id or "")
+
+
+class _Group:
+    __slots__ = ("entries", "items", "closed", "done")
+
+    def __init__(self):
+        self.entries: List[_Entry] = []
+        self.items = 0
+        self.closed = False
+        self.done = False
+
+
+class SubmitBatcher:
+    """Groups scene starts of one LabsFlowClient into shared requests (see module docstring)."""
+
+    def __init__(self, client, max_items: Optional[int] = None, linger_sec: Optional[float] = None):
+        self.client = client
+        self.max_items = max(1, int(max_items or _knob('max_items', 4)))
+        self.linger = float(linger_sec if linger_sec is not None else _knob('linger_sec', 0.2))
+        self._cv = threading.Condition()
+        self._open: Dict[Tuple, _Group] = {}
+        self.requests = 0      # batched start requests sent
+        self.scenes = 0        # scenes started through a batched request
+        self.fallbacks = 0     # scenes sent through start_one after a failed batch
+
+    # ----- synchronous --------------------------------------------------------------
+    def start_many(self, items: List[Dict]) -> List[int]:
+        """``items``: dicts with job, model, aspect, prompt, copies, project_id.
+        Returns the number of operations started per item (same order)."""
+        entries = [_Entry(it["job"], it["model"], it["aspect"], it.get("prompt", ""),
+                          it.get("copies", 1), it.get("project_id")) for it in items]
+        if not enabled():
+            self._start_each(entries)
+            return [e.result for e in entries]
+        groups: Dict[Tuple, List[_Entry]] = {}
+        for e in entries:
+            groups.setdefault(e.key(), []).append(e)
+        for members in groups.values():
+            chunk: List[_Entry] = []
+            used = 0
+            for e in members:
+                if chunk and used + e.copies > self.max_items:
+                    self._send(chunk)
+                    chunk, used = [], 0
+                chunk.append(e)
+                used += e.copies
+            if chunk:
+                self._send(chunk)
+        return [e.result for e in entries]
+
+    # ----- concurrent ---------------------------------------------------------------
+    def submit(self, job: Dict, model: str, aspect: str, prompt, copies: int = 1,
+               project_id: Optional[str] = None) -> int:
+        """Start one scene, sharing the request with scenes submitted at about the same time."""
+        e = _Entry(job, model, aspect, prompt, copies, project_id)
+        if e.copies >= self.max_items or self.linger <= 0:
+            self._send([e])
+            return e.result
+        key = e.key()
+        with self._cv:
+            g = self._open.get(key)
+            leader = g is None or g.items + e.copies > self.max_items
+            if leader:
+                if g is not None:
+                    g.closed = True
+                    self._cv.notify_all()
+                g = self._open[key] = _Group()
+            g.entries.append(e)
+            g.items += e.copies
+            if g.items >= self.max_items:
+                g.closed = True
+                self._open.pop(key, None)
+                self._cv.notify_all()
+            if not leader:
+                while not g.done:
+                    self._cv.wait()
+                return e.result
+            deadline = time.time() + self.linger
+            while not g.closed and time.time() < deadline:
+                self._cv.wait(max(0.0, deadline - time.time()))
+            g.closed = True
+            if self._open.get(key) is g:
+                self._open.pop(key, None)
+            batch = list(g.entries)
+        try:
+            self._send(batch)
+        finally:
+            with self._cv:
+                g.done = True
+                self._cv.notify_all()
+        return e.result
+
+    # ----- sending ------------------------------------------------------------------
+    def _start_each(self, entries: List[_Entry]):
+        for e in entries:
+            try:
+                e.result = self.client.start_one(e.job, e.model, e.aspect, e.prompt,
+                                                 copies=e.copies, project_id=e.project_id)
+            except Exception:
+                e.result = 0
+
+    def _send(self, entries: List[_Entry]):
+        if len(entries) == 1:
+            self._start_each(entries)
+            return
+        first = entries[0]
+        scenes = [(e.job, e.prompt, e.copies) for e in entries]
+        try:
+            model, started = self.client.start_batch(scenes, first.model, first.aspect,
+                                                     first.project_id)
+        except Exception:
+            with self._cv:
+                self.fallbacks += len(entries)
+            self._start_each(entries)
+            return
+        now = time.time()
+        for e in entries:
+            job = e.job
+            job.setdefault("operation_names", [])
+            job.setdefault("op_index_map", {})
+            job.setdefault("video_by_idx", [None] * e.copies)
+            job.setdefault("thumb_by_idx", [None] * e.copies)
+            job["aspect"] = first.aspect
+            job["submitted_at"] = now
+            job["model_key"] = model
+        for si, k, nm in started:
+            if not nm:
+                continue
+            e = entries[si]
+            e.job["operation_names"].append(nm)
+            e.job["op_index_map"][nm] = k
+            e.job["status"] = "PENDING"
+            e.result += 1
+        missing = [e for e in entries if e.result == 0]
+        with self._cv:
+            self.requests += 1
+            self.scenes += len(entries) - len(missing)
+            self.fallbacks += len(missing)
+        if missing:
+            self._start_each(missing)
+
+    def stats(self) -> Dict[str, int]:
+        with self._cv:
+            return {"requests": self.requests, "scenes": self.scenes, "fallbacks": self.fallbacks}
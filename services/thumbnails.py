@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Thumbnails for video cards and project tables, made off the UI and poll threads.
+
+Video first frames: ``video_thumb(path)`` joins a batch - requests arriving within
+``linger_sec`` of each other (up to ``batch``) are extracted by ONE ffmpeg process with one
+``-i``/output pair per video, and at most ``workers`` ffmpeg processes run at a time. If a
+batch fails (one unreadable file fails the whole command) its videos are retried one by one.
+Frames are scaled to ``width`` and cached in ``~/.veo_thumb_cache`` by video digest and size,
+so re-downloading or re-linking the same video (services.video_store) never runs ffmpeg
+again.
+
+Remote thumbnails (``image_urls``/``thumb_by_idx``): ``submit_image(url, callback)`` fetches
+and decodes on a thread pool and hands back a small PNG (``icon_px`` square, default 64)
+that the UI turns into a QPixmap on its own thread. Results are memoised per URL (signing
+parameters ignored, see video_store.url_key), concurrent requests for one URL share a fetch,
+and failures are not retried for ``retry_sec``.
+
+Knobs (config -> labs.thumbs): workers (2), batch (8), linger_sec (0.05), width (320),
+image_workers (8), icon_px (64), retry_sec (60)
+"""
+import io
+import os
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from services import http_pool
+from services.upload_cache import file_digest
+from services.video_store import place, url_key
+from utils.config import knob
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".veo_thumb_cache")
+
+
+def _knob(name: str, default):
+    return knob('labs.thumbs', name, default)
+
+
+class _Req:
+    __slots__ = ("video", "out", "event", "ok")
+
+    def __init__(self, video: str, out: str):
+        self.video = video
+        self.out = out
+        self.event = threading.Event()
+        self.ok = False
+
+
+class ThumbnailService:
+    """Batched ffmpeg first-frame extraction + cached remote icon decoding."""
+
+    def __init__(self, cache_dir: str = CACHE_DIR, workers: Optional[int] = None,
+                 batch: Optional[int] = None, linger_sec: Optional[float] = None,
+                 width: Optional[int] = None, image_workers: Optional[int] = None):
+        self.cache_dir = cache_dir
+        self.workers = max(1, int(workers or _knob('workers', 2)))
+        self.batch = max(1, int(batch or _knob('batch', 8)))
+        self.linger = float(linger_sec if linger_sec is not None else _knob('linger_sec', 0.05))
+        self.width = int(width or _knob('width', 320))
+        self.icon_px = int(_knob('icon_px', 64))
+        self.retry_sec = float(_knob('retry_sec', 60))
+        self.ffmpeg = shutil.which("ffmpeg")
+        self._cv = threading.Condition()
+        self._waiting: List[_Req] = []
+        self._by_out: Dict[str, _Req] = {}
+        self._running = 0
+        self._unclaimed = 0  # batches started but still lingering for requests
+        self._ffmpeg_pool = ThreadPoolExecutor(max_workers=self.workers,
+                                               thread_name_prefix="thumb-ffmpeg")
+        image_workers = max(1, int(image_workers or _knob('image_workers', 8)))
+        self._img_pool = ThreadPoolExecutor(max_workers=image_workers,
+                                            thread_name_prefix="thumb-img")
+        self._icons: Dict[str, bytes] = {}
+        self._icon_fail: Dict[str, float] = {}
+        self._icon_wait: Dict[str, List[Callable]] = {}
+        self._icon_lock = threading.Lock()
+        self.ffmpeg_runs = 0
+        self.cache_hits = 0
+
+    # ----- video first frames ---------------------------------------------------------
+    def cache_path(self, video_path: str, digest: Optional[str] = None) -> str:
+        digest = digest or file_digest(video_path)
+        size = os.path.getsize(video_path)
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}_{size}_w{self.width}.jpg")
+
+    def video_thumb(self, video_path: str, dest: Optional[str] = None,
+                    digest: Optional[str] = None) -> str:
+        """First frame of ``video_path`` as a JPEG (blocks; safe from any thread). Pass the
+        ``digest`` when it is known (e.g. from the download) to skip hashing the file.
+        Returns the cached path, or ``dest`` linked to it; "" if it cannot be made."""
+        if not self.ffmpeg or not os.path.exists(video_path):
+            return ""
+        out = self.cache_path(video_path, digest)
+        if os.path.exists(out):
+            self.cache_hits += 1
+        else:
+            with self._cv:
+                req = self._by_out.get(out)
+                if req is None:
+                    req = self._by_out[out] = _Req(video_path, out)
+                    self._waiting.append(req)
+                    self._pump()
+            req.event.wait()
+            if not req.ok:
+                return ""
+        if dest:
+            place(out, dest)
+            return dest
+        return out
+
+    def _pump(self):
+        # called with self._cv held: start batches while there are free ffmpeg slots and more
+        # requests waiting than the batches already starting will take
+        while self._running < self.workers and len(self._waiting) > self._unclaimed * self.batch:
+            self._running += 1
+            self._unclaimed += 1
+            self._ffmpeg_pool.submit(self._run_batch)
+
+    def _run_batch(self):
+        if self.linger > 0:
+            time.sleep(self.linger)  # let concurrent requests join this batch
+        with self._cv:
+            self._unclaimed -= 1
+            batch, self._waiting = self._waiting[:self.batch], self._waiting[self.batch:]
+        try:
+            if batch:
+                if not self._extract(batch) and len(batch) > 1:
+                    for r in batch:
+                        if not os.path.exists(r.out):
+                            self._extract([r])
+        finally:
+            with self._cv:
+                for r in batch:
+                    r.ok = os.path.exists(r.out)
+                    self._by_out.pop(r.out, None)
+                    r.event.set()
+                self._running -= 1
+                self._pump()
+
+    def _extract(self, batch: List[_Req]) -> bool:
+        cmd = [self.ffmpeg, "-nostdin", "-hide_banner", "-loglevel", "error", "-y"]
+        for r in batch:
+            cmd += ["-i", r.video]
+        tmps = []
+        for i, r in enumerate(batch):
+            os.makedirs(os.path.dirname(r.out), exist_ok=True)
+            tmp = f"{r.out}.{os.getpid()}.tmp.jpg"
+            tmps.append(tmp)
+            cmd += ["-map", f"{i}:v:0", "-frames:v", "1", "-vf", f"scale='min({self.width},iw)':-2",
+                    "-q:v", "3", tmp]
+        self.ffmpeg_runs += 1
+        try:
+            ok = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                timeout=30 + 5 * len(batch)).returncode == 0
+        except Exception:
+            ok = False
+        for r, tmp in zip(batch, tmps):
+            if ok and os.path.exists(tmp) and os.path.getsize(tmp) > 0:
+                os.replace(tmp, r.out)
+            elif os.path.exists(tmp):
+                os.remove(tmp)
+        return ok
+
+    # ----- remote icons ---------------------------------------------------------------
+    def submit_image(self, url: str, callback: Callable[[Optional[bytes]], None]):
+        """Fetch ``url`` and call ``callback(png_bytes or None)`` from a pool thread."""
+        key = url_key(url)
+        with self._icon_lock:
+            data = self._icons.get(key)
+            if data is None and time.time() - self._icon_fail.get(key, 0) < self.retry_sec:
+                data = b""
+            if data is None:
+                waiters = self._icon_wait.get(key)
+                if waiters is not None:
+                    waiters.append(callback)
+                    return
+                self._icon_wait[key] = [callback]
+        if data is not None:
+            callback(data or None)
+            return
+        self._img_pool.submit(self._load_icon, url, key)
+
+    def _load_icon(self, url: str, key: str):
+        data = None
+        try:
+            from PIL import Image
+            r = http_pool.session('media').get(url, timeout=15)
+            r.raise_for_status()
+            with Image.open(io.BytesIO(r.content)) as im:
+                im.draft("RGB", (self.icon_px, self.icon_px))  # JPEG: decode at reduced scale
+                im = im.convert("RGB")
+                im.thumbnail((self.icon_px, self.icon_px))
+                buf = io.BytesIO()
+                im.save(buf, "PNG")
+                data = buf.getvalue()
+        except Exception:
+            data = None
+        with self._icon_lock:
+            if data:
+                self._icons[key] = data
+            else:
+                self._icon_fail[key] = time.time()
+            waiters = self._icon_wait.pop(key, [])
+        for cb in waiters:
+            try:
+                cb(data)
+            except Exception:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        return {"ffmpeg_runs": self.ffmpeg_runs, "cache_hits": self.cache_hits,
+                "icons": len(self._icons)}
+
+
+_SERVICE: Optional[ThumbnailService] = None
+_SERVICE_LOCK = threading.Lock()
+
+
+def get_thumbnails() -> ThumbnailService:
+    global _SERVICE
+    with _SERVICE_LOCK:
+        if _SERVICE is None:
+            _SERVICE = ThumbnailService()
+        return _SERVICE
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Health-weighted routing across Labs bearer tokens.
+
+Every call reports its outcome per token: latency (EWMA), and 401/403/429/5xx counts over
+the last ``window_sec``. The router then picks the healthiest usable token - lowest latency,
+fewest in-flight calls and recent errors; tokens scoring within 1.5x of the best share the
+load round-robin:
+
+- 429 puts the token on a cooldown (Retry-After, else ``cooldown_sec`` doubled per repeat);
+- ``dead_after`` consecutive 401/403 take it out of rotation for ``dead_sec`` (expired token);
+- ``fail_after`` consecutive 5xx/network errors give it a short cooldown.
+
+Health is process-wide per token, so every client (and panel) using a token sees the same
+state. State changes are reported through ``on_event({"kind": "token_health", ...})``.
+
+Knobs (config -> labs.tokens): ewma_alpha (0.3), window_sec (300), cooldown_sec (30),
+max_cooldown_sec (600), dead_after (2), dead_sec (1800), fail_after (3), fail_cooldown_sec (5)
+"""
+import hashlib
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+from utils.config import knob
+
+
+def _knob(name: str, default):
+    return knob('labs.tokens', name, default)
+
+
+def token_id(token: str) -> str:
+    """Short, non-secret label for a token (safe for logs and events)."""
+    return hashlib.sha1((token or "").encode("utf-8")).hexdigest()[:8]
+
+
+class TokenHealth:
+    """Mutable health record of one bearer token (guarded by the router lock)."""
+
+    def __init__(self, token: str):
+        self.token = token
+        self.id = token_id(token)
+        self.ewma_ms: Optional[float] = None
+        self.inflight = 0
+        self.errors: deque = deque()      # timestamps of recent 401/403/429/5xx
+        self.auth_fails = 0               # consecutive 401/403
+        self.soft_fails = 0               # consecutive 5xx / network errors
+        self.throttles = 0                # consecutive 429
+        self.cooldown_until = 0.0
+        self.dead_until = 0.0
+        self.last_pick = 0.0
+        self.ok = 0
+
+    def state(self, now: float) -> str:
+        if self.dead_until > now:
+            return "dead"
+        if self.cooldown_until > now:
+            return "cooldown"
+        return "ok"
+
+    def as_dict(self, now: Optional[float] = None) -> Dict:
+        now = now or time.time()
+        return {"token": self.id, "state": self.state(now),
+                "ewma_ms": round(self.ewma_ms or 0.0, 1),
+                "errors": len(self.errors), "inflight": self.inflight, "ok": self.ok,
+                "cooldown": round(max(0.0, self.cooldown_until - now), 1),
+                "dead_for": round(max(0.0, self.dead_until - now), 1)}
+
+
+_REGISTRY: Dict[str, TokenHealth] = {}
+_LOCK = threading.RLock()
+
+
+class NoUsableToken(RuntimeError):
+    pass
+
+
+class TokenRouter:
+    """Picks the healthiest usable token from ``tokens`` and records call outcomes."""
+
+    def __init__(self, tokens: List[str], on_event: Optional[Callable[[dict], None]] = None):
+        self.tokens = list(tokens)
+        self.on_event = on_event
+        self.alpha = float(_knob('ewma_alpha', 0.3))
+        self.window = float(_knob('window_sec', 300))
+        self.cooldown = float(_knob('cooldown_sec', 30))
+        self.max_cooldown = float(_knob('max_cooldown_sec', 600))
+        self.dead_after = int(_knob('dead_after', 2))
+        self.dead_sec = float(_knob('dead_sec', 1800))
+        self.fail_after = int(_knob('fail_after', 3))
+        self.fail_cooldown = float(_knob('fail_cooldown_sec', 5))
+        with _LOCK:
+            self._h = [_REGISTRY.setdefault(t, TokenHealth(t)) for t in self.tokens]
+
+    def _emit(self, h: TokenHealth, reason: str, now: float):
+        if self.on_event:
+            try:
+                self.on_event({"kind": "token_health", "reason": reason, **h.as_dict(now)})
+            except Exception:
+                pass
+
+    def _score(self, h: TokenHealth) -> float:
+        # latencies under 50 ms count as equal; inflight calls and recent errors weigh in
+        return max(h.ewma_ms or 0.0, 50.0) * (1 + h.inflight) * (1 + 0.5 * len(h.errors))
+
+    def pick(self, prefer: Optional[str] = None) -> str:
+        """Healthiest usable token (``prefer`` if it is usable). Raises NoUsableToken if all
+        tokens are dead; if all are cooling down, the one that recovers first is returned."""
+        now = time.time()
+        with _LOCK:
+            for h in self._h:
+                while h.errors and now - h.errors[0] > self.window:
+                    h.errors.popleft()
+            live = [h for h in self._h if h.state(now) == "ok"]
+            if prefer is not None:
+                ph = next((h for h in live if h.token == prefer), None)
+                if ph is not None:
+                    ph.last_pick = now
+                    return ph.token
+            if not live:
+                cooling = [h for h in self._h if h.state(now) == "cooldown"]
+                if not cooling:
+                    raise NoUsableToken("All Labs tokens are rejected (401/403) - "
+                                        "update them in Settings")
+                h = min(cooling, key=lambda x: x.cooldown_until)
+            else:
+                # among tokens within 1.5x of the best score take the least recently used
+                best = min(self._score(x) for x in live)
+                h = min((x for x in live if self._score(x) <= best * 1.5),
+                        key=lambda x: x.last_pick)
+            h.last_pick = now
+            return h.token
+
+    def wait_time(self, token: str) -> float:
+        """Seconds until ``token`` leaves its cooldown (0 if usable now)."""
+        with _LOCK:
+            h = _REGISTRY.get(token)
+            return max(0.0, h.cooldown_until - time.time()) if h else 0.0
+
+    def begin(self, token: str):
+        with _LOCK:
+            h = _REGISTRY.get(token)
+            if h:
+                h.inflight += 1
+
+    def report(self, token: str, code: Optional[int], latency: float,
+               retry_after: Optional[float] = None):
+        """Record the outcome of one call: HTTP status (None for network errors) and latency."""
+        now = time.time()
+        event = None
+        with _LOCK:
+            h = _REGISTRY.get(token)
+            if h is None:
+                return
+            h.inflight = max(0, h.inflight - 1)
+            was = h.state(now)
+            if code is not None and (code < 400 or code in (400, 404)):
+                # the token worked (400/404 are request problems, not token problems)
+                ms = latency * 1000.0
+                h.ewma_ms = (ms if h.ewma_ms is None
+                             else self.alpha * ms + (1 - self.alpha) * h.ewma_ms)
+                h.auth_fails = h.soft_fails = h.throttles = 0
+                h.ok += 1
+                if was != "ok":
+                    h.cooldown_until = h.dead_until = 0.0
+                    event = "recovered"
+            elif code in (401, 403):
+                h.errors.append(now)
+                h.auth_fails += 1
+                if h.auth_fails >= self.dead_after:
+                    h.dead_until = now + self.dead_sec
+                    event = "dead"
+            elif code == 429:
+                h.errors.append(now)
+                h.throttles += 1
+                backoff = min(self.max_cooldown, self.cooldown * 2 ** (h.throttles - 1))
+                cd = retry_after if retry_after else backoff
+                h.cooldown_until = max(h.cooldown_until, now + cd)
+                event = "throttled"
+            else:
+                h.errors.append(now)
+                h.soft_fails += 1
+                if h.soft_fails >= self.fail_after:
+                    h.cooldown_until = max(h.cooldown_until, now + self.fail_cooldown)
+                    event = "unstable"
+        if event:
+            self._emit(h, event, now)
+
+    def snapshot(self) -> List[Dict]:
+        now = time.time()
+        with _LOCK:
+            return [h.as_dict(now) for h in self._h]
+
+    def usable_count(self) -> int:
+        now = time.time()
+        with _LOCK:
+            return sum(1 for h in self._h if h.state(now) == "ok")
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent cache of uploaded reference images -> Labs ``mediaGenerationId``.
+
+Entries are keyed by the SHA-256 of the file content plus the aspect hint, so the same image
+(in any folder, under any name) is uploaded once per aspect and reused until ``ttl_sec``
+expires. Callers drop an entry with ``invalidate(media_id)`` when the backend rejects the
+id (e.g. 400 on startImage), and the next ``get_or_upload`` uploads again.
+
+Concurrent requests for the same key share one upload (the others wait for its result).
+The cache lives in ~/.veo_upload_cache.json.
+
+Knobs (config -> labs.upload_cache): enabled (true), ttl_sec (43200), max_entries (500)
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from utils.config import knob
+
+CACHE_PATH = os.path.join(os.path.expanduser("~"), ".veo_upload_cache.json")
+
+
+def _knob(name: str, default):
+    return knob('labs.upload_cache', name, default)
+
+
+_DIGESTS: Dict[Tuple[str, int, int], str] = {}
+_DIGESTS_LOCK = threading.Lock()
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 of the file content (memoised on path, size and mtime)."""
+    st = os.stat(path)
+    memo = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _DIGESTS_LOCK:
+        d = _DIGESTS.get(memo)
+    if d:
+        return d
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    d = h.hexdigest()
+    with _DIGESTS_LOCK:
+        _DIGESTS[memo] = d
+    return d
+
+
+class _InFlight:
+    __slots__ = ("event", "media_id", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.media_id: Optional[str] = None
+        self.error: Optional[BaseException] = None
+
+
+class UploadCache:
+    """content hash + aspect -> mediaGenerationId, with TTL and in-flight de-duplication."""
+
+    def __init__(self, path: str = CACHE_PATH, ttl_sec: Optional[float] = None,
+                 max_entries: Optional[int] = None):
+        self.path = path
+        self.ttl = float(ttl_sec if ttl_sec is not None else _knob('ttl_sec', 43200))
+        self.max_entries = int(max_entries or _knob('max_entries', 500))
+        self.enabled = bool(_knob('enabled', True))
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict] = self._load()
+        self._inflight: Dict[str, _InFlight] = {}
+        self.hits = 0
+        self.misses = 0
+
+    # ----- persistence ----------------------------------------------------------------
+    def _load(self) -> Dict[str, Dict]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return {k: v for k, v in (data or {}).items()
+                    if isinstance(v, dict) and v.get("media_id")}
+        except Exception:
+            return {}
+
+    def _save(self):
+        d = os.path.dirname(self.path) or "."
+        try:
+            fd, tmp = tempfile.mkstemp(prefix=".tmp_upl_", dir=d)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp, self.path)
+        except Exception:
+            pass
+
+    # ----- lookup ---------------------------------------------------------------------
+    @staticmethod
+    def key(digest: str, aspect: Optional[str]) -> str:
+        return f"{digest}|{aspect or ''}"
+
+    def get(self, digest: str, aspect: Optional[str]) -> Optional[str]:
+        with self._lock:
+            e = self._entries.get(self.key(digest, aspect))
+            if not e:
+                return None
+            if time.time() - float(e.get("at", 0)) > self.ttl:
+                self._entries.pop(self.key(digest, aspect), None)
+                self._save()
+                return None
+            return e["media_id"]
+
+    def put(self, digest: str, aspect: Optional[str], media_id: str, size: int = 0):
+        with self._lock:
+            self._entries[self.key(digest, aspect)] = {"media_id": media_id, "at": time.time(),
+                                                       "size": size}
+            if len(self._entries) > self.max_entries:
+                for k, _ in sorted(self._entries.items(), key=lambda kv: kv[1].get("at", 0))[
+                        :len(self._entries) - self.max_entries]:
+                    self._entries.pop(k, None)
+            self._save()
+
+    def invalidate(self, media_id: Optional[str]) -> bool:
+        """Forget every entry pointing at ``media_id`` (backend said it is stale/invalid)."""
+        if not media_id:
+            return False
+        with self._lock:
+            dead = [k for k, e in self._entries.items() if e.get("media_id") == media_id]
+            for k in dead:
+                self._entries.pop(k, None)
+            if dead:
+                self._save()
+        return bool(dead)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._save()
+
+    def get_or_upload(self, path: str, aspect: Optional[str],
+                      upload: Callable[[], Optional[str]]) -> Optional[str]:
+        """Return the cached id for ``path``/``aspect`` or run ``upload()`` once and cache it."""
+        if not self.enabled:
+            return upload()
+        digest = file_digest(path)
+        mid = self.get(digest, aspect)
+        if mid:
+            self.hits += 1
+            return mid
+        k = self.key(digest, aspect)
+        with self._lock:
+            fl = self._inflight.get(k)
+            owner = fl is None
+            if owner:
+                fl = self._inflight[k] = _InFlight()
+        if not owner:
+            # someone is uploading the same bytes right now - share the result
+            fl.event.wait()
+            if fl.error is not None:
+                raise fl.error
+            self.hits += 1
+            return fl.media_id
+        self.misses += 1
+        try:
+            fl.media_id = upload()
+            if fl.media_id:
+                self.put(digest, aspect, fl.media_id, os.path.getsize(path))
+            return fl.media_id
+        except BaseException as e:
+            fl.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(k, None)
+            fl.event.set()
+
+
+_CACHE: Optional[UploadCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_upload_cache() -> UploadCache:
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = UploadCache()
+        return _CACHE
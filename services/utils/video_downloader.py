@@ -1,22 +1,25 @@
 """Shared video download logic"""
-import os, requests
+import os
+from typing import Tuple
+from services import video_store
 
 class VideoDownloader:
     def __init__(self, log_callback=None):
         self.log = log_callback or print
     
     def download(self, url: str, output_path: str, timeout=300) -> str:
-        self.log(f"[Download] {os.path.basename(output_path)}")
-        with requests.get(url, stream=True, timeout=timeout, allow_redirects=True) as r:
-            r.raise_for_status()
-            total = int(r.headers.get('content-length', 0))
-            downloaded = 0
-            with open(output_path, 'wb') as f:
-                for chunk in r.iter_content(8192):
-                    if chunk:
-                        f.write(chunk)
-                        downloaded += len(chunk)
+        self.download_file(url, output_path, timeout)
+        return output_path
+
+    def download_file(self, url: str, output_path: str, timeout=300) -> Tuple[int, str]:
+        """-> (size, digest). A video already in the local store (services.video_store) is
+        linked into place without network I/O; otherwise it is fetched with parallel,
+        resumable byte ranges (services.ranged_download)."""
+        size, digest, hit = video_store.fetch(url, output_path, timeout=(20, timeout))
         if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
             raise Exception("Download failed")
-        self.log(f"[Download] ✓ Complete")
-        return output_path
+        if hit:
+            self.log(f"[Download] ✓ {os.path.basename(output_path)} (đã có sẵn, không tải lại)")
+        else:
+            self.log(f"[Download] ✓ {os.path.basename(output_path)} ({size / 1e6:.1f} MB)")
+        return size, digest
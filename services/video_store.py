@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+Content-addressed store of downloaded videos, shared by every panel and project.
+
+Each video is kept once under ``<root>/objects/<aa>/<digest>.mp4``; project folders
+(``03_Videos``, ``Video``, batch outputs) get a hardlink to it - or a reflink/copy when the
+folder is on another filesystem - instead of a fresh download. ``index.json`` maps
+
+- the URL key (the storage URL without its signing parameters - Expires, Signature,
+  GoogleAccessId, X-Goog-* change on every poll, the rest of the URL does not) -> digest, and
+- digest -> size, time added and time last used,
+
+so "do we already have this video?" is a dict lookup before any network I/O. A URL seen for
+the first time is downloaded into ``<root>/incoming`` (resumable, see ranged_download); if
+its digest is already stored the new copy is dropped and the existing object linked.
+Concurrent requests for the same URL share one download.
+
+Project files are links to the stored object, so they must be treated as read-only
+(the app only ever writes new files next to them, e.g. ``*_4k.mp4``).
+
+The root defaults to ``<download_root>/.video_store``; deleting it only costs re-downloads.
+``prune`` (run when the store is opened and after each download) removes objects unused for
+``max_age_days`` and then the least recently used ones until the store is under ``max_gb``.
+Only objects no project links to count: removing a linked one would free no space.
+
+Knobs (config -> labs.store): enabled (true), root (""), max_gb (20), max_age_days (30)
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from services import ranged_download
+from utils.config import cached, knob
+
+
+def _knob(name: str, default):
+    return knob('labs.store', name, default)
+
+
+def enabled() -> bool:
+    return bool(_knob('enabled', True))
+
+
+_SIGNING_PARAMS = {"expires", "signature", "googleaccessid"}
+
+# objects used this recently are never pruned (a fetch may be linking them right now)
+_PRUNE_GRACE_SEC = 3600.0
+
+
+def _signing_param(name: str) -> bool:
+    n = name.lower()
+    return n in _SIGNING_PARAMS or n.startswith("x-goog-")
+
+
+def url_key(url: str) -> str:
+    """Stable identity of a storage URL: the signing parameters (new on every poll) are
+    dropped, any other query parameter is kept."""
+    p = urlsplit(url)
+    if not p.path.strip("/"):
+        return url
+    query = urlencode([(k, v) for k, v in parse_qsl(p.query, keep_blank_values=True)
+                       if not _signing_param(k)])
+    return urlunsplit((p.scheme, p.netloc.lower(), p.path, query, ""))
+
+
+def _reflink(src: str, dst: str) -> bool:
+    """Copy-on-write clone (btrfs/XFS) via FICLONE; False where unsupported."""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(src, "rb") as s, open(dst, "wb") as d:
+            fcntl.ioctl(d.fileno(), 0x40049409, s.fileno())  # FICLONE
+        return True
+    except OSError:
+        try:
+            os.remove(dst)
+        except OSError:
+            pass
+        return False
+
+
+def place(src: str, dest: str) -> str:
+    """Put ``src`` at ``dest`` as a hardlink, else a reflink, else a copy (atomic replace).
+    Returns which one was made."""
+    d = os.path.dirname(os.path.abspath(dest))
+    os.makedirs(d, exist_ok=True)
+    try:
+        if os.path.samefile(src, dest):
+            return "link"
+    except OSError:
+        pass
+    tmp = os.path.join(d, f".{os.path.basename(dest)}.{os.getpid()}.{threading.get_ident()}.lnk")
+    try:
+        try:
+            os.link(src, tmp)
+            how = "link"
+        except OSError:
+            if _reflink(src, tmp):
+                how = "reflink"
+            else:
+                shutil.copyfile(src, tmp)
+                how = "copy"
+        os.replace(tmp, dest)
+        return how
+    finally:
+        if os.path.exists(tmp):
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+
+class _InFlight:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Optional[Tuple[str, int]] = None
+        self.error: Optional[BaseException] = None
+
+
+class VideoStore:
+    """URL key / digest -> stored object, with link-out to project folders."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.index_path = os.path.join(root, "index.json")
+        self._lock = threading.Lock()
+        data = self._load()
+        self._urls: Dict[str, str] = data.get("urls") or {}
+        self._objects: Dict[str, Dict] = data.get("objects") or {}
+        self._inflight: Dict[str, _InFlight] = {}
+        self.hits = 0
+        self.misses = 0
+        self.dedup = 0  # downloads whose content was already stored under another URL
+
+    # ----- persistence ----------------------------------------------------------------
+    def _load(self) -> Dict:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except Exception:
+            return {}
+
+    def _save(self):
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(prefix=".tmp_idx_", dir=self.root)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"version": 1, "urls": self._urls, "objects": self._objects}, f)
+            os.replace(tmp, self.index_path)
+        except Exception:
+            pass
+
+    # ----- lookup ---------------------------------------------------------------------
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.root, "objects", digest[:2], digest + ".mp4")
+
+    def lookup(self, url: str) -> Optional[str]:
+        """Stored file for ``url`` or None - no network I/O."""
+        with self._lock:
+            digest = self._urls.get(url_key(url))
+            if not digest:
+                return None
+            path = self.object_path(digest)
+            if digest in self._objects and os.path.exists(path):
+                return path
+            # object removed behind our back: forget it so it is fetched again
+            self._objects.pop(digest, None)
+            for k in [k for k, v in self._urls.items() if v == digest]:
+                self._urls.pop(k, None)
+            self._save()
+            return None
+
+    def has_digest(self, digest: str) -> bool:
+        with self._lock:
+            return digest in self._objects and os.path.exists(self.object_path(digest))
+
+    # ----- fetch ----------------------------------------------------------------------
+    def fetch(self, url: str, dest: str, **fetch_kw) -> Tuple[int, str, bool]:
+        """Make ``dest`` hold the video at ``url``; downloads only on a store miss.
+        Returns (size, digest, hit). ``fetch_kw`` goes to ranged_download.fetch_file."""
+        path = self.lookup(url)
+        if path:
+            with self._lock:
+                self.hits += 1
+                digest = self._urls.get(url_key(url), "")
+                self._touch(digest)
+            place(path, dest)
+            return os.path.getsize(path), digest, True
+        key = url_key(url)
+        with self._lock:
+            fl = self._inflight.get(key)
+            leader = fl is None and key not in self._urls  # stored since lookup() -> follower path
+            if fl is None and not leader:
+                fl = _InFlight()
+                digest = self._urls[key]
+                fl.result = (digest, int((self._objects.get(digest) or {}).get("size", 0)))
+                fl.event.set()
+            elif leader:
+                fl = self._inflight[key] = _InFlight()
+                self.misses += 1
+        if not leader:
+            fl.event.wait()
+            if fl.error is not None:
+                raise fl.error
+            digest, size = fl.result
+            with self._lock:
+                self.hits += 1
+                self._touch(digest)
+            place(self.object_path(digest), dest)
+            return size, digest, True
+        try:
+            digest, size = self._download(url, key, fetch_kw)
+            fl.result = (digest, size)
+        except BaseException as e:
+            fl.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            fl.event.set()
+        place(self.object_path(digest), dest)
+        return size, digest, False
+
+    def _download(self, url: str, key: str, fetch_kw: Dict) -> Tuple[str, int]:
+        incoming = os.path.join(self.root, "incoming")
+        os.makedirs(incoming, exist_ok=True)
+        # stable name per URL, so an interrupted download resumes from its .part file
+        staging = os.path.join(incoming, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".mp4")
+        size, digest = ranged_download.fetch_file(url, staging, **fetch_kw)
+        obj = self.object_path(digest)
+        with self._lock:
+            if os.path.exists(obj):
+                self.dedup += 1
+                os.remove(staging)
+            else:
+                os.makedirs(os.path.dirname(obj), exist_ok=True)
+                os.replace(staging, obj)
+            now = time.time()
+            self._objects[digest] = {"size": size, "at": now, "used": now}
+            self._urls[key] = digest
+            self._save()
+        self.prune()
+        return digest, size
+
+    def _touch(self, digest: str):
+        # in memory only: saved with the next index write
+        obj = self._objects.get(digest)
+        if obj is not None:
+            obj["used"] = time.time()
+
+    def prune(self, max_bytes: Optional[int] = None, max_age_sec: Optional[float] = None) -> int:
+        """Remove unlinked objects unused for ``max_age_sec``, then the least recently used
+        ones until they total at most ``max_bytes`` (0 = no limit). Returns objects removed."""
+        if max_bytes is None:
+            max_bytes = int(float(_knob('max_gb', 20)) * 1024 ** 3)
+        if max_age_sec is None:
+            max_age_sec = float(_knob('max_age_days', 30)) * 86400.0
+        now = time.time()
+        with self._lock:
+            free = []  # (last used, digest, size) of objects no project links to
+            for digest, obj in self._objects.items():
+                try:
+                    st = os.stat(self.object_path(digest))
+                except OSError:
+                    continue
+                if st.st_nlink <= 1:
+                    free.append((float(obj.get("used") or obj.get("at") or 0), digest, st.st_size))
+            free.sort()
+            total = sum(size for _, _, size in free)
+            drop = []
+            for used, digest, size in free:
+                if now - used < _PRUNE_GRACE_SEC:
+                    break
+                if not ((max_age_sec > 0 and now - used > max_age_sec)
+                        or (max_bytes > 0 and total > max_bytes)):
+                    break
+                drop.append(digest)
+                total -= size
+            if not drop:
+                return 0
+            gone = set(drop)
+            for digest in drop:
+                self._objects.pop(digest, None)
+                try:
+                    os.remove(self.object_path(digest))
+                except OSError:
+                    pass
+            for k in [k for k, v in self._urls.items() if v in gone]:
+                self._urls.pop(k, None)
+            self._save()
+            return len(drop)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"objects": len(self._objects), "urls": len(self._urls),
+                    "hits": self.hits, "misses": self.misses, "dedup": self.dedup}
+
+
+def store_root() -> str:
+    root = _knob('root', "") or ""
+    if root:
+        return os.path.expanduser(root)
+    base = cached().get("download_root") or os.path.join(os.path.expanduser("~"), "Downloads")
+    return os.path.join(base, ".video_store")
+
+
+_STORES: Dict[str, VideoStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_video_store(root: Optional[str] = None) -> VideoStore:
+    """Process-wide store for ``root`` (default: from config, see ``store_root``)."""
+    root = os.path.abspath(root or store_root())
+    with _STORES_LOCK:
+        st = _STORES.get(root)
+        if st is None:
+            st = _STORES[root] = VideoStore(root)
+            st.prune()
+        return st
+
+
+def fetch(url: str, dest: str, **fetch_kw) -> Tuple[int, str, bool]:
+    """``get_video_store().fetch`` when the store is enabled, else a plain download."""
+    if not enabled():
+        size, digest = ranged_download.fetch_file(url, dest, **fetch_kw)
+        return size, digest, False
+    return get_video_store().fetch(url, dest, **fetch_kw)
@@ -2,9 +2,7 @@ import datetime
 import glob
 import json
 import os
-import re
 import shutil
-import time
 import webbrowser
 
 from PyQt5.QtCore import QByteArray, QObject, Qt, QThread, QTimer, pyqtSignal
@@ -40,140 +38,99 @@ except Exception:  # pragma: no cover
 
 try:
     from services.google.labs_flow_client import DEFAULT_PROJECT_ID, LabsFlowClient
+    from services.job_journal import JobJournal, is_pending
+    from services.op_poller import get_poller
+    from services.project_files import (  # noqa: F401  re-exported for older imports
+        IMAGE_GLOB,
+        apply_op_result,
+        new_job,
+        parse_prompt_any,
+        parse_prompt_file,
+        project_paths,
+        safe_name,
+        video_basename,
+    )
+    from services.submission_engine import SubmissionEngine
+    from services.thumbnails import get_thumbnails
     from services.utils.video_downloader import VideoDownloader
 except Exception:  # pragma: no cover
     from google.labs_flow_client import DEFAULT_PROJECT_ID, LabsFlowClient
+    from job_journal import JobJournal, is_pending
+    from op_poller import get_poller
+    from project_files import (  # noqa: F401
+        IMAGE_GLOB,
+        apply_op_result,
+        new_job,
+        parse_prompt_any,
+        parse_prompt_file,
+        project_paths,
+        safe_name,
+        video_basename,
+    )
+    from submission_engine import SubmissionEngine
+    from thumbnails import get_thumbnails
     from utils.video_downloader import VideoDownloader
 
-def safe_name(s: str)->str:
-    s = s or ""
-    s = s.lower().strip()
-    s = re.sub(r"\s+", "_", s)
-    s = re.sub(r"[^a-z0-9._-]+", "_", s)
-    s = re.sub(r"_+", "_", s).strip("_")
-    return s or "project"
-
 BASE_COLS = ["Dự án","Cảnh","Image","Prompt","Trạng thái"]
 def _video_labels(n): return [f"Video {i+1}" for i in range(max(0,n))]
 TAIL_COLS = ["Hoàn thành"]
-IMAGE_GLOB = ("*.png","*.jpg","*.jpeg","*.webp","*.bmp")
 
 def short_text(s, n=90):
     s=(s or "").replace("\n"," ").strip()
     return s if len(s)<=n else s[:n-1]+"…"
 
-def parse_prompt_any(obj):
-    scenes=[]
-    def _to_text(p):
-        if isinstance(p, str):
-            return p
-        try:
-            return json.dumps(p, ensure_ascii=False)
-        except Exception:
-            return str(p)
-    if isinstance(obj, list):
-        for it in obj:
-            if isinstance(it, dict) and "prompt" in it:
-                scenes.append(_to_text(it["prompt"]))
-            else:
-                scenes.append(_to_text(it))
-    elif isinstance(obj, dict):
-        if "scenes" in obj and isinstance(obj["scenes"], list):
-            for it in obj["scenes"]:
-                if isinstance(it, dict) and "prompt" in it:
-                    scenes.append(_to_text(it["prompt"]))
-                else:
-                    scenes.append(_to_text(it))
-        elif "prompt" in obj:
-            scenes.append(_to_text(obj["prompt"]))
-        else:
-            scenes.append(_to_text(obj))
-    return scenes
-
-def parse_prompt_file(path):
-    try:
-        with open(path,"r",encoding="utf-8") as f:
-            obj=json.load(f)
-    except Exception:
-        return []
-    return parse_prompt_any(obj)
-
 class SeqWorker(QObject):
     log = pyqtSignal(str,str)
     progress = pyqtSignal(int, str)
     row_update = pyqtSignal(int, dict)
     started = pyqtSignal()
     finished = pyqtSignal(int)
-    def __init__(self, client, jobs, model, aspect, copies, project_id):
+    def __init__(self, client, jobs, model, aspect, copies, project_id, slots=None, project="default"):
         super().__init__(); self.client=client; self.jobs=jobs; self.model=model; self.aspect=aspect; self.copies=copies; self.project_id=project_id
+        self.should_stop=False; self.slots=slots; self.project=project
     def run(self):
         self.started.emit()
-        total=max(1,len(self.jobs)); done=0
-        for i,j in enumerate(self.jobs):
-            if j.get("image_path"):
-                self.log.emit("INFO", f"[{i+1}/{len(self.jobs)}] Upload ảnh…")
-                self.progress.emit(int(done*100/total), f"Cảnh {i+1}/{len(self.jobs)}: upload…")
-                if not j.get("media_id"):
-                    try:
-                        mid=self.client.upload_image_file(j["image_path"]); j["media_id"]=mid
-                        self.log.emit("HTTP", f"UPLOAD OK mediaId={mid}")
-                    except Exception as e:
-                        self.log.emit("ERR", f"Upload lỗi: {e}")
-                        j["status"]="UPLOAD_FAILED"; self.row_update.emit(i,j); continue
-            self.log.emit("INFO", f"[{i+1}/{len(self.jobs)}] Start generate…")
-            try:
-                self.progress.emit(int(done*100/total), f"Cảnh {i+1}/{len(self.jobs)}: start…")
-                rc=self.client.start_one(j, self.model, self.aspect, j.get("prompt",""), copies=self.copies, project_id=self.project_id)
-                self.log.emit("HTTP", f"START OK -> {rc} ref(s).")
-            except Exception as e:
-                self.log.emit("ERR", f"Start thất bại: {e}")
-            self.row_update.emit(i,j); done+=1; self.progress.emit(int(done*100/total), f"Đã gửi {done}/{len(self.jobs)} cảnh")
-            time.sleep(1.2)
-        self.progress.emit(100, "Hoàn tất gửi tuần tự"); self.finished.emit(1)
+        total=len(self.jobs)
+        self.progress.emit(0, f"Đang gửi {total} cảnh…")
+        engine=SubmissionEngine(self.client,
+                                on_update=lambda i,j: self.row_update.emit(i,j),
+                                on_log=lambda lv,msg: self.log.emit(lv,msg),
+                                on_progress=lambda d,t: self.progress.emit(int(d*100/max(1,t)), f"Đã gửi {d}/{t} cảnh"),
+                                should_stop=lambda: self.should_stop,
+                                slots=self.slots, project=self.project)
+        ok=engine.run(self.jobs, self.model, self.aspect, self.copies, self.project_id)
+        self.progress.emit(100, f"Hoàn tất gửi {ok}/{total} cảnh"); self.finished.emit(1)
 
 class CheckWorker(QObject):
     log = pyqtSignal(str,str); progress = pyqtSignal(int, str); row_update = pyqtSignal(int, dict); finished = pyqtSignal()
-    def __init__(self, client, jobs): super().__init__(); self.client=client; self.jobs=jobs
+    def __init__(self, client, jobs, poller=None): super().__init__(); self.client=client; self.jobs=jobs; self.poller=poller or get_poller()
     def run(self):
         names=[n for j in self.jobs for n in j.get("operation_names",[])]
         if not names: self.log.emit("INFO","[Check] chưa có operation."); self.finished.emit(); return
         self.progress.emit(0, "Đang check…")
-        try:
-            rs=self.client.batch_check_operations(names)
-        except Exception as e:
-            self.log.emit("ERR", f"Check lỗi: {e.__class__.__name__}: {e}"); self.finished.emit(); return
+        # status comes from the shared poller (one batched request for every open project)
+        for j in self.jobs:
+            self.poller.register(self.client, j.get("operation_names",[]), model=j.get("model_key"),
+                                 aspect=j.get("aspect"), submitted_at=j.get("submitted_at"))
+        rs=self.poller.snapshot(names)
+        # operations the poller has not reported yet (first check after launch/resume): ask directly
+        missing=[n for n in names if n not in rs]
+        if missing:
+            try:
+                rs.update(self.client.batch_check_operations(missing) or {})
+            except Exception as e:
+                if not rs:
+                    self.log.emit("ERR", f"Check lỗi: {e.__class__.__name__}: {e}"); self.finished.emit(); return
         total=max(1,len(self.jobs)); done=0
         for idx,j in enumerate(self.jobs):
             found=False
             for nm in j.get("operation_names",[]):
                 if nm in rs:
-                    v=rs[nm]; found=True
-                    if v.get("video_urls"):
-                        vids=v["video_urls"]; ci=j.get("op_index_map",{}).get(nm,0)
-                        while len(j["video_by_idx"]) <= ci: j["video_by_idx"].append(None); j["thumb_by_idx"].append(None)
-                        if not j["video_by_idx"][ci]: j["video_by_idx"][ci]=vids[0]
-                        if v.get("image_urls"): j["thumb_by_idx"][ci]=v["image_urls"][0]
-                    j["status"]=v.get("status","PROCESSING")
+                    found=True; apply_op_result(j, nm, rs[nm])
             if not found and j.get("status")=="PENDING": j["status"]="PROCESSING"
             self.row_update.emit(idx,j); done+=1; self.progress.emit(int(done*100/total), f"Đã check {done}/{len(self.jobs)} cảnh")
         self.log.emit("HTTP","Check xong."); self.finished.emit()
 
-class ThumbWorker(QObject):
-    done = pyqtSignal(int, int, object)
-    def __init__(self, row, idx, url): super().__init__(); self.row=row; self.idx=idx; self.url=url
-    def run(self):
-        import requests
-        try:
-            r=requests.get(self.url, timeout=15); r.raise_for_status(); data=r.content
-        except Exception:
-            self.done.emit(self.row,self.idx,None); return
-        pix=QPixmap(); pix.loadFromData(QByteArray(data))
-        if not pix.isNull():
-            pix=pix.scaled(64, 64, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-            self.done.emit(self.row,self.idx, QIcon(pix))
-        else:
-            self.done.emit(self.row,self.idx,None)
-
 class DownloadWorker(QObject):
     log = pyqtSignal(str,str); progress = pyqtSignal(int, str); row_update = pyqtSignal(int, dict); finished = pyqtSignal(int,int, bool)
     def __init__(self, jobs, outdir, only_missing=True, expected_copies=1, project_name="project", video_downloader=None):
@@ -191,15 +148,11 @@ class DownloadWorker(QObject):
                 if not u: continue
                 if self.only_missing and (i in j["downloaded_idx"]): continue
                 attempts+=1
-                base = f"{safe_name(self.project_name)}_canh_{j.get('scene_id','')}_video_{i}"
+                base = video_basename(self.project_name, j.get('scene_id',''), i)
                 dest=os.path.join(self.outdir, f"{base}.mp4")
                 try:
-                    if self.video_downloader:
-                        self.video_downloader.download(u, dest)
-                    else:
-                        import requests
-                        with requests.get(u, stream=True, timeout=300, allow_redirects=True) as r:
-                            r.raise_for_status(); open(dest,"wb").write(r.content)
+                    # streamed to a temp file and renamed when complete (never held in memory)
+                    (self.video_downloader or VideoDownloader(log_callback=lambda msg: None)).download(u, dest)
                     j["downloaded_idx"].add(i); j.setdefault("local_paths",[]).append(dest); j["status"]="DOWNLOADED"; ok+=1
                     # nếu đủ số lượng video mong đợi -> set thời gian hoàn thành
                     if len(j["downloaded_idx"]) >= min(self.expected_copies, len(vids)):
@@ -214,6 +167,7 @@ class DownloadWorker(QObject):
 class ProjectPanel(QWidget):
     project_completed = pyqtSignal(str)  # emit project_name when all videos downloaded
     run_all_requested = pyqtSignal()
+    _thumb_ready = pyqtSignal(int, int, object)  # row, video idx, PNG bytes from the thumbnail pool
     def __init__(self, project_name:str, base_dir:str, settings_provider=None, parent=None):
         super().__init__(parent)
         self.project_name=project_name; self.base_dir=base_dir; self.project_dir=os.path.join(base_dir, project_name)
@@ -221,10 +175,16 @@ class ProjectPanel(QWidget):
         self.settings_provider = settings_provider or (lambda: load_cfg())
         self.tokens=[]; self.client=None; self.jobs=[]; self.max_videos=4
         self.scenes=[]; self.image_files=[]; self._seq_running=False
+        self.slot_pool=None  # FairSlotPool set by ProjectsPane while projects run in parallel
         self._build_ui()
+        # queued even when a cached icon is delivered synchronously from _refresh_row
+        self._thumb_ready.connect(self._on_thumb, Qt.QueuedConnection)
         self.video_downloader = VideoDownloader(log_callback=self.console.info)
         self.console.info(f"Dự án '{project_name}' đã sẵn sàng.")
         self._timer=None
+        # crash-safe record of submitted jobs; lets a restart pick up unfinished renders
+        self.journal=JobJournal.for_project(self._project_dir())
+        self._resume_from_journal()
 
     def _build_ui(self):
         root=QVBoxLayout(self); root.setContentsMargins(6,6,6,6); root.setSpacing(4)
@@ -399,28 +359,29 @@ class ProjectPanel(QWidget):
         k=ev.get("kind")
         if k=="http_ok": self.console.http("HTTP 200")
         elif k=="http_other_err": self.console.err(f"HTTP {ev.get('code')}: {ev.get('detail','')}")
+        elif k=="upload_prep":
+            if ev.get("error"): self.console.warn(f"Giữ ảnh gốc (không chuẩn hoá được): {ev['error']}")
+            else: self.console.info(f"Ảnh tải lên: {ev.get('src_bytes',0)/1e6:.1f} MB -> {ev.get('bytes',0)/1e6:.2f} MB")
+        elif k=="token_health":
+            msg=f"Token {ev.get('token')}: {ev.get('reason')} ({ev.get('state')}, {ev.get('ewma_ms',0):.0f} ms, {ev.get('errors',0)} lỗi gần đây)"
+            if ev.get("state")=="ok": self.console.info(msg)
+            else: self.console.warn(msg)
+        elif k=="upload_done": self.console.http(f"UPLOAD {ev.get('bytes',0)/1e6:.2f} MB trong {ev.get('sec',0):.2f}s")
 
     def _settings(self):
         return (self.settings_provider() if callable(self.settings_provider) else load_cfg())
 
-    def _project_paths(self):
-        cfg = self._settings()
-        root = cfg.get("download_root")
+    def _project_dir(self):
+        root = self._settings().get("download_root")
         if not root: root = os.path.join(os.path.expanduser("~"), "Downloads", "VeoProjects")
-        proj_dir = os.path.join(root, self.project_name)
-        dirs = {
-            "root": root,
-            "project": proj_dir,
-            "prompts": os.path.join(proj_dir, "Prompt video"),
-            "images": os.path.join(proj_dir, "Ảnh tham chiếu"),
-            "videos": os.path.join(proj_dir, "Video"),
-        }
-        for d in dirs.values():
-            if isinstance(d, str): os.makedirs(d, exist_ok=True)
-        return dirs
+        return os.path.join(root, self.project_name)
+
+    def _project_paths(self):
+        return project_paths(self._project_dir())
 
     def _prepare_jobs(self):
         self.jobs=[]; self.table.setRowCount(0)
+        self.journal.reset()
         # lấy scenes từ text box nếu chưa có
         if not self.scenes and self.ed_json.toPlainText().strip():
             try:
@@ -477,10 +438,8 @@ class ProjectPanel(QWidget):
                 dst = None
 
             row=self.table.rowCount(); self.table.insertRow(row)
-            job={"scene_id":f"{scene_id}","prompt":prompt_text,"image_path":dst,"image_name":os.path.basename(dst) if dst else "",
-                 "media_id":None,"operation_names":[],"status":"NEW","video_by_idx":[None]*copies,"thumb_by_idx":[None]*copies,"op_index_map":{},
-                 "downloaded_idx":set(),"thumb_icons":{},"completed_at":""}
-            self.jobs.append(job); self._refresh_row(row, job)
+            job=new_job(scene_id, prompt_text, dst, copies)
+            self.jobs.append(job); self._refresh_row(row, job); self.journal.record(job["scene_id"], job)
         if n==0: self.console.warn("Không có cặp (prompt, ảnh) nào.")
         return n
 
@@ -510,13 +469,54 @@ class ProjectPanel(QWidget):
         col += len(vids)
         self._set_cell(idx,col, job.get("completed_at",""))
 
+    def _on_row_update(self, idx, job):
+        # journal the live job object (the signal may deliver a converted copy)
+        src=self.jobs[idx] if 0 <= idx < len(self.jobs) else job
+        try: self.journal.record(str(src.get("scene_id", idx)), src)
+        except Exception as e: self.console.warn(f"Không ghi được nhật ký công việc: {e}")
+        self._refresh_row(idx, job)
+
+    def _resume_from_journal(self):
+        """Re-attach to operations journaled by an earlier session instead of resubmitting them."""
+        try:
+            saved=self.journal.replay()
+        except Exception as e:
+            self.console.err(f"Không đọc được nhật ký công việc: {e}"); return
+        if not saved: return
+        try: self.journal.compact(saved)
+        except Exception: pass
+        copies=max([len(j.get("video_by_idx") or []) for j in saved.values()]+[1])
+        self.sp_copies.setValue(min(12, copies))
+        for j in saved.values():
+            j["downloaded_idx"]=set(j.get("downloaded_idx") or []); j["thumb_icons"]={}
+            row=self.table.rowCount(); self.table.insertRow(row)
+            self.jobs.append(j); self._refresh_row(row, j)
+        pending=[j for j in self.jobs if is_pending(j)]
+        if not pending: return
+        self.console.info(f"Khôi phục {len(pending)} cảnh chưa hoàn tất từ lần chạy trước.")
+        toks=[t.strip() for t in self._settings().get("tokens", []) if t.strip()]
+        if not toks:
+            self.console.warn("Chưa có token - vào Cài đặt rồi bấm kiểm tra để tiếp tục."); return
+        self.client=LabsFlowClient(toks, on_event=self._on_event)
+        self._start_auto_check()
+        QTimer.singleShot(0, self._check)
+
+    def _start_auto_check(self):
+        # auto-check (hidden) mỗi 10s
+        if not self._timer:
+            self._timer=QTimer(self); self._timer.setInterval(10000); self._timer.timeout.connect(self._check)
+        self._timer.start()
+
     def _load_thumb_async(self, row, idx, url):
-        th=QThread(self); w=ThumbWorker(row, idx, url); w.moveToThread(th)
-        th.started.connect(w.run); w.done.connect(self._on_thumb); w.done.connect(th.quit); w.done.connect(w.deleteLater); th.finished.connect(th.deleteLater); th.start()
+        # fetched and decoded to 64x64 on the shared thumbnail pool (services.thumbnails);
+        # only the QIcon is built here, on the UI thread
+        get_thumbnails().submit_image(url, lambda data, r=row, i=idx: self._thumb_ready.emit(r, i, data))
 
-    def _on_thumb(self, row, idx, icon):
-        if 0 <= row < len(self.jobs) and icon:
-            self.jobs[row]["thumb_icons"][idx]=icon; self._refresh_row(row, self.jobs[row])
+    def _on_thumb(self, row, idx, data):
+        if not data or not (0 <= row < len(self.jobs)): return
+        pix=QPixmap(); pix.loadFromData(QByteArray(data))
+        if pix.isNull(): return
+        self.jobs[row]["thumb_icons"][idx]=QIcon(pix); self._refresh_row(row, self.jobs[row])
 
     # Actions
     def _ensure_client(self):
@@ -552,25 +552,22 @@ class ProjectPanel(QWidget):
             self.btn_stop.setEnabled(True)
             QApplication.setOverrideCursor(Qt.WaitCursor)
             self.pb.setValue(0); self.pb_text.setText(f"Bắt đầu: {n} cảnh, {copies} video/cảnh")
-            self.console.info(f"Bắt đầu gửi tuần tự {n} cảnh; copies={copies}.")
+            self.console.info(f"Bắt đầu gửi {n} cảnh; copies={copies}.")
             self._t=QThread(self)
-            self._w=SeqWorker(self.client,self.jobs,model,aspect,copies,pid)
+            self._w=SeqWorker(self.client,self.jobs,model,aspect,copies,pid,slots=self.slot_pool,project=self.project_name)
             self._w.moveToThread(self._t)
             self._t.started.connect(self._w.run)
-            self._w.progress.connect(self._on_prog); self._w.row_update.connect(self._refresh_row)
+            self._w.progress.connect(self._on_prog); self._w.row_update.connect(self._on_row_update)
             self._w.log.connect(lambda lv,msg: getattr(self.console, lv.lower())(msg) if hasattr(self.console, lv.lower()) else self.console.info(msg))
             def on_finish(_):
-                self.console.info("Đã gửi xong theo tuần tự.")
+                self.console.info("Đã gửi xong.")
                 # PR#4: Disable stop button when done
                 self.btn_run.setEnabled(True); self.btn_run.setText("BẮT ĐẦU TẠO VIDEO")
                 self.btn_stop.setEnabled(False)
                 QApplication.restoreOverrideCursor()
                 self.pb_text.setText("Hoàn tất gửi.")
                 self._seq_running=False
-                # start auto-check (hidden) mỗi 10s
-                if not self._timer:
-                    self._timer=QTimer(self); self._timer.setInterval(10000); self._timer.timeout.connect(self._check)
-                self._timer.start()
+                self._start_auto_check()
             # FIXED: Add missing .start()
             self._w.finished.connect(on_finish)
             self._w.finished.connect(self._t.quit)
@@ -596,7 +593,7 @@ class ProjectPanel(QWidget):
     def _check(self):
         if not getattr(self,"client",None) or not self.jobs: return
         self._t2=QThread(self); self._w2=CheckWorker(self.client,self.jobs); self._w2.moveToThread(self._t2)
-        self._t2.started.connect(self._w2.run); self._w2.progress.connect(self._on_prog); self._w2.row_update.connect(self._refresh_row)
+        self._t2.started.connect(self._w2.run); self._w2.progress.connect(self._on_prog); self._w2.row_update.connect(self._on_row_update)
         self._w2.log.connect(lambda lv,msg: getattr(self.console, lv.lower())(msg) if hasattr(self.console, lv.lower()) else self.console.info(msg))
         def on_finished():
             # auto-download về thư mục dự án/<Video>
@@ -612,9 +609,10 @@ class ProjectPanel(QWidget):
         self._t3=QThread(self)
         self._w3=DownloadWorker(self.jobs,outdir,only_missing=only_missing, expected_copies=int(self.sp_copies.value()), project_name=self.project_name, video_downloader=self.video_downloader)
         self._w3.moveToThread(self._t3)
-        self._t3.started.connect(self._w3.run); self._w3.progress.connect(self._on_prog); self._w3.row_update.connect(self._refresh_row)
+        self._t3.started.connect(self._w3.run); self._w3.progress.connect(self._on_prog); self._w3.row_update.connect(self._on_row_update)
         self._w3.log.connect(lambda lv,msg: getattr(self.console, lv.lower())(msg) if hasattr(self.console, lv.lower()) else self.console.info(msg))
         def on_done(ok, attempts, all_success):
+            if self.slot_pool is not None and ok: self.slot_pool.record_videos(self.project_name, ok)
             if all_success and self._all_downloaded():
                 # stop checking + phát tín hiệu hoàn tất dự án
                 if self._timer: self._timer.stop()
@@ -655,11 +653,13 @@ class ProjectPanel(QWidget):
         for r in rows:
             if 0 <= r < len(self.jobs):
                 self.table.removeRow(r)
-                self.jobs.pop(r, None)
+                job=self.jobs.pop(r)
+                self.journal.drop(str(job.get("scene_id", r)))
         self.console.info(f"Đã xóa {len(rows)} cảnh đã chọn.")
 
     def _delete_all_scenes(self):
         self.jobs.clear()
+        self.journal.reset()
         self.table.setRowCount(0)
         self.console.info("Đã xóa toàn bộ cảnh.")
 
@@ -684,9 +684,10 @@ class ProjectPanel(QWidget):
 
     def stop_processing(self):
         """PR#4: Stop all workers"""
-        if hasattr(self, '_seq_worker') and self._seq_worker:
-            # Signal worker to stop (if it supports it)
+        if self._seq_running and getattr(self, '_w', None) is not None:
+            # Signal the submission worker to stop picking up new scenes
             self.console.warn("[INFO] Đang dừng xử lý...")
+            self._w.should_stop = True
             self._seq_running = False
 
         self.btn_run.setEnabled(True)
@@ -1,13 +1,20 @@
 
 import json
 import os
+import queue
 import re
 import shutil
 import subprocess
+import time
 
 from PyQt5.QtCore import QObject, pyqtSignal
 
 from services.google.labs_flow_client import DEFAULT_PROJECT_ID, LabsFlowClient
+from services.download_pool import DownloadPool
+from services.job_journal import JobJournal
+from services.op_poller import get_poller
+from services.submit_batcher import SubmitBatcher
+from services.thumbnails import get_thumbnails
 from services.utils.video_downloader import VideoDownloader
 from utils import config as cfg
 
@@ -67,10 +74,10 @@ def extract_location_context(scene_data):
     """
     Extract location context from scene data.
     First tries scene.location field, then falls back to parsing screenplay text.
-    
+
     Args:
         scene_data: Scene dict with potential 'location' field or 'screenplay_vi' text
-    
+
     Returns:
         Formatted location context string or None
     """
@@ -78,7 +85,7 @@ def extract_location_context(scene_data):
     location = scene_data.get("location", "").strip()
     if location:
         return location
-    
+
     # Second try: parse scene header from screenplay text (if available)
     screenplay = scene_data.get("screenplay_vi", "") or scene_data.get("screenplay_tgt", "")
     if screenplay:
@@ -87,25 +94,25 @@ def extract_location_context(scene_data):
             int_ext = match.group(1).strip()  # INT. or EXT.
             location_name = match.group(2).strip()  # e.g., HẺM NHỎ
             time = match.group(3).strip()  # e.g., NGÀY
-            
+
             # Build descriptive context
             setting_type = "Interior" if "INT" in int_ext.upper() else "Exterior"
             # Check for daytime keywords
             time_upper = time.upper()
             is_daytime = any(keyword in time_upper for keyword in _DAYTIME_KEYWORDS)
             time_desc = "daytime" if is_daytime else "nighttime"
-            
+
             return f"{setting_type} setting: {location_name}, {time_desc} lighting"
-    
+
     return None
 
 def _build_setting_details(location_context):
     """
     Build setting_details string with optional location context.
-    
+
     Args:
         location_context: Optional location context string
-    
+
     Returns:
         Formatted setting_details string
     """
@@ -119,7 +126,7 @@ def build_prompt_json(scene_index:int, desc_vi:str, desc_tgt:str, lang_code:str,
     Strict prompt JSON schema:
     - objective/persona/constraints/assets/hard_locks/character_details/setting_details/key_action/camera_direction/audio/graphics/negatives/generation
     - bilingual localization (vi + target)
-    
+
     Part D: Now supports enhanced_bible (CharacterBible object) for detailed character consistency
     Part E: Now supports location_context for maintaining consistent backgrounds across scenes
     """
@@ -156,7 +163,7 @@ def build_prompt_json(scene_index:int, desc_vi:str, desc_tgt:str, lang_code:str,
     location_lock = "Keep to single coherent environment; no random background swaps."
     if location_context:
         location_lock = f"CRITICAL: All scenes must be in {location_context}. Do NOT change background, setting, or environment. Maintain exact location consistency across all scenes."
-    
+
     hard_locks = {
         "identity": "Keep the same face, body, and identity across scenes.",
         "wardrobe": "Outfit consistency is required. Do NOT change outfit, color, or add accessories without instruction.",
@@ -198,7 +205,7 @@ def build_prompt_json(scene_index:int, desc_vi:str, desc_tgt:str, lang_code:str,
         "pace": 1.0,
         "text": vo_text
     }
-    
+
     # Add voice prosody settings if provided
     if voice_settings:
         voiceover_config.update({
@@ -280,7 +287,7 @@ class _Worker(QObject):
             from services.llm_story_service import generate_script
         except Exception:
             from llm_story_service import generate_script
-        
+
         # Build voice config if provided
         voice_config = None
         if p.get("tts_provider") and p.get("voice_id"):
@@ -290,7 +297,7 @@ class _Worker(QObject):
                 voice_id=p["voice_id"],
                 language_code=p["out_lang_code"]
             )
-        
+
         # Generate script with voice and domain/topic settings
         data = generate_script(
             idea=p["idea"], 
@@ -343,25 +350,123 @@ class _Worker(QObject):
         self.log.emit("[INFO] Hoàn tất sinh kịch bản & lưu file.")
         self.story_done.emit(data, ctx)
 
-    def _download(self, url, dst_path):
+    def _make_thumb(self, video_path, out_dir, scene, copy, digest=None):
+        # batched ffmpeg runs with a per-digest cache (services.thumbnails); the digest comes
+        # from the download, so the video is not read again to hash it
         try:
-            self.video_downloader.download(url, dst_path)
-            return True
+            thumb = os.path.join(out_dir, f"thumb_c{scene}_v{copy}.jpg")
+            return get_thumbnails().video_thumb(video_path, dest=thumb, digest=digest)
         except Exception as e:
-            self.log.emit(f"[ERR] Download fail: {e}")
+            self.log.emit(f"[WARN] Tạo thumbnail lỗi: {e}")
+        return ""
+
+    def _apply_op_result(self, op_name, job_info, op_result, ctx):
+        """Update one card from a poller result; True while the operation is still running."""
+        card = job_info['card']
+        scene = card["scene"]
+        copy_num = card["copy"]
+        # status and URLs were already extracted from the raw response (services.op_extract,
+        # which reads operation.metadata.video.fifeUrl first)
+        summary = op_result.get('status', '')
+
+        if summary in ("COMPLETED", "DONE_NO_URL"):
+            video_url = (op_result.get('video_urls') or [''])[0]
+            if not video_url:
+                # Video marked successful but no URL - this is an error state
+                self.log.emit(f"[ERR] Scene {scene} Copy {copy_num}: No video URL in response")
+                card["status"] = "DONE_NO_URL"
+                self.job_card.emit(card)
+                return False
+            card["status"] = "READY"
+            card["url"] = video_url
+            self.log.emit(f"[SUCCESS] Scene {scene} Copy {copy_num}: Video ready!")
+            if ctx["auto_download"]:
+                self._download_ready(op_name, job_info, video_url, 0, ctx)
+            self.job_card.emit(card)
+            return False
+
+        if summary == "TIMEOUT":
+            card["status"] = "TIMEOUT"
+            err = op_result.get('error') or 'timed out'
+            self.log.emit(f"[WARN] Scene {scene} Copy {copy_num}: {err}")
+            self.job_card.emit(card)
+            return False
+
+        if summary == "FAILED":
+            card["status"] = "FAILED"
+            err = op_result.get('error')
+            self.log.emit(f"[ERR] Scene {scene} Copy {copy_num} FAILED"
+                          + (f": {err}" if err else ""))
+            self.job_card.emit(card)
             return False
 
-    def _make_thumb(self, video_path, out_dir, scene, copy):
+        # Still processing (PENDING, ACTIVE, or other states)
+        card["status"] = "PROCESSING"
+        self.job_card.emit(card)
+        return True
+
+    def _download_ready(self, op_name, job_info, video_url, attempts, ctx):
+        """Hand a finished video to the download pool; a full queue leaves it in
+        ctx['download_retry']."""
+        card = job_info['card']
+        retry = ctx["download_retry"]
+        fp = os.path.join(ctx["dir_videos"],
+                          f"{ctx['title']}_scene{card['scene']}_copy{card['copy']}.mp4")
+        if ctx["pool"].offer(op_name, video_url, fp):
+            retry.pop(op_name, None)
+            ctx["downloading"][op_name] = (attempts, video_url)
+            self.log.emit(f"[INFO] Downloading scene {card['scene']} copy {card['copy']}...")
+        else:
+            retry[op_name] = (attempts, time.time() + 0.5, video_url)
+
+    def _apply_download_event(self, event, op_name, value, job_info, ctx, max_download_retries=5):
+        """Update a card from a DownloadPool event (runs on this worker's thread)."""
+        card = job_info['card']
+        if event == "post":
+            if value:
+                card["thumb"] = value
+                self.job_card.emit(card)
+            return
+        attempts, video_url = ctx["downloading"].pop(op_name, (0, card.get("url", "")))
+        if event == "downloaded":
+            card["status"] = "DOWNLOADED"
+            card["path"] = value
+            self.log.emit(f"[SUCCESS] ✓ Downloaded: {os.path.basename(value)}")
+            self.job_card.emit(card)
+            return
+        card["status"] = "DOWNLOAD_FAILED"
+        card["url"] = video_url
+        if attempts < max_download_retries:
+            ctx["download_retry"][op_name] = (attempts + 1, time.time() + 5, video_url)
+            self.log.emit(f"[WARN] Download failed: {value}, "
+                          f"will retry ({attempts + 1}/{max_download_retries})")
+        else:
+            self.log.emit(f"[ERR] Download failed after {max_download_retries} attempts: "
+                          f"{value}")
+        self.job_card.emit(card)
+
+    def _drain_downloads(self, by_op, ctx):
+        while True:
+            try:
+                event, op_name, value = ctx["pool"].events.get_nowait()
+            except queue.Empty:
+                return
+            self._apply_download_event(event, op_name, value, by_op[op_name], ctx)
+            self._journal_card(ctx, op_name, by_op[op_name])
+
+    def _journal_card(self, ctx, op_name, job_info):
+        """Append the card's current state to the project journal (crash-safe resume)."""
+        card = job_info['card']
+        body = job_info['body']
         try:
-            os.makedirs(out_dir, exist_ok=True)
-            thumb = os.path.join(out_dir, f"thumb_c{scene}_v{copy}.jpg")
-            if shutil.which("ffmpeg"):
-                cmd=["ffmpeg","-y","-ss","00:00:00","-i",video_path,"-frames:v","1","-q:v","3",thumb]
-                subprocess.run(cmd, check=True)
-                return thumb
+            ctx["journal"].record(f"{card['scene']}:{card['copy']}", {
+                "op": op_name, "scene": card["scene"], "copy": card["copy"], "prompt": card["json"],
+                "status": card["status"], "url": card.get("url", ""), "path": card.get("path", ""),
+                "model_key": body.get("model_key") or body.get("model"),
+                "aspect": body.get("aspect") or body.get("aspect_ratio"),
+                "submitted_at": body.get("submitted_at")})
         except Exception as e:
-            self.log.emit(f"[WARN] Tạo thumbnail lỗi: {e}")
-        return ""
+            self.log.emit(f"[WARN] Không ghi được nhật ký công việc: {e}")
 
     def _run_video(self):
         p = self.payload
@@ -376,38 +481,69 @@ class _Worker(QObject):
         quality = p.get("quality", "1080p")  # Get quality setting
         auto_download = p.get("auto_download", True)  # Get auto-download setting
         thumbs_dir = os.path.join(dir_videos, "thumbs")
+        # operations submitted by an earlier (crashed/closed) run of this project are re-attached
+        project_dir = os.path.dirname(dir_videos.rstrip(os.sep)) or dir_videos
+        journal = JobJournal.for_project(project_dir)
+        resumable = journal.pending()
 
         jobs = []
-        # PR#5: Batch generation - make one call per scene with copies parameter (not N calls)
+        fresh = []  # (scene_idx, scene, body) still to start
+        # PR#5: Batch generation - one request per scene with copies parameter (not N calls),
+        # and scenes with the same model/aspect share requests (services.submit_batcher)
         for scene_idx, scene in enumerate(p["scenes"], start=1):
-            ratio = scene["aspect"]
-            model_key = p.get("model_key","")
-
-            # Single API call with copies parameter (instead of N calls)
-            body = {"prompt": scene["prompt"], "copies": copies, "model": model_key, "aspect_ratio": ratio}
-            self.log.emit(f"[INFO] Start scene {scene_idx} with {copies} copies in one batch…")
-            rc = client.start_one(body, model_key, ratio, scene["prompt"], copies=copies, project_id=project_id)
-
+            saved = sorted((j for k, j in resumable.items()
+                            if k.startswith(f"{scene_idx}:")
+                            and j.get("prompt") == scene["prompt"]),
+                           key=lambda j: j.get("copy", 0))
+            if saved:
+                self.log.emit(f"[INFO] Scene {scene_idx}: tiếp tục {len(saved)} video đã gửi "
+                              f"trước đó (không gửi lại).")
+                for s_job in saved:
+                    body = {"operation_names": [s_job["op"]], "model_key": s_job.get("model_key"),
+                            "aspect": s_job.get("aspect"),
+                            "submitted_at": s_job.get("submitted_at")}
+                    card = {"scene": scene_idx, "copy": s_job.get("copy", 1),
+                            "status": s_job.get("status") or "PROCESSING",
+                            "json": scene["prompt"], "url": s_job.get("url", ""),
+                            "path": s_job.get("path", ""), "thumb": "", "dir": dir_videos}
+                    self.job_card.emit(card)
+                    jobs.append({'card': card, 'body': body, 'scene': scene_idx,
+                                 'copy': card["copy"], 'op': s_job["op"]})
+                continue
+            body = {"prompt": scene["prompt"], "copies": copies, "model": p.get("model_key", ""),
+                    "aspect_ratio": scene["aspect"]}
+            fresh.append((scene_idx, scene, body))
+
+        if fresh:
+            self.log.emit(f"[INFO] Start {len(fresh)} scene(s) with {copies} copies each…")
+        counts = SubmitBatcher(client).start_many(
+            [{"job": body, "model": body["model"], "aspect": body["aspect_ratio"],
+              "prompt": scene["prompt"], "copies": copies, "project_id": project_id}
+             for _, scene, body in fresh])
+        for (scene_idx, scene, body), rc in zip(fresh, counts):
             if rc > 0:
                 # Only create cards for operations that actually exist in the API response
-                # The body dict is updated by client.start_one() with operation_names list
+                # The body dict is updated by start_one()/the batcher with operation_names list
                 actual_count = len(body.get("operation_names", []))
-                
+
                 if actual_count < copies:
-                    self.log.emit(f"[WARN] Scene {scene_idx}: API returned {actual_count} operations but {copies} copies were requested")
-                
+                    self.log.emit(f"[WARN] Scene {scene_idx}: API returned {actual_count} "
+                                  f"operations but {copies} copies were requested")
+
                 # Create cards only for videos that actually exist
                 for copy_idx in range(1, actual_count + 1):
                     card={"scene":scene_idx,"copy":copy_idx,"status":"PROCESSING","json":scene["prompt"],"url":"","path":"","thumb":"","dir":dir_videos}
                     self.job_card.emit(card)
 
                     # Store card data with copy index for operation name mapping
-                    # copy_idx is 1-based, so we'll use copy_idx-1 to index into operation_names (0-based)
+                    # copy_idx is 1-based, so we'll use copy_idx-1 to index into
+                    # operation_names (0-based)
                     job_info = {
                         'card': card,
                         'body': body,
                         'scene': scene_idx,
-                        'copy': copy_idx  # 1-based index
+                        'copy': copy_idx,  # 1-based index
+                        'op': body["operation_names"][copy_idx - 1]
                     }
                     jobs.append(job_info)
             else:
@@ -416,171 +552,79 @@ class _Worker(QObject):
                     card={"scene":scene_idx,"copy":copy_idx,"status":"FAILED_START","json":scene["prompt"],"url":"","path":"","thumb":"","dir":dir_videos}
                     self.job_card.emit(card)
 
-        # polling with improved error handling
-        retry_count = {}  # Track retry attempts per operation
-        download_retry_count = {}  # Track download retry attempts
-        max_retries = 3
-        max_download_retries = 5
-
-        for poll_round in range(120):
-            # PR#4: Check stop flag
-            if self.should_stop:
-                self.log.emit("[INFO] Đã dừng xử lý theo yêu cầu người dùng.")
-                break
-
-            if not jobs:
-                self.log.emit("[INFO] Tất cả video đã hoàn tất hoặc thất bại.")
-                break
-
-            # Extract all operation names from all jobs
-            names = []
-            for job_info in jobs:
-                job_dict = job_info['body']
-                names.extend(job_dict.get("operation_names", []))
-
-            # Batch check with error handling
-            try:
-                rs = client.batch_check_operations(names)
-            except Exception as e:
-                self.log.emit(f"[WARN] Lỗi kiểm tra trạng thái (vòng {poll_round + 1}): {e}")
-                import time
-                time.sleep(10)  # Wait longer on error before retry
-                continue
-
-            new_jobs=[]
-            for job_info in jobs:
+        # polling: status checks are merged with every other panel's by the shared poller
+        by_op = {}
+        for job_info in jobs:
+            op_names = job_info['body'].get("operation_names", [])
+            op_index = job_info['copy'] - 1  # copy is 1-based, operation_names is 0-based
+            if job_info.get('op'):
+                by_op[job_info['op']] = job_info
+            elif op_index < len(op_names):
+                by_op[op_names[op_index]] = job_info
+            else:
                 card = job_info['card']
-                job_dict = job_info['body']
-                copy_idx = job_info['copy']  # 1-based copy index
-                
-                # Get operation names list and map this copy to its operation
-                op_names = job_dict.get("operation_names", [])
-                if not op_names:
-                    # No operation name - keep in queue for one more iteration in case it appears
-                    # Initialize skip counter if not present
-                    if 'no_op_count' not in job_info:
-                        job_info['no_op_count'] = 0
-                    job_info['no_op_count'] += 1
-                    
-                    # Only skip after multiple attempts
-                    if job_info['no_op_count'] > 3:
-                        sc = card['scene']
-                        cp = card['copy']
-                        self.log.emit(f"[WARN] Cảnh {sc} video {cp}: không có operation name sau 3 lần thử")
-                    else:
-                        new_jobs.append(job_info)
-                    continue
-
-                # Map copy index to the correct operation name (copy_idx is 1-based, array is 0-based)
-                op_index = copy_idx - 1
-                if op_index >= len(op_names):
-                    # This copy's operation doesn't exist - should not happen due to earlier check
-                    sc = card['scene']
-                    cp = card['copy']
-                    self.log.emit(f"[ERR] Cảnh {sc} video {cp}: operation index {op_index} out of bounds (only {len(op_names)} operations)")
-                    card["status"] = "FAILED"
-                    self.job_card.emit(card)
-                    continue
-                
-                op_name = op_names[op_index]
-                op_result = rs.get(op_name) or {}
-                
-                # VEO3 WORKING STRUCTURE: Check raw API response
-                raw_response = op_result.get('raw', {})
-                status = raw_response.get('status', '')
-                
-                scene = card["scene"]
-                copy_num = card["copy"]
-
-                if status == 'MEDIA_GENERATION_STATUS_SUCCESSFUL':
-                    # Extract video URL from correct path
-                    op_metadata = raw_response.get('operation', {}).get('metadata', {})
-                    video_info = op_metadata.get('video', {})
-                    video_url = video_info.get('fifeUrl', '')
-                    
-                    if video_url:
-                        card["status"] = "READY"
-                        card["url"] = video_url
-                        
-                        self.log.emit(f"[SUCCESS] Scene {scene} Copy {copy_num}: Video ready!")
-                        
-                        # Download logic
-                        if auto_download:
-                            fn = f"{title}_scene{scene}_copy{copy_num}.mp4"
-                            fp = os.path.join(dir_videos, fn)
-                            
-                            self.log.emit(f"[INFO] Downloading scene {scene} copy {copy_num}...")
-                            
-                            try:
-                                if self._download(video_url, fp):
-                                    card["status"] = "DOWNLOADED"
-                                    card["path"] = fp
-                                    
-                                    thumb = self._make_thumb(fp, thumbs_dir, scene, copy_num)
-                                    card["thumb"] = thumb
-                                    
-                                    self.log.emit(f"[SUCCESS] ✓ Downloaded: {os.path.basename(fp)}")
-                                else:
-                                    # Track download retries
-                                    download_key = f"{scene}_{copy_num}"
-                                    retries = download_retry_count.get(download_key, 0)
-                                    if retries < max_download_retries:
-                                        download_retry_count[download_key] = retries + 1
-                                        self.log.emit(f"[WARN] Download failed, will retry ({retries + 1}/{max_download_retries})")
-                                        card["status"] = "DOWNLOAD_FAILED"
-                                        card["url"] = video_url
-                                        self.job_card.emit(card)
-                                        new_jobs.append(job_info)
-                                    else:
-                                        self.log.emit(f"[ERR] Download failed after {max_download_retries} attempts")
-                                        card["status"] = "DOWNLOAD_FAILED"
-                                        card["url"] = video_url
-                                        self.job_card.emit(card)
-                            except Exception as e:
-                                # Track download retries for exceptions
-                                download_key = f"{scene}_{copy_num}"
-                                retries = download_retry_count.get(download_key, 0)
-                                if retries < max_download_retries:
-                                    download_retry_count[download_key] = retries + 1
-                                    self.log.emit(f"[ERR] Download error: {e} - will retry ({retries + 1}/{max_download_retries})")
-                                    card["status"] = "DOWNLOAD_FAILED"
-                                    card["url"] = video_url
-                                    self.job_card.emit(card)
-                                    new_jobs.append(job_info)
-                                else:
-                                    self.log.emit(f"[ERR] Download error after {max_download_retries} attempts: {e}")
-                                    card["status"] = "DOWNLOAD_FAILED"
-                                    card["url"] = video_url
-                                    self.job_card.emit(card)
-                        
-                        self.job_card.emit(card)
-                    else:
-                        # Video marked successful but no URL - this is an error state
-                        self.log.emit(f"[ERR] Scene {scene} Copy {copy_num}: No video URL in response")
-                        card["status"] = "DONE_NO_URL"
-                        self.job_card.emit(card)
-                
-                elif status == 'MEDIA_GENERATION_STATUS_FAILED':
-                    card["status"] = "FAILED"
-                    self.log.emit(f"[ERR] Scene {scene} Copy {copy_num} FAILED")
-                    self.job_card.emit(card)
-                
-                else:
-                    # Still processing (PENDING, ACTIVE, or other states)
-                    card["status"] = "PROCESSING"
-                    self.job_card.emit(card)
-                    new_jobs.append(job_info)
-
-            jobs=new_jobs
-
-            if jobs:
-                poll_info = f"vòng {poll_round + 1}/120"
-                self.log.emit(f"[INFO] Đang chờ {len(jobs)} video ({poll_info})...")
+                self.log.emit(f"[ERR] Cảnh {card['scene']} video {card['copy']}: operation index "
+                              f"{op_index} out of bounds (only {len(op_names)} operations)")
+                card["status"] = "FAILED"
+                self.job_card.emit(card)
+
+        results = queue.Queue()
+        poller = get_poller()
+        for op_name, job_info in by_op.items():
+            # per-op model/aspect/submit time let the poller predict when each render is due
+            body = job_info['body']
+            poller.register(client, [op_name], queue=results,
+                            model=body.get("model_key") or body.get("model"),
+                            aspect=body.get("aspect") or body.get("aspect_ratio"),
+                            submitted_at=body.get("submitted_at"))
+        pending = dict(by_op)
+        download_retry = {}  # op_name -> (attempts, next_try_at, video_url): failed / queue full
+        downloading = {}     # op_name -> (attempts, video_url): accepted by the download pool
+        # downloads and thumbnails run on their own threads so a slow file never delays polling
+        # of the other scenes; results come back as pool.events and are applied below
+        # (one post thread per batch slot, so finished videos share ffmpeg runs)
+        def make_thumb(op, fp, downloaded):
+            _, digest = downloaded  # download_file -> (size, digest)
+            return self._make_thumb(fp, thumbs_dir, by_op[op]['scene'], by_op[op]['copy'], digest)
+
+        pool = DownloadPool(self.video_downloader.download_file, post=make_thumb,
+                            post_workers=get_thumbnails().batch)
+        ctx = {"title": title, "dir_videos": dir_videos, "thumbs_dir": thumbs_dir,
+               "auto_download": auto_download, "download_retry": download_retry,
+               "downloading": downloading, "pool": pool, "journal": journal}
+        for op_name, job_info in by_op.items():
+            self._journal_card(ctx, op_name, job_info)
+        last_note = time.time()
+        try:
+            while pending or download_retry or pool.busy():
+                # PR#4: Check stop flag
+                if self.should_stop:
+                    self.log.emit("[INFO] Đã dừng xử lý theo yêu cầu người dùng.")
+                    break
+                self._drain_downloads(by_op, ctx)
+                now = time.time()
+                for op_name, (attempts, due, url) in list(download_retry.items()):
+                    if now >= due:
+                        self._download_ready(op_name, by_op[op_name], url, attempts, ctx)
                 try:
-                    import time
-                    time.sleep(5)
-                except Exception:
-                    pass
+                    op_name, op_result = results.get(timeout=0.25 if pool.busy() else 1.0)
+                except queue.Empty:
+                    op_name = None
+                job_info = pending.get(op_name) if op_name else None
+                if job_info is not None:
+                    if not self._apply_op_result(op_name, job_info, op_result, ctx):
+                        pending.pop(op_name, None)
+                    self._journal_card(ctx, op_name, job_info)
+                if pending and time.time() - last_note >= 15:
+                    last_note = time.time()
+                    self.log.emit(f"[INFO] Đang chờ {len(pending)} video...")
+            self._drain_downloads(by_op, ctx)
+            if not pending and not download_retry and not pool.busy():
+                self.log.emit("[INFO] Tất cả video đã hoàn tất hoặc thất bại.")
+        finally:
+            poller.unregister(list(by_op), queue=results)
+            pool.close(wait=not self.should_stop, cancel=self.should_stop)
+        jobs = list(by_op.values())
 
         # 4K upscale
 
@@ -9,7 +9,6 @@ import os
 import platform
 import shutil
 import subprocess
-import time
 from pathlib import Path
 
 from PyQt5.QtCore import Qt, QThread, pyqtSignal
@@ -56,9 +55,6 @@ FONT_INPUT.setPixelSize(12)
 THUMBNAIL_SIZE = 72
 MODEL_IMG = 128
 
-# Rate limiting
-RATE_LIMIT_DELAY_SEC = 10.0  # Delay between image generation requests to avoid 429 errors
-
 
 class SceneCardWidget(QFrame):
     """Scene card widget with image preview and action buttons"""
@@ -244,14 +240,6 @@ class ImageGenerationWorker(QThread):
                 if self.should_stop:
                     break
 
-                # CRITICAL FIX: Add mandatory delay BEFORE every request (except first)
-                # This prevents rate limiting regardless of which key is used
-                if i > 0:
-                    self.progress.emit(
-                        f"[RATE LIMIT] Chờ {RATE_LIMIT_DELAY_SEC}s trước khi tạo ảnh cảnh {scene.get('index')}..."
-                    )
-                    time.sleep(RATE_LIMIT_DELAY_SEC)
-
                 self.progress.emit(f"Tạo ảnh cảnh {scene.get('index')}...")
 
                 # Get prompt
@@ -298,6 +286,7 @@ class ImageGenerationWorker(QThread):
                             aspect_ratio=aspect_ratio,
                             delay_before=0,
                             logger=lambda msg: self.progress.emit(msg),
+                            should_stop=lambda: self.should_stop,
                         )
 
                         if img_data_url:
@@ -325,13 +314,6 @@ class ImageGenerationWorker(QThread):
                 if self.should_stop:
                     break
 
-                # CRITICAL FIX: Delay before thumbnails too
-                # First thumbnail comes after all scene images, so always delay
-                self.progress.emit(
-                    f"[RATE LIMIT] Chờ {RATE_LIMIT_DELAY_SEC}s trước thumbnail {i+1}..."
-                )
-                time.sleep(RATE_LIMIT_DELAY_SEC)
-
                 self.progress.emit(f"Tạo thumbnail phiên bản {i+1}...")
 
                 prompt = version.get("thumbnail_prompt", "")
@@ -345,7 +327,8 @@ class ImageGenerationWorker(QThread):
                         model=model,
                         aspect_ratio=aspect_ratio,
                         delay_before=0,
-                        logger=lambda msg: self.progress.emit(msg)
+                        logger=lambda msg: self.progress.emit(msg),
+                        should_stop=lambda: self.should_stop,
                     )
 
                     if thumb_data_url:
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 import datetime
 
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, pyqtSignal
 from PyQt5.QtGui import QFont
 from PyQt5.QtWidgets import (
     QFileDialog,
@@ -43,6 +43,7 @@ def _mask(s:str)->str:
     return mask_sensitive_text((s or '').strip(), show_chars=8)
 
 class _KeyItem(QWidget):
+    checked = pyqtSignal(bool, str)  # emitted from a key-check pool thread, delivered queued
     def __init__(self, kind:str, key:str):
         super().__init__()
         self.kind=kind; self.key=(key or '').strip()
@@ -72,8 +73,20 @@ class _KeyItem(QWidget):
         self.btn_del.setToolTip('Xóa key này')
         h.addWidget(self.lb_key); h.addStretch(1); h.addWidget(self.btn_test); h.addWidget(self.lb_status); h.addWidget(self.btn_del)
         self.btn_test.clicked.connect(self._on_test)
+        self.checked.connect(self._show)
     def _on_test(self):
-        ok,msg=kcs.check(self.kind, self.key)
+        self.start_check(force=True)
+    def start_check(self, force:bool=False):
+        """Show the last-known result now; re-check in the background if forced or stale"""
+        checker=kcs.get_key_checker()
+        last=checker.cached(self.kind, self.key)
+        if force or not checker.is_fresh(last):
+            self.lb_status.setText('⏳ '+(last['msg'] if last else 'Đang kiểm tra...'))
+        checker.submit(self.kind, self.key, self._emit_checked, force=force)
+    def _emit_checked(self, ok:bool, msg:str):
+        try: self.checked.emit(ok, msg)
+        except RuntimeError: pass  # row deleted while the check was running
+    def _show(self, ok:bool, msg:str):
         self.lb_status.setText(('✓ ' if ok else '✗ ')+msg)
 
 class KeyList(QWidget):
@@ -134,6 +147,7 @@ class KeyList(QWidget):
         self.listw.setItemWidget(it, w); it.setSizeHint(w.sizeHint())
         def _del(): self.listw.takeItem(self.listw.row(it))
         w.btn_del.clicked.connect(_del)
+        w.start_check()  # cached state at once, background refresh when stale
     def _add_from_input(self):
         key=(self.ed_new.text() or '').strip()
         if key and key not in set(self.get_keys()):
@@ -150,6 +164,7 @@ class KeyList(QWidget):
                 if k not in cur: self._add_item(k); cur.add(k)
         except Exception: pass
     def _test_all(self):
+        # every row is queued at once; the checker runs them concurrently, capped per provider
         for i in range(self.listw.count()):
             w=self.listw.itemWidget(self.listw.item(i))
-            if w: w._on_test()
+            if w: w.start_check(force=True)
@@ -1,5 +1,5 @@
 
-import json, os
+import json, os, threading
 
 def _atomic_write_json(path, data):
     import json, os, tempfile
@@ -36,4 +36,36 @@ def save(cfg: dict)->dict:
         _atomic_write_json(CFG_PATH, cfg)
     except Exception:
         pass
+    with _CACHED_LOCK:
+        _CACHED["cfg"] = None
     return cfg
+
+# load() for hot paths that only read settings: re-read only when the file's mtime/size changed
+_CACHED = {"stamp": None, "cfg": None}
+_CACHED_LOCK = threading.Lock()
+
+def cached()->dict:
+    """The config as load() returns it, cached until the file changes (one stat per call).
+    The dict is shared: read it, never modify it."""
+    try:
+        st = os.stat(CFG_PATH)
+        stamp = (st.st_mtime_ns, st.st_size)
+    except OSError:
+        stamp = None
+    with _CACHED_LOCK:
+        if _CACHED["cfg"] is None or stamp != _CACHED["stamp"]:
+            _CACHED["cfg"] = load()
+            _CACHED["stamp"] = stamp
+        return _CACHED["cfg"]
+
+def knob(section: str, name: str, default=None, fallback: str = ""):
+    """Setting ``name`` of a dotted config section (e.g. "labs.download"), else of the
+    ``fallback`` section, else ``default``."""
+    cfg = cached()
+    for sec in (section, fallback):
+        d = cfg if sec else None
+        for part in (sec.split(".") if sec else ()):
+            d = d.get(part) if isinstance(d, dict) else None
+        if isinstance(d, dict) and d.get(name) is not None:
+            return d[name]
+    return default